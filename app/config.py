@@ -1,8 +1,11 @@
 import os
+import tempfile
 from pathlib import Path
 
 # הגדרות נתיבים
 BASE_BOOKS_PATH = os.getenv("BOOKS_PATH", "/home/wiki/pdf_render/output")
+# תיקיית הפלט של משימות ה-PDF (תיקייה לכל משימה)
+OUTPUT_PATH = os.getenv("OUTPUT_PATH", "/app/output")
 
 # הגדרות אפליקציה
 APP_NAME = "Wiki PDF Generator & Books Manager"
@@ -24,7 +27,141 @@ LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 # הגדרות קבצים
 ALLOWED_FILE_EXTENSIONS = [".pdf"]
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+# Cache-Control לקבצי הספרים שמוגשים להורדה ולתצוגה (גם עבור CDN)
+FILE_CACHE_MAX_AGE_SECONDS = int(os.getenv("FILE_CACHE_MAX_AGE_SECONDS", "3600"))
 
 # הגדרות פאגינציה
 DEFAULT_PAGE_SIZE = 20
-MAX_PAGE_SIZE = 100
\ No newline at end of file
+MAX_PAGE_SIZE = 100
+
+# הגדרות הורדת דפי ויקי
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "32"))
+FETCH_PER_HOST_LIMIT = int(os.getenv("FETCH_PER_HOST_LIMIT", "8"))
+
+# הגדרות רינדור
+# chapters - תהליך wkhtmltopdf נפרד לכל פרק ומיזוג; single - קריאה אחת לכל הספר
+RENDER_MODE = os.getenv("RENDER_MODE", "chapters")
+# מספר תהליכי wkhtmltopdf מקבילים בכל השרת (ברירת מחדל: מספר הליבות)
+RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", str(os.cpu_count() or 1)))
+# תקציב הזיכרון (בבתים) לקבצי PDF של פרקים שרונדרו וממתינים למיזוג, לכל משימה
+RENDER_MEMORY_BUDGET_BYTES = int(os.getenv("RENDER_MEMORY_BUDGET_BYTES", str(256 * 1024 * 1024)))  # 256MB
+# תיקיית עבודה לפרקים שמעבר לתקציב: tmpfs כשיש, כדי לא לכתוב לדיסק
+RENDER_SCRATCH_PATH = os.getenv(
+    "RENDER_SCRATCH_PATH", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+)
+# מנוע הרינדור של הפרקים: wkhtmltopdf (תהליך לכל פרק) או weasyprint (תהליכים חמים קבועים;
+# דורש התקנה של החבילה weasyprint, שאינה ב-requirements)
+RENDER_ENGINE = os.getenv("RENDER_ENGINE", "wkhtmltopdf")
+# נתיב wkhtmltopdf; ריק - חיפוש ב-PATH פעם אחת בעליית התהליך
+WKHTMLTOPDF_PATH = os.getenv("WKHTMLTOPDF_PATH", "")
+# מספר תהליכי הרינדור החמים, ומספר העבודות שאחריו תהליך מוחלף (כדי להגביל דליפות זיכרון)
+RENDERER_WORKERS = int(os.getenv("RENDERER_WORKERS", str(RENDER_POOL_SIZE)))
+RENDERER_MAX_JOBS = int(os.getenv("RENDERER_MAX_JOBS", "200"))
+
+# הגדרות זמנים וניסיונות חוזרים
+# זמן מקסימלי (בשניות) לבקשת HTTP לויקי
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "30"))
+# זמן מקסימלי (בשניות) לרינדור פרק; תהליך wkhtmltopdf שנתקע מעבר לזה נהרג
+RENDER_TIMEOUT_SECONDS = float(os.getenv("RENDER_TIMEOUT_SECONDS", "120"))
+# מספר הניסיונות הכולל לשגיאות זמניות (ניתוק, 5xx, קריסת wkhtmltopdf)
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "3"))
+# השהייה בסיסית ומקסימלית (בשניות) בין ניסיונות, עם jitter
+RETRY_BACKOFF_SECONDS = float(os.getenv("RETRY_BACKOFF_SECONDS", "1"))
+RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("RETRY_BACKOFF_MAX_SECONDS", "10"))
+
+# הגדרות מטמון פרקים
+CHAPTER_CACHE_ENABLED = os.getenv("CHAPTER_CACHE_ENABLED", "true").lower() == "true"
+CHAPTER_CACHE_PATH = os.getenv("CHAPTER_CACHE_PATH", "/app/cache/chapters")
+CHAPTER_CACHE_MAX_BYTES = int(os.getenv("CHAPTER_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))  # 2GB
+
+# הגדרות מסירת פרקים
+# כל פרק נשמר גם כקובץ נפרד בתיקיית chapters של המשימה, וזמין להורדה ברגע שהוא מוכן
+CHAPTER_DELIVERY_ENABLED = os.getenv("CHAPTER_DELIVERY_ENABLED", "true").lower() == "true"
+
+# הגדרות מטמון HTML (בדיקה מותנית מול הויקי)
+HTML_CACHE_ENABLED = os.getenv("HTML_CACHE_ENABLED", "true").lower() == "true"
+HTML_CACHE_PATH = os.getenv("HTML_CACHE_PATH", "/app/cache/html")
+# חלון זמן (בשניות) שבו דף מהמטמון מוגש בלי לפנות לויקי כלל
+HTML_CACHE_FRESH_SECONDS = int(os.getenv("HTML_CACHE_FRESH_SECONDS", "300"))
+
+# הגדרות מאגר הנכסים (תמונות וגיליונות סגנון) המקומי
+ASSET_STORE_ENABLED = os.getenv("ASSET_STORE_ENABLED", "true").lower() == "true"
+ASSET_STORE_PATH = os.getenv("ASSET_STORE_PATH", "/app/cache/assets")
+# כמה זמן (בשניות) כתובת נכס שהורדה נחשבת עדכנית לפני הורדה חוזרת
+ASSET_STORE_FRESH_SECONDS = int(os.getenv("ASSET_STORE_FRESH_SECONDS", str(24 * 60 * 60)))
+# זמן מקסימלי (בשניות) להורדת נכס, כדי ששרת תמונות איטי לא יעכב את הפרק
+ASSET_FETCH_TIMEOUT = float(os.getenv("ASSET_FETCH_TIMEOUT", "10"))
+ASSET_FETCH_CONCURRENCY = int(os.getenv("ASSET_FETCH_CONCURRENCY", "16"))
+# זמן מקסימלי (בשניות) להמתנה לנכס שפרק אחר מוריד (גיליון סגנון כולל את הקבצים שהוא מפנה אליהם)
+ASSET_WAIT_TIMEOUT = float(os.getenv("ASSET_WAIT_TIMEOUT", "60"))
+
+# הגדרות ניקוי ה-HTML לפני הרינדור
+HTML_PIPELINE_ENABLED = os.getenv("HTML_PIPELINE_ENABLED", "true").lower() == "true"
+# תגים שמוסרים מהדף (רשימה מופרדת בפסיקים)
+HTML_STRIP_TAGS = [tag.strip() for tag in os.getenv(
+    "HTML_STRIP_TAGS", "script,noscript,iframe,object,embed,audio,video"
+).split(",") if tag.strip()]
+# מחלקות CSS של רכיבים שלא שייכים לספר: תבניות ניווט, קישורי עריכה, תבניות תחזוקה
+HTML_STRIP_CLASSES = [name.strip() for name in os.getenv(
+    "HTML_STRIP_CLASSES",
+    "navbox,vertical-navbox,navbox-styles,mw-editsection,noprint,metadata,ambox,catlinks,mw-jump-link,printfooter"
+).split(",") if name.strip()]
+# הסרת רכיבים מוסתרים (style="display:none")
+HTML_STRIP_HIDDEN = os.getenv("HTML_STRIP_HIDDEN", "true").lower() == "true"
+# הסרת רשימות ההערות והפניות אליהן
+HTML_STRIP_REFERENCES = os.getenv("HTML_STRIP_REFERENCES", "false").lower() == "true"
+
+# הגדרות איחוד בקשות זהות
+# כמה זמן (בשניות) ספר שהושלם מוחזר לבקשה זהה במקום לרנדר מחדש
+COALESCE_TTL_SECONDS = int(os.getenv("COALESCE_TTL_SECONDS", "3600"))
+
+# הגדרות אחסון סטטוס המשימות
+# sqlite - קובץ משותף לכל ה-workers; memory - מילון בזיכרון של תהליך יחיד
+TASK_STORE_BACKEND = os.getenv("TASK_STORE_BACKEND", "sqlite")
+TASK_STORE_PATH = os.getenv("TASK_STORE_PATH", "/app/data/tasks.db")
+# WAL מחייב שכל התהליכים שפותחים את הקובץ ירוצו על אותו מחשב (זיכרון משותף, נעילות מקומיות).
+# כשהקובץ על אחסון רשת (NFS/SMB) ו-workers רצים על מחשבים אחרים, יש להגדיר DELETE
+TASK_STORE_JOURNAL_MODE = os.getenv("TASK_STORE_JOURNAL_MODE", "WAL").upper()
+TASK_TTL_SECONDS = int(os.getenv("TASK_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# הגדרות תור העבודות וה-workers
+# כשהתור פעיל, שרת ה-API רק מוסיף עבודות לתור ו-workers נפרדים (python -m app.worker) מריצים אותן.
+# כבוי כברירת מחדל, כדי ששרת uvicorn לבדו ירנדר בעצמו; docker-compose מפעיל אותו יחד עם שירות ה-worker
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED", "false").lower() == "true"
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "/app/data/queue")
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "100"))
+JOB_QUEUE_RETRY_AFTER_SECONDS = int(os.getenv("JOB_QUEUE_RETRY_AFTER_SECONDS", "30"))
+# עבודה שה-worker שלה לא שלח סימן חיים זמן כזה חוזרת לתור
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "1"))
+# מרווח (בשניות) שבו worker בודק אם המשימות שהוא מריץ בוטלו
+CANCEL_POLL_SECONDS = float(os.getenv("CANCEL_POLL_SECONDS", "2"))
+
+# הגדרות דיווח התקדמות
+# מרווח מינימלי (בשניות) בין כתיבות התקדמות של משימה לאחסון
+PROGRESS_FLUSH_SECONDS = float(os.getenv("PROGRESS_FLUSH_SECONDS", "0.5"))
+# זמן המתנה מקסימלי (בשניות) ל-long-poll בנתיב הסטטוס
+STATUS_MAX_WAIT_SECONDS = int(os.getenv("STATUS_MAX_WAIT_SECONDS", "60"))
+
+# הגדרות אופטימיזציה של הספר המאוחד
+# שיתוף גופנים, תמונות ו-XObjects זהים בין פרקים
+PDF_DEDUPLICATE = os.getenv("PDF_DEDUPLICATE", "true").lower() == "true"
+# דחיסת Flate של זרמים שלא נדחסו
+PDF_COMPRESS_STREAMS = os.getenv("PDF_COMPRESS_STREAMS", "true").lower() == "true"
+# כתיבת הספר בפורמט linearized (fast web view) עם qpdf, כדי שהדפדפן יציג את העמוד הראשון מיד.
+# ברירת המחדל לבקשות שלא ציינו linearize; אם qpdf לא מותקן השלב מדולג
+PDF_LINEARIZE = os.getenv("PDF_LINEARIZE", "true").lower() == "true"
+QPDF_PATH = os.getenv("QPDF_PATH", "qpdf")
+LINEARIZE_TIMEOUT_SECONDS = float(os.getenv("LINEARIZE_TIMEOUT_SECONDS", "300"))
+
+# הגדרות מדדים (/metrics)
+# תיקייה משותפת שבה כל תהליך (שרת API או worker) כותב את המדדים שלו; ריק - מדדי התהליך בלבד
+METRICS_PATH = os.getenv("METRICS_PATH", "/app/data/metrics")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "10"))
+
+# הגדרות פרופיילינג של משימות
+# פרק שהעבודה עליו (הורדה, ניקוי, רינדור, מיזוג) ארכה יותר מזה מופיע בסיכום הפרקים האיטיים בלוג
+SLOW_CHAPTER_SECONDS = float(os.getenv("SLOW_CHAPTER_SECONDS", "30"))
+# תיקיית קובצי ה-cProfile של משימות שביקשו profile
+PROFILE_PATH = os.getenv("PROFILE_PATH", "/app/data/profiles")
@@ -1,19 +1,21 @@
+import time
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import os
 from app.routers import pdf
 from app.routers import books 
+from app.services.metrics import REGISTRY, HTTP_REQUEST_SECONDS
 
-from .config import APP_NAME, APP_VERSION, APP_DESCRIPTION, ALLOWED_ORIGINS, LOG_LEVEL, LOG_FORMAT
+from .config import APP_NAME, APP_VERSION, APP_DESCRIPTION, ALLOWED_ORIGINS, LOG_LEVEL, LOG_FORMAT, OUTPUT_PATH
 
 # הגדרת logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # יצירת תיקיית פלט אם לא קיימת
-os.makedirs('/app/output', exist_ok=True)
+os.makedirs(OUTPUT_PATH, exist_ok=True)
 
 app = FastAPI(
     title="Wiki to PDF API",
@@ -35,6 +37,36 @@ app.add_middleware(
 app.include_router(pdf.router)
 app.include_router(books.router)
 
+
+class RequestTimingMiddleware:
+    """מדידת זמן הבקשה (עד סוף התשובה) לכל נתיב. middleware של ASGI ולא BaseHTTPMiddleware,
+    כדי לא להוסיף תקורה לתשובות בזרימה (קבצים, SSE, ZIP)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+
+        async def send_and_time(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                # התבנית של הנתיב ולא הכתובת עצמה, כדי שמספר הסדרות יישאר קטן
+                route = scope.get("route")
+                if route is not None:
+                    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                                 route=route.path, method=scope["method"])
+
+        await self.app(scope, receive, send_and_time)
+
+
+app.add_middleware(RequestTimingMiddleware)
+# המדדים של התהליך נכתבים לתיקייה המשותפת, כדי שכל תהליכי ה-API יציגו את כולם
+REGISTRY.start_flusher()
+
 @app.get("/")
 def read_root():
     return {
@@ -43,11 +75,14 @@ def read_root():
         "endpoints": {
             "generate_pdf": "/api/pdf/generate",
             "check_status": "/api/pdf/status/{task_id}",
+            "status_events": "/api/pdf/status/{task_id}/events",
             "download_pdf": "/api/pdf/download/{task_id}/{filename}",
+            "task_profile": "/api/pdf/tasks/{task_id}/profile",
             "books_list": "/api/books/",
             "books_folders": "/api/books/folders",
             "books_search": "/api/books/search?q=query",
-            "books_health": "/api/books/health"
+            "books_health": "/api/books/health",
+            "metrics": "/metrics"
         }
     }
 
@@ -55,6 +90,11 @@ def read_root():
 def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """מדדים בפורמט Prometheus, של התהליך הזה ושל ה-workers"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # טיפול בשגיאות
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
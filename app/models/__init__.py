@@ -1,7 +1,10 @@
 # app/models/__init__.py
 
 # ייבוא מודלים של PDF (המודלים הקיימים שלך)
-from .pdf import PDFRequest, PDFResponse, PDFStatus
+from .pdf import (
+    PDFRequest, PDFResponse, PDFStatus, PDFProgress, ChapterFailure, PDFSizeReport, TocEntry,
+    PDFBatchRequest, PDFBatchResponse, PDFBatchStatus, ChapterFile, StageTiming, ChapterTiming, PDFProfile
+)
 
 # ייבוא מודלים של Books (המודלים החדשים)  
 from .books import BookInfo, BooksResponse, FolderInfo, FoldersResponse, SearchResponse
@@ -12,6 +15,17 @@ __all__ = [
     "PDFRequest", 
     "PDFResponse", 
     "PDFStatus",
+    "PDFProgress",
+    "ChapterFailure",
+    "PDFSizeReport",
+    "TocEntry",
+    "PDFBatchRequest",
+    "PDFBatchResponse",
+    "PDFBatchStatus",
+    "ChapterFile",
+    "StageTiming",
+    "ChapterTiming",
+    "PDFProfile",
     # Books models
     "BookInfo", 
     "BooksResponse", 
@@ -1,6 +1,6 @@
 # app/models.py
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
 class PDFRequest(BaseModel):
     """מודל לבקשת יצירת PDF"""
@@ -10,6 +10,14 @@ class PDFRequest(BaseModel):
                                      description="כותרת הספר")
     base_url: Optional[str] = Field("https://dev.hamichlol.org.il/w/rest.php/v1/page", 
                                    description="כתובת בסיס לערכי הויקי")
+    render_mode: Optional[Literal["chapters", "single"]] = Field(None,
+                                   description="מצב רינדור: chapters (פרק-פרק) או single (קריאה אחת לכל הספר). ברירת מחדל לפי הגדרות השרת")
+    strict: bool = Field(False,
+                         description="אם true, כל פרק שנכשל מכשיל את הספר כולו. אחרת הפרק מדולג ומופיע ב-failed_chapters")
+    linearize: Optional[bool] = Field(None,
+                                     description="כתיבת הספר בפורמט linearized (fast web view) לתצוגה מהירה בדפדפן. ברירת מחדל לפי הגדרות השרת")
+    profile: bool = Field(False,
+                          description="שמירת cProfile של המשימה, להורדה מנתיב הפרופיל שלה. בקשה כזו תמיד מריצה משימה חדשה")
 
 class PDFResponse(BaseModel):
     """מודל לתשובת יצירת PDF"""
@@ -19,6 +27,73 @@ class PDFResponse(BaseModel):
                        description="סטטוס המשימה")
     message: str = Field(..., 
                         description="הודעה למשתמש")
+    download_url: Optional[str] = Field(None, 
+                                      description="קישור להורדת הקובץ אם בקשה זהה כבר הושלמה")
+
+class ChapterFailure(BaseModel):
+    """פרק שנכשל במהלך יצירת הספר"""
+    title: str = Field(..., 
+                      description="שם הערך")
+    stage: str = Field(..., 
+                      description="השלב שבו נכשל: fetch או render")
+    error: str = Field(..., 
+                      description="תיאור השגיאה")
+
+class PDFProgress(BaseModel):
+    """התקדמות יצירת הספר ברמת הפרק"""
+    total: int = Field(..., 
+                      description="מספר הפרקים בספר")
+    fetched: int = Field(0, 
+                        description="פרקים שהורדו")
+    rendered: int = Field(0, 
+                         description="פרקים שרונדרו")
+    merged: int = Field(0, 
+                       description="פרקים שמוזגו לספר")
+    cached: int = Field(0, 
+                       description="פרקים שנלקחו מהמטמון")
+    html_bytes_removed: int = Field(0, 
+                                   description="בתים שהוסרו מה-HTML של הפרקים בניקוי לפני הרינדור")
+    failed: List[ChapterFailure] = Field(default_factory=list, 
+                                         description="פרקים שנכשלו")
+    elapsed_seconds: Optional[float] = Field(None, 
+                                            description="זמן שעבר מתחילת המשימה")
+    eta_seconds: Optional[float] = Field(None, 
+                                        description="הערכת זמן לסיום")
+
+class PDFSizeReport(BaseModel):
+    """גודל הספר לפני ואחרי שיתוף משאבים בין הפרקים"""
+    input_bytes: int = Field(..., 
+                            description="סך גודל קבצי הפרקים שמוזגו")
+    output_bytes: int = Field(..., 
+                             description="גודל הספר המאוחד")
+    deduplicated_objects: int = Field(0, 
+                                     description="גופנים, תמונות ואובייקטים זהים שנכתבו פעם אחת בלבד")
+    compressed_streams: int = Field(0, 
+                                   description="זרמים שנדחסו במהלך המיזוג")
+    linearized: bool = Field(False, 
+                            description="האם הספר נכתב בפורמט linearized (fast web view)")
+
+class TocEntry(BaseModel):
+    """פרק בספר המאוחד ומיקומו"""
+    title: str = Field(..., 
+                      description="שם הערך")
+    first_page: int = Field(..., 
+                           description="מספר העמוד הראשון של הפרק בספר")
+    page_count: int = Field(..., 
+                           description="מספר העמודים של הפרק")
+
+class ChapterFile(BaseModel):
+    """קובץ PDF של פרק בודד שמוכן להורדה"""
+    index: int = Field(..., 
+                      description="מספר הפרק בספר")
+    title: str = Field(..., 
+                      description="שם הערך")
+    filename: str = Field(..., 
+                         description="שם קובץ הפרק")
+    size: int = Field(..., 
+                     description="גודל הקובץ בבתים")
+    download_url: str = Field(..., 
+                             description="קישור להורדת הפרק")
 
 class PDFStatus(BaseModel):
     """מודל לסטטוס יצירת PDF"""
@@ -29,4 +104,85 @@ class PDFStatus(BaseModel):
     download_url: Optional[str] = Field(None, 
                                       description="קישור להורדת הקובץ אם מוכן")
     message: str = Field(..., 
-                        description="הודעה למשתמש")
\ No newline at end of file
+                        description="הודעה למשתמש")
+    progress: Optional[PDFProgress] = Field(None, 
+                                          description="התקדמות ברמת הפרק")
+    size_report: Optional[PDFSizeReport] = Field(None, 
+                                               description="גודל הספר לפני ואחרי האופטימיזציה")
+    table_of_contents: Optional[List[TocEntry]] = Field(None, 
+                                                       description="הפרקים שנכנסו לספר ומספרי העמודים שלהם")
+    failed_chapters: Optional[List[ChapterFailure]] = Field(None, 
+                                                          description="הפרקים שנכשלו ולא נכללו בספר")
+    chapters: Optional[List[ChapterFile]] = Field(None, 
+                                                 description="קבצי הפרקים שכבר מוכנים להורדה, עוד לפני שהספר כולו מוכן")
+class PDFBatchRequest(BaseModel):
+    """מודל לבקשת יצירה של כמה ספרים יחד, עם פרקים משותפים"""
+    books: List[PDFRequest] = Field(..., 
+                                    description="הספרים ליצירה. ערך שמופיע בכמה ספרים מורד ומרונדר פעם אחת")
+
+class PDFBatchResponse(BaseModel):
+    """מודל לתשובת יצירה של כמה ספרים"""
+    batch_id: str = Field(..., 
+                         description="מזהה האצווה")
+    status: str = Field(..., 
+                       description="סטטוס האצווה")
+    message: str = Field(..., 
+                        description="הודעה למשתמש")
+    books: List[PDFResponse] = Field(..., 
+                                     description="משימה לכל ספר, לפי סדר הבקשה")
+
+class PDFBatchStatus(BaseModel):
+    """מודל לסטטוס אצווה של ספרים"""
+    batch_id: str = Field(..., 
+                         description="מזהה האצווה")
+    status: str = Field(..., 
+                       description="סטטוס האצווה")
+    message: str = Field(..., 
+                        description="הודעה למשתמש")
+    unique_chapters: Optional[int] = Field(None, 
+                                          description="מספר הערכים השונים שהורדו ורונדרו עבור כל הספרים")
+    books: List[PDFStatus] = Field(..., 
+                                   description="הסטטוס של כל ספר, לפי סדר הבקשה")
+
+class StageTiming(BaseModel):
+    """זמן מצטבר של שלב בצנרת"""
+    seconds: float = Field(..., 
+                          description="זמן מצטבר בשניות (שלבים של פרקים רצים במקביל)")
+    count: int = Field(..., 
+                      description="מספר הפעמים שהשלב רץ")
+
+class ChapterTiming(BaseModel):
+    """ציר הזמן של פרק בספר"""
+    title: str = Field(..., 
+                      description="שם הערך")
+    stages: Dict[str, float] = Field(default_factory=dict, 
+                                     description="זמן בשניות לכל שלב: fetch, sanitize, assets, cache, render, merge")
+    busy_seconds: float = Field(0, 
+                               description="סך זמן העבודה על הפרק, בלי ההמתנה בתור הרינדור")
+    start_seconds: Optional[float] = Field(None, 
+                                          description="תחילת השלב הראשון, בשניות מתחילת המשימה")
+    end_seconds: Optional[float] = Field(None, 
+                                        description="סוף השלב האחרון, בשניות מתחילת המשימה")
+    fetch_bytes: Optional[int] = Field(None, 
+                                      description="גודל ה-HTML שהורד")
+    pages: Optional[int] = Field(None, 
+                                description="מספר העמודים של הפרק בספר")
+    cached: bool = Field(False, 
+                        description="האם הפרק נלקח ממטמון הפרקים")
+
+class PDFProfile(BaseModel):
+    """פרופיל הביצועים של משימה"""
+    task_id: str = Field(..., 
+                        description="מזהה המשימה")
+    status: str = Field(..., 
+                       description="סטטוס המשימה")
+    stage_timings: Dict[str, StageTiming] = Field(default_factory=dict, 
+                                                  description="זמן מצטבר לכל שלב (של האצווה כולה, בספר שהוא חלק מאצווה)")
+    chapters: List[ChapterTiming] = Field(default_factory=list, 
+                                          description="ציר הזמן של הפרקים, לפי סדר הספר")
+    slow_chapter_seconds: float = Field(..., 
+                                       description="הסף לפרק איטי")
+    slow_chapters: List[ChapterTiming] = Field(default_factory=list, 
+                                               description="הפרקים שחרגו מהסף, מהאיטי ביותר")
+    cprofile_url: Optional[str] = Field(None, 
+                                       description="קישור לקובץ ה-cProfile, אם המשימה ביקשה profile")
@@ -1,14 +1,44 @@
 import pdfkit
 import os
+import shutil
 import tempfile
-from PyPDF2 import PdfMerger
 from datetime import datetime
 import uuid
+import json
+import time
+import hashlib
 from urllib.parse import quote
 import logging
-import urllib.request
+import io
 import asyncio
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import CancelledError, Future, wait
+from functools import partial
+from typing import Callable, List, Dict, Any, Optional, Tuple
+
+from .config import (
+    RENDER_MODE, CHAPTER_CACHE_ENABLED, COALESCE_TTL_SECONDS, ASSET_STORE_ENABLED,
+    HTML_PIPELINE_ENABLED, RENDER_SCRATCH_PATH, RENDER_TIMEOUT_SECONDS, PDF_LINEARIZE,
+    CHAPTER_DELIVERY_ENABLED, OUTPUT_PATH, SLOW_CHAPTER_SECONDS, PROFILE_PATH, ASSET_STORE_PATH,
+    JOB_STALE_SECONDS, CANCEL_POLL_SECONDS
+)
+from PyPDF2 import PdfReader
+
+from .services.wiki_fetcher import FetchCancelledError, get_fetcher
+from .services.asset_store import get_asset_store
+from .services.html_pipeline import HtmlPipeline
+from .services.render_pool import get_render_pool
+from .services.chapter_cache import ChapterCache, get_chapter_cache
+from .services.task_store import create_task_store
+from .services.task_progress import TaskProgress, ProgressFanout
+from .services.pdf_stream_writer import StreamingPdfWriter
+from .services.pdf_scratch import PdfScratch
+from .services.pdf_linearize import linearize_pdf
+from .services.wkhtmltopdf import RenderCancelledError, pdfkit_configuration, run_pdfkit
+from .services.renderers import get_renderer
+from .services.stage_timings import StageTimings, ChapterTimings, timed
+from .services.task_profiler import TaskProfiler, profiled
+from .services.metrics import TASKS, CACHE_REQUESTS, WRITTEN_BYTES
 
 # הגדרת logging
 logging.basicConfig(level=logging.INFO)
@@ -22,49 +52,333 @@ PDFKIT_OPTIONS = {
     'margin-right': '20mm',
     'margin-bottom': '15mm',
     'margin-left': '20mm',
+    # התמונות וגיליונות הסגנון מוגשים מקבצים מקומיים (ראו fetch_page_html). רק מאגר הנכסים
+    # נגיש, כדי שדף מאתר שהלקוח בחר לא יוכל לשלב בספר קבצים אחרים מהשרת
+    'allow': ASSET_STORE_PATH,
+    # דף שמגיע מהרשת לא מריץ קוד בזמן הרינדור
+    'disable-javascript': None,
+    # נכס שלא נטען לא מכשיל את כל הפרק
+    'load-error-handling': 'ignore',
+    'load-media-error-handling': 'ignore',
 }
 
-# מילון לשמירת סטטוס המשימות
-task_status = {}
+# הגדרות לדפי השער ותוכן העניינים
+PAGE_PDFKIT_OPTIONS = {'page-size': 'A4', 'encoding': 'UTF-8'}
+
+# קישורי תוכן העניינים לפרקים. בזמן המיזוג הם מוחלפים בקישורים פנימיים לעמוד הראשון של הפרק
+TOC_LINK_PREFIX = "http://pdf-toc.invalid/chapter/"
+# מספר הפעמים המקסימלי לרינדור תוכן העניינים, עד שמספר העמודים שלו מתייצב
+TOC_MAX_PASSES = 3
+
+# מצבי רינדור: קריאה נפרדת ל-wkhtmltopdf לכל פרק, או קריאה אחת לכל הספר
+RENDER_MODE_CHAPTERS = "chapters"
+RENDER_MODE_SINGLE = "single"
+
+class ChapterFailedError(Exception):
+    """פרק נכשל בספר שנדרש בו מצב strict"""
+
+class TaskCancelledError(Exception):
+    """המשימה בוטלה באמצע היצירה"""
+
+# אחסון סטטוס המשימות (משותף בין workers ותהליכים לפי ההגדרות)
+task_status = create_task_store()
+
+# ניקוי ה-HTML של הדפים לפני הרינדור
+html_pipeline = HtmlPipeline()
+
+# המשימות שרצות בתהליך הזה וההורדות שלהן, כדי שאפשר יהיה לבטל אותן
+_running_tasks: Dict[str, List[Future]] = {}
+_running_tasks_lock = threading.Lock()
+# מתי נבדק לאחרונה באחסון המשימות אם משימה שרצה כאן בוטלה (ראו check_cancelled)
+_cancel_checked_at: Dict[str, float] = {}
+
+def book_filename(book_title: str) -> str:
+    """שם קובץ הספר המאוחד"""
+    return f'{book_title.replace(" ", "_")}.pdf'
+
+def book_output_path(task_id: str, book_title: str) -> str:
+    """הנתיב של קובץ הספר המאוחד בתיקיית הפלט"""
+    return os.path.join(OUTPUT_PATH, task_id, book_filename(book_title))
+
+def chapters_output_dir(task_id: str) -> str:
+    """תיקיית קבצי הפרקים הבודדים של משימה"""
+    return os.path.join(OUTPUT_PATH, task_id, 'chapters')
+
+def chapter_filename(index: int, title: str) -> str:
+    """שם קובץ הפרק, עם מספר הפרק כדי לשמור על הסדר"""
+    safe_title = title.strip().replace(" ", "_").replace("/", "_")
+    return f"{index + 1:03d}_{safe_title}.pdf"
+
+def deliver_chapter(task_id: str, progress: TaskProgress, index: int, title: str, pdf_data: bytes) -> None:
+    """שמירת ה-PDF של פרק בתיקיית הפלט של המשימה ורישומו בסטטוס, כדי שאפשר יהיה
+    להוריד אותו לפני שכל הספר מוכן"""
+    chapters_dir = chapters_output_dir(task_id)
+    os.makedirs(chapters_dir, exist_ok=True)
+    filename = chapter_filename(index, title)
+    path = os.path.join(chapters_dir, filename)
+    temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(pdf_data)
+    os.replace(temp_path, path)
+    WRITTEN_BYTES.inc(len(pdf_data), kind="chapter")
+    progress.add_chapter({
+        "index": index + 1,
+        "title": title,
+        "filename": filename,
+        "size": len(pdf_data),
+        "download_url": f"/tasks/{task_id}/chapters/{quote(filename)}",
+    })
+
+def request_fingerprint(wiki_pages: List[str], book_title: str, base_url: str, render_mode: str,
+                        strict: bool = False, linearize: bool = PDF_LINEARIZE) -> str:
+    """טביעת אצבע של בקשה מנורמלת, לזיהוי בקשות זהות"""
+    normalized = {
+        "wiki_pages": [page.strip() for page in wiki_pages],
+        "book_title": (book_title or "").strip(),
+        "base_url": (base_url or "").strip().rstrip("/"),
+        "render_mode": render_mode,
+        "strict": strict,
+        "linearize": linearize,
+    }
+    raw = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def find_reusable_task(fingerprint: str) -> Optional[str]:
+    """מחזיר משימה קיימת לבקשה זהה: משימה שעדיין רצה, או ספר שהושלם לאחרונה וקובץ עדיין קיים.
+    משימה שלא עודכנה JOB_STALE_SECONDS כנראה נזנחה (למשל אחרי הפעלה מחדש של השרת) ולא מצטרפים אליה"""
+    task_id = task_status.get_fingerprint(fingerprint)
+    if task_id is None:
+        return None
+    
+    entry = task_status.get(task_id, {})
+    if entry.get("status") in ("queued", "processing"):
+        return task_id if time.time() - entry.get("updated_at", 0) < JOB_STALE_SECONDS else None
+    if (entry.get("status") == "completed"
+            and time.time() - entry.get("completed_at", 0) < COALESCE_TTL_SECONDS
+            and os.path.exists(entry.get("output_path", ""))):
+        return task_id
+    return None
+
+def cancel_task(task_id: str) -> bool:
+    """עצירת משימה שרצה בתהליך הזה: ביטול ההורדות והרינדורים שעוד לא התחילו
+    ועצירת תהליכי wkhtmltopdf שרצים. מחזיר False אם המשימה לא רצה כאן"""
+    with _running_tasks_lock:
+        fetch_futures = _running_tasks.get(task_id)
+        if fetch_futures is None:
+            return False
+        dropped = get_render_pool().cancel(task_id)
+        fetch_futures = list(fetch_futures)
+    dropped += sum(1 for future in fetch_futures if future.cancel())
+    terminated = get_renderer().cancel(task_id)
+    logger.info(f"Cancelled task {task_id}: {dropped} pending jobs dropped, {terminated} renders stopped")
+    return True
+
+def check_cancelled(task_id: str) -> None:
+    """זריקת TaskCancelledError אם המשימה בוטלה. ביטול שנרשם באחסון המשימות בתהליך אחר
+    (למשל worker אחר של uvicorn) נבדק לכל היותר פעם ב-CANCEL_POLL_SECONDS, ועוצר את המשימה כאן"""
+    render_pool = get_render_pool()
+    if not render_pool.is_cancelled(task_id):
+        now = time.monotonic()
+        with _running_tasks_lock:
+            last_checked = _cancel_checked_at.get(task_id)
+            due = task_id in _running_tasks and (last_checked is None or now - last_checked >= CANCEL_POLL_SECONDS)
+            if due:
+                _cancel_checked_at[task_id] = now
+        if due and is_task_cancelled(task_id):
+            logger.info(f"Task {task_id} was cancelled by another process")
+            cancel_task(task_id)
+    if render_pool.is_cancelled(task_id):
+        raise TaskCancelledError(f"Task {task_id} was cancelled")
+
+def is_task_cancelled(task_id: str) -> bool:
+    """האם המשימה סומנה כמבוטלת באחסון המשימות"""
+    return task_status.get(task_id, {}).get("status") == "cancelled"
+
+def register_task(task_id: str, fingerprint: str, queued: bool = False) -> None:
+    """רישום משימה חדשה כך שבקשות זהות יצטרפו אליה"""
+    if queued:
+        task_status[task_id] = {"status": "queued", "message": "המשימה ממתינה בתור"}
+    else:
+        task_status[task_id] = {"status": "processing", "message": "מתחיל בהמרה..."}
+    task_status.set_fingerprint(fingerprint, task_id)
 
 async def create_pdf_async(task_id: str, wiki_pages: List[str], 
                           book_title: str = "המכלול ערים", 
-                          base_url: str = "https://dev.hamichlol.org.il/w/rest.php/v1/page") -> None:
+                          base_url: str = "https://dev.hamichlol.org.il/w/rest.php/v1/page",
+                          render_mode: str = RENDER_MODE,
+                          strict: bool = False,
+                          linearize: bool = PDF_LINEARIZE,
+                          profile: bool = False) -> None:
     """יצירת PDF באופן אסינכרוני"""
+    # הפעלת המשימה בתהליכון נפרד
+    await asyncio.to_thread(
+        run_pdf_task,
+        task_id=task_id,
+        wiki_pages=wiki_pages,
+        book_title=book_title,
+        base_url=base_url,
+        render_mode=render_mode,
+        strict=strict,
+        linearize=linearize,
+        profile=profile
+    )
+
+def run_pdf_task(task_id: str, wiki_pages: List[str], 
+                 book_title: str = "המכלול ערים", 
+                 base_url: str = "https://dev.hamichlol.org.il/w/rest.php/v1/page",
+                 render_mode: str = RENDER_MODE,
+                 strict: bool = False,
+                 linearize: bool = PDF_LINEARIZE,
+                 profile: bool = False) -> None:
+    """הרצת משימת יצירת PDF ועדכון הסטטוס שלה (בשרת ה-API או ב-worker).
+    profile שומר cProfile של המשימה בתיקיית הפרופילים"""
+    # משימה שבוטלה בזמן שחיכתה בתור. המעבר מותנה בסטטוס, כדי שביטול שמגיע באותו רגע לא יידרס
+    if task_status.transition(task_id, ("queued", "processing"), status="processing",
+                              message="מתחיל בהמרה...", book_title=book_title) is None:
+        logger.info(f"Skipping cancelled task {task_id}")
+        return
+    TASKS.inc(event="started")
+    profiler = TaskProfiler() if profile else None
     try:
-        task_status[task_id] = {"status": "processing", "message": "מתחיל בהמרה..."}
-        
-        # הפעלת הפונקציה המקורית בתהליך נפרד
-        result = await asyncio.to_thread(
-            convert_urls_to_pdfs,
+        result = profiled(profiler, convert_urls_to_pdfs)(
             task_id=task_id,
             wiki_pages=wiki_pages,
             book_title=book_title,
-            base_url=base_url
+            base_url=base_url,
+            render_mode=render_mode,
+            strict=strict,
+            linearize=linearize,
+            profiler=profiler
         )
-        
-        if result:
-            # עדכון הסטטוס להצלחה
-            filename = f'{book_title.replace(" ", "_")}.pdf'
-            download_url = f"/download/{task_id}/{filename}"
-            task_status[task_id] = {
-                "status": "completed", 
-                "message": "ההמרה הושלמה בהצלחה",
-                "download_url": download_url
-            }
-        else:
-            # עדכון הסטטוס לכישלון
-            task_status[task_id] = {
-                "status": "failed", 
-                "message": "אירעה שגיאה במהלך ההמרה"
-            }
+        if profiler is not None:
+            save_profile(profiler, task_id, [task_id])
+        finish_task(task_id, book_title, result)
             
     except Exception as e:
         logger.error(f"Error in task {task_id}: {str(e)}")
-        task_status[task_id] = {
-            "status": "failed", 
-            "message": f"אירעה שגיאה: {str(e)}"
+        if task_status.transition(task_id, ("queued", "processing"),
+                                  status="failed", message=f"אירעה שגיאה: {str(e)}") is not None:
+            TASKS.inc(event="failed")
+
+def register_batch(batch_id: str, books: List[Dict[str, Any]], queued: bool = False) -> None:
+    """רישום אצווה ומשימה לכל אחד מהספרים שלה"""
+    status, message = ("queued", "המשימה ממתינה בתור") if queued else ("processing", "מתחיל בהמרה...")
+    for book in books:
+        task_status[book["task_id"]] = {
+            "status": status, "message": message, "batch_id": batch_id, "book_title": book["book_title"]
         }
+    task_status[batch_id] = {
+        "kind": "batch",
+        "status": status,
+        "message": message,
+        "books": [book["task_id"] for book in books],
+    }
+
+async def create_pdf_batch_async(batch_id: str, books: List[Dict[str, Any]]) -> None:
+    """יצירת אצוות ספרים באופן אסינכרוני"""
+    await asyncio.to_thread(run_pdf_batch, batch_id=batch_id, books=books)
+
+def run_pdf_batch(batch_id: str, books: List[Dict[str, Any]]) -> None:
+    """הרצת אצוות ספרים ועדכון הסטטוס של כל ספר ושל האצווה (בשרת ה-API או ב-worker).
+    כל ספר הוא מילון עם task_id, wiki_pages, book_title, base_url, strict, linearize ו-profile.
+    הפרקים משותפים, ולכן אם ספר אחד ביקש profile - כל האצווה נמדדת"""
+    if task_status.transition(batch_id, ("queued", "processing"), status="processing",
+                              message="מתחיל בהמרה...") is None:
+        logger.info(f"Skipping cancelled batch {batch_id}")
+        return
+    try:
+        for book in books:
+            # ספר שבוטל לפני תחילת האצווה נשאר מבוטל
+            if task_status.transition(book["task_id"], ("queued", "processing"), status="processing",
+                                      message="מתחיל בהמרה...") is not None:
+                TASKS.inc(event="started")
+        
+        profiler = TaskProfiler() if any(book.get("profile") for book in books) else None
+        results = profiled(profiler, convert_batch_to_pdfs)(batch_id, books, profiler=profiler)
+        if profiler is not None:
+            save_profile(profiler, batch_id, [batch_id] + [book["task_id"] for book in books if book.get("profile")])
+        for book, result in zip(books, results):
+            finish_task(book["task_id"], book["book_title"], result)
+        
+        completed = sum(1 for result in results if result)
+        task_status.transition(
+            batch_id, ("queued", "processing"),
+            status="completed" if completed else "failed",
+            message=f"נוצרו {completed} מתוך {len(books)} ספרים",
+            completed_at=time.time()
+        )
+    
+    except Exception as e:
+        logger.error(f"Error in batch {batch_id}: {str(e)}")
+        if is_task_cancelled(batch_id):
+            return
+        for book in books:
+            if task_status.transition(book["task_id"], ("queued", "processing"),
+                                      status="failed", message=f"אירעה שגיאה: {str(e)}") is not None:
+                TASKS.inc(event="failed")
+        task_status.transition(batch_id, ("queued", "processing"),
+                               status="failed", message=f"אירעה שגיאה: {str(e)}")
+
+def finish_task(task_id: str, book_title: str, result: bool) -> None:
+    """עדכון הסטטוס הסופי של ספר לפי תוצאת היצירה.
+    המעבר מותנה בסטטוס, כדי שספר שבוטל (גם ברגע האחרון) יישאר מבוטל"""
+    failed_chapters = task_status.get(task_id, {}).get("failed_chapters") or []
+    
+    # עדכון חלקי, כדי לשמור את נתוני ההתקדמות של המשימה
+    if result:
+        # עדכון הסטטוס להצלחה
+        filename = book_filename(book_title)
+        download_url = f"/download/{task_id}/{filename}"
+        finished = task_status.transition(
+            task_id, ("queued", "processing"),
+            status="completed", 
+            message=(f"ההמרה הושלמה, {len(failed_chapters)} פרקים נכשלו ולא נכללו בספר"
+                     if failed_chapters else "ההמרה הושלמה בהצלחה"),
+            download_url=download_url,
+            output_path=book_output_path(task_id, book_title),
+            completed_at=time.time()
+        )
+    else:
+        # עדכון הסטטוס לכישלון
+        finished = task_status.transition(
+            task_id, ("queued", "processing"),
+            status="failed", 
+            message=(f"ההמרה נכשלה: {len(failed_chapters)} פרקים נכשלו"
+                     if failed_chapters else "אירעה שגיאה במהלך ההמרה")
+        )
+    if finished is None:
+        # הסטטוס והודעת הביטול כבר נכתבו בבקשת הביטול; ספר שבוטל לא משאיר קבצים
+        shutil.rmtree(os.path.join(OUTPUT_PATH, task_id), ignore_errors=True)
+        return
+    TASKS.inc(event="completed" if result else "failed")
+
+def save_profile(profiler: TaskProfiler, name: str, task_ids: List[str]) -> None:
+    """שמירת ה-cProfile של משימה ורישום הנתיב שלו במשימות שביקשו אותו"""
+    try:
+        path = profiler.dump(os.path.join(PROFILE_PATH, f"{name}.prof"))
+    except Exception as e:
+        logger.warning(f"Error saving profile of {name}: {str(e)}")
+        return
+    if path:
+        for task_id in task_ids:
+            task_status.update(task_id, profile_path=path)
+
+def log_slow_chapters(task_id: str, timeline: List[Dict[str, Any]],
+                      threshold: float = SLOW_CHAPTER_SECONDS, limit: int = 10) -> None:
+    """סיכום בלוג של הפרקים שהעבודה עליהם ארכה יותר מ-threshold שניות, מהאיטי ביותר"""
+    slow = sorted((chapter for chapter in timeline if chapter["busy_seconds"] >= threshold),
+                  key=lambda chapter: chapter["busy_seconds"], reverse=True)
+    if not slow:
+        return
+    details = "; ".join(
+        f"{chapter['title']} {chapter['busy_seconds']}s ("
+        + ", ".join(f"{stage} {seconds}s" for stage, seconds in chapter["stages"].items())
+        + (f", {chapter['fetch_bytes']} bytes" if "fetch_bytes" in chapter else "")
+        + (f", {chapter['pages']} pages" if "pages" in chapter else "")
+        + ")"
+        for chapter in slow[:limit]
+    )
+    logger.warning(f"Task {task_id}: {len(slow)} of {len(timeline)} chapters took over {threshold}s: {details}")
 
 def create_temp_directory(task_id: str) -> str:
     """יצירת תיקייה זמנית"""
@@ -73,8 +387,8 @@ def create_temp_directory(task_id: str) -> str:
     logger.info(f"Created temporary directory: {temp_dir}")
     return temp_dir
 
-def create_table_of_contents(pages: List[str], output_path: str) -> str:
-    """יצירת דף תוכן עניינים"""
+def build_table_of_contents_html(pages: List[str], page_numbers: Optional[List[int]] = None) -> str:
+    """בניית HTML של דף תוכן עניינים, עם מספרי עמודים וקישורים לפרקים אם הם ידועים"""
     html_content = """
     <!DOCTYPE html>
     <html>
@@ -102,6 +416,9 @@ def create_table_of_contents(pages: List[str], output_path: str) -> str:
                 text-decoration: none;
                 color: #333;
             }
+            .toc-page {
+                float: left;
+            }
         </style>
     </head>
     <body>
@@ -111,7 +428,13 @@ def create_table_of_contents(pages: List[str], output_path: str) -> str:
     
     # הוספת כל הערכים לתוכן העניינים
     for i, page in enumerate(pages):
-        html_content += f'        <div class="toc-item">{i+1}. {page}</div>\n'
+        if page_numbers is None:
+            html_content += f'        <div class="toc-item">{i+1}. {page}</div>\n'
+        else:
+            html_content += (
+                f'        <div class="toc-item"><a href="{TOC_LINK_PREFIX}{i}">'
+                f'<span class="toc-page">{page_numbers[i]}</span>{i+1}. {page}</a></div>\n'
+            )
     
     html_content += """
         </div>
@@ -119,87 +442,71 @@ def create_table_of_contents(pages: List[str], output_path: str) -> str:
     </html>
     """
     
-    temp_html = os.path.join(os.path.dirname(output_path), f"toc_{uuid.uuid4().hex[:8]}.html")
-    with open(temp_html, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    
-    pdfkit.from_file(temp_html, output_path, options={'page-size': 'A4', 'encoding': 'UTF-8'})
-    os.remove(temp_html)
-    
-    return output_path
+    return html_content
 
-def convert_page_with_header(url: str, output_path: str, title: str) -> bool:
-    """המרת דף עם כותרת משולבת"""
-    try:
-        logger.info(f"Starting conversion with embedded header for: {title}")
-        
-        # הורדת התוכן המקורי מהאתר
-        with urllib.request.urlopen(url) as response:
-            original_html = response.read().decode('utf-8')
-        
-        # יצירת כותרת שתהיה חלק מהדף
-        header_html = f"""
+def render_html_to_pdf(html_content: str, options: Dict[str, Any], description: str = "Render") -> bytes:
+    """רינדור HTML ל-PDF בזיכרון במנוע הרינדור שהוגדר (RENDER_ENGINE).
+    רינדור שנתקע נעצר אחרי RENDER_TIMEOUT_SECONDS"""
+    return get_renderer().render(html_content, options, description=description)
+
+def create_table_of_contents(pages: List[str], page_numbers: Optional[List[int]] = None) -> bytes:
+    """יצירת דף תוכן עניינים"""
+    html_content = build_table_of_contents_html(pages, page_numbers)
+    return render_html_to_pdf(html_content, PAGE_PDFKIT_OPTIONS)
+
+def fetch_page_html(url: str, timings: Optional[ChapterTimings] = None,
+                    task_id: Optional[str] = None, revalidate: bool = False) -> Tuple[str, int]:
+    """הורדת ה-HTML של דף, ניקוי שלו והפניית התמונות וגיליונות הסגנון לעותקים מקומיים.
+    אם task_id בוטלה בזמן ההמתנה לנכסים, נזרקת TaskCancelledError.
+    revalidate בודק את הדף מול הויקי גם בתוך חלון הרעננות של מטמון ה-HTML.
+    מחזיר את ה-HTML ואת מספר הבתים שהוסרו בניקוי"""
+    with timed(timings, "fetch"):
+        html = get_fetcher().fetch(url, revalidate)
+    if timings is not None:
+        timings.note(fetch_bytes=len(html.encode('utf-8')))
+    removed_bytes = 0
+    if HTML_PIPELINE_ENABLED:
+        # הניקוי לפני הורדת הנכסים, כדי לא להוריד תמונות של רכיבים שהוסרו
+        with timed(timings, "sanitize"):
+            html, stats = html_pipeline.slim(html)
+        removed_bytes = stats["input_bytes"] - stats["output_bytes"]
+        logger.info(
+            f"Slimmed {url}: {stats['input_bytes']} -> {stats['output_bytes']} bytes "
+            f"({stats['removed_elements']} elements removed)"
+        )
+    if ASSET_STORE_ENABLED:
+        with timed(timings, "assets"):
+            abort_check = (lambda: check_cancelled(task_id)) if task_id else None
+            html = get_asset_store().localize(html, url, abort_check)
+    return html, removed_bytes
+
+def build_chapter_html(original_html: str, title: str) -> str:
+    """שילוב כותרת הפרק בתוך ה-HTML של הדף"""
+    # יצירת כותרת שתהיה חלק מהדף
+    header_html = f"""
         <div style="direction: rtl; text-align: center; height: 25vh; padding-top: 5%; margin-bottom: 20px;">
             <h1 style="font-size: 24px; color: #333; margin-bottom: 10px;">{title}</h1>
             <div style="font-size: 16px; color: #666;">מתוך המכלול - האנציקלופדיה העברית</div>
         </div>
         """
-        
-        # זיהוי תג <body> ושילוב הכותרת אחריו
-        if "<body" in original_html:
-            body_index = original_html.find("<body")
-            closing_bracket_index = original_html.find(">", body_index)
-            modified_html = original_html[:closing_bracket_index+1] + header_html + original_html[closing_bracket_index+1:]
-        else:
-            # אם אין תג <body>, נוסיף את הכותרת בתחילת ה-HTML
-            modified_html = header_html + original_html
-        
-        # שמירת ה-HTML המעודכן לקובץ זמני
-        temp_html = os.path.join(os.path.dirname(output_path), f"temp_{uuid.uuid4().hex[:8]}.html")
-        with open(temp_html, 'w', encoding='utf-8') as f:
-            f.write(modified_html)
-        
-        # המרה ל-PDF
-        pdfkit.from_file(temp_html, output_path, options=PDFKIT_OPTIONS)
-        
-        # מחיקת קובץ ה-HTML הזמני
-        os.remove(temp_html)
-        
-        if os.path.exists(output_path):
-            size = os.path.getsize(output_path)
-            logger.info(f"Successfully created PDF: {output_path} (Size: {size} bytes)")
-            return True
-        else:
-            logger.error(f"Failed to create PDF: {output_path}")
-            return False
-            
-    except Exception as e:
-        logger.error(f"Error converting {title}: {str(e)}")
-        return False
+    
+    # שילוב הכותרת בתחילת ה-body (גם אם אין תג <body> במקור)
+    return html_pipeline.inject_header(original_html, header_html)
 
-def merge_pdfs(pdf_files: List[str], output_path: str) -> bool:
-    """מיזוג קבצי PDF"""
-    try:
-        merger = PdfMerger()
-        
-        # הוספת כל הקבצים
-        for pdf in pdf_files:
-            logger.info(f"Adding {pdf} to merged file")
-            merger.append(pdf)
-        
-        # שמירת הקובץ המאוחד
-        merger.write(output_path)
-        merger.close()
-        
-        logger.info(f"Successfully created merged PDF: {output_path}")
-        return True
-    except Exception as e:
-        logger.error(f"Error merging PDFs: {str(e)}")
-        return False
+def render_chapter_pdf(original_html: str, title: str) -> bytes:
+    """המרת HTML שכבר הורד ל-PDF עם כותרת משולבת, בזיכרון וללא קבצים זמניים.
+    זורק RenderError אם הרינדור נכשל או חרג מהזמן"""
+    logger.info(f"Starting conversion with embedded header for: {title}")
+    
+    modified_html = build_chapter_html(original_html, title)
+    pdf_data = render_html_to_pdf(modified_html, PDFKIT_OPTIONS, description=f"Rendering {title}")
+    
+    logger.info(f"Successfully created PDF for {title} (Size: {len(pdf_data)} bytes)")
+    return pdf_data
 
-def create_book_cover(title: str, output_path: str) -> str:
-    """יצירת דף שער ראשי לספר"""
-    html_content = f"""
+def build_book_cover_html(title: str) -> str:
+    """בניית HTML של דף השער"""
+    return f"""
     <!DOCTYPE html>
     <html dir="rtl">
     <head>
@@ -244,70 +551,548 @@ def create_book_cover(title: str, output_path: str) -> str:
     </body>
     </html>
     """
+
+def create_book_cover(title: str) -> bytes:
+    """יצירת דף שער ראשי לספר"""
+    html_content = build_book_cover_html(title)
+    return render_html_to_pdf(html_content, PAGE_PDFKIT_OPTIONS)
+
+def render_table_of_contents(task_id: str, titles: List[str], positions: List[int]) -> Tuple[bytes, int]:
+    """רינדור תוכן העניינים עם מספרי העמודים האמיתיים של הפרקים.
+    positions הם המיקומים (מ-0) של העמוד הראשון של כל פרק בספר, לפני הוספת תוכן העניינים.
+    מחזיר את ה-PDF ואת מספר העמודים שלו"""
+    toc_pages = 1
+    for _ in range(TOC_MAX_PASSES):
+        # תוכן העניינים נכנס לפני הפרקים, ולכן מספרי העמודים תלויים באורך שלו
+        page_numbers = [position + toc_pages + 1 for position in positions]
+        toc_pdf = get_render_pool().submit(task_id, create_table_of_contents, titles, page_numbers).result()
+        rendered_pages = len(PdfReader(io.BytesIO(toc_pdf)).pages)
+        if rendered_pages == toc_pages:
+            return toc_pdf, toc_pages
+        toc_pages = rendered_pages
+    
+    logger.warning(f"Table of contents page count did not settle for task {task_id}")
+    return toc_pdf, toc_pages
+
+def render_book_single_pass(book_title: str, chapters: List[tuple], output_path: str) -> bool:
+    """רינדור כל הספר בקריאה אחת ל-wkhtmltopdf: שער, תוכן עניינים וכל הפרקים"""
+    temp_dir = os.path.dirname(output_path)
+    temp_files = []
+    
+    def write_temp_html(prefix: str, html_content: str) -> str:
+        temp_html = os.path.join(temp_dir, f"{prefix}_{uuid.uuid4().hex[:8]}.html")
+        with open(temp_html, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        temp_files.append(temp_html)
+        return temp_html
+    
+    try:
+        cover_html = write_temp_html("bookcover", build_book_cover_html(book_title))
+        inputs = [write_temp_html("toc", build_table_of_contents_html([title for title, _ in chapters]))]
+        for title, original_html in chapters:
+            inputs.append(write_temp_html("temp", build_chapter_html(original_html, title)))
+        
+        logger.info(f"Rendering {len(chapters)} chapters in a single wkhtmltopdf call")
+        # סימניות מכותרות הפרקים (h1), בלי כותרות הסעיפים שבתוך הערכים
+        options = {**PDFKIT_OPTIONS, 'outline': None, 'outline-depth': '1'}
+        kit = pdfkit.PDFKit(inputs, 'file', options=options, cover=cover_html, cover_first=True,
+                            configuration=pdfkit_configuration())
+        # זמן הרינדור המותר גדל עם מספר הפרקים
+        run_pdfkit(kit, output_path, timeout=RENDER_TIMEOUT_SECONDS * (len(chapters) + 2))
+        
+        if os.path.exists(output_path):
+            size = os.path.getsize(output_path)
+            logger.info(f"Successfully created PDF: {output_path} (Size: {size} bytes)")
+            return True
+        
+        logger.error(f"Failed to create PDF: {output_path}")
+        return False
+    
+    except Exception as e:
+        logger.error(f"Error rendering book in a single pass: {str(e)}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False
+    
+    finally:
+        for temp_html in temp_files:
+            if os.path.exists(temp_html):
+                os.remove(temp_html)
+
+def chapter_render_options() -> Dict[str, Any]:
+    """כל ההגדרות שמשפיעות על ה-PDF של פרק, לצורך מפתח המטמון"""
+    return {
+        "engine": get_renderer().name,
+        "pdfkit": PDFKIT_OPTIONS,
+        "local_assets": ASSET_STORE_ENABLED,
+        "html_pipeline": html_pipeline.options() if HTML_PIPELINE_ENABLED else None,
+    }
+
+def fetch_page_revision(base_url: str, page: str) -> Optional[int]:
+    """קבלת מזהה הגרסה האחרונה של דף מה-REST API של הויקי"""
+    try:
+        page_info = get_fetcher().fetch_json(f'{base_url}/{quote(page)}/bare')
+        return page_info["latest"]["id"]
+    except Exception as e:
+        logger.warning(f"Could not get revision of {page}: {str(e)}")
+        return None
+
+def fetch_chapter(task_id: str, base_url: str, page: str, use_cache: bool = CHAPTER_CACHE_ENABLED,
+                  timings: Optional[ChapterTimings] = None) -> Dict[str, Any]:
+    """שלב ההורדה של פרק: בדיקה במטמון לפי גרסת הדף, ואם צריך - הורדת ה-HTML"""
+    # הורדה שחיכתה בתור של תהליכוני ההורדה לא מתחילה אם המשימה בוטלה בינתיים
+    check_cancelled(task_id)
+    chapter = {"title": page, "cache_key": None, "cached": False, "html": None, "html_bytes_removed": 0}
+    
+    if use_cache:
+        with timed(timings, "fetch"):
+            revision = fetch_page_revision(base_url, page)
+        if revision is not None:
+            chapter["cache_key"] = ChapterCache.make_key(base_url, page, revision, chapter_render_options())
+            if get_chapter_cache().contains(chapter["cache_key"]):
+                CACHE_REQUESTS.inc(cache="chapter", result="hit")
+                if timings is not None:
+                    timings.note(cached=True)
+                chapter["cached"] = True
+                return chapter
+            CACHE_REQUESTS.inc(cache="chapter", result="miss")
+    
+    # הפרק נשמר במטמון לפי הגרסה שנבדקה עכשיו, ולכן ה-HTML לא יכול להגיע מחלון הרעננות
+    # (עותק מלפני עריכה היה נשמר לתמיד תחת המפתח של הגרסה החדשה)
+    chapter["html"], chapter["html_bytes_removed"] = fetch_page_html(
+        f'{base_url}/{quote(page)}/html', timings, task_id, revalidate=chapter["cache_key"] is not None
+    )
+    return chapter
+
+def render_chapter(chapter: Dict[str, Any], timings: Optional[ChapterTimings] = None) -> bytes:
+    """שלב הרינדור של פרק, ושמירת התוצאה במטמון"""
+    with timed(timings, "render"):
+        pdf_data = render_chapter_pdf(chapter["html"], chapter["title"])
+    
+    if chapter["cache_key"]:
+        try:
+            get_chapter_cache().put(chapter["cache_key"], pdf_data)
+        except Exception as e:
+            logger.warning(f"Error caching chapter {chapter['title']}: {str(e)}")
+    return pdf_data
+
+def schedule_chapter(task_id: str, fetch_future: Future, page: str, base_url: str,
+                     scratch: PdfScratch, progress: TaskProgress, count_fetch: bool = True,
+                     on_ready: Optional[Callable[[bytes], None]] = None,
+                     timings: Optional[ChapterTimings] = None,
+                     is_needed: Optional[Callable[[], bool]] = None) -> Future:
+    """שרשור שלבי הפרק: אחרי ההורדה - קריאה מהמטמון או רינדור במאגר המשותף.
+    on_ready מקבל את ה-PDF של הפרק ברגע שהוא מוכן, לפני המיזוג.
+    is_needed (באצווה) מחזיר False כשכל הספרים שמכילים את הפרק בוטלו, ואז הפרק לא מרונדר.
+    מחזיר Future שמסתיים ב-PDF של הפרק (bytes או נתיב בתיקיית העבודה), או None אם הפרק נכשל"""
+    chapter_future = Future()
     
-    temp_html = os.path.join(os.path.dirname(output_path), f"bookcover_{uuid.uuid4().hex[:8]}.html")
-    with open(temp_html, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    def chapter_ready(pdf_data: bytes) -> None:
+        if on_ready is not None:
+            try:
+                on_ready(pdf_data)
+            except Exception as e:
+                logger.warning(f"Error delivering chapter {page}: {str(e)}")
+        chapter_future.set_result(scratch.keep(pdf_data))
     
-    pdfkit.from_file(temp_html, output_path, options={'page-size': 'A4', 'encoding': 'UTF-8'})
-    os.remove(temp_html)
+    def on_rendered(done: Future) -> None:
+        # פרק של משימה שבוטלה אינו נחשב ככישלון
+        if done.cancelled() or isinstance(done.exception(), RenderCancelledError):
+            chapter_future.set_result(None)
+            return
+        if done.exception() is None and done.result():
+            try:
+                chapter_ready(done.result())
+            except OSError as e:
+                progress.fail(page, "render", str(e))
+                chapter_future.set_result(None)
+                return
+            progress.advance("rendered")
+        else:
+            error = str(done.exception() or "wkhtmltopdf failed")
+            logger.error(f"Error converting {page}: {error}")
+            progress.fail(page, "render", error)
+            chapter_future.set_result(None)
+    
+    def on_fetched(done: Future) -> None:
+        # פרק של משימה שבוטלה לא נקרא מהמטמון ולא נשלח לרינדור
+        if (done.cancelled() or isinstance(done.exception(), (TaskCancelledError, FetchCancelledError))
+                or get_render_pool().is_cancelled(task_id) or (is_needed is not None and not is_needed())):
+            chapter_future.set_result(None)
+            return
+        try:
+            try:
+                chapter = done.result()
+            except Exception as e:
+                logger.error(f"Error fetching {page}: {str(e)}")
+                # במעבר ממצב קריאה אחת, כשל ההורדה כבר נרשם
+                if count_fetch:
+                    progress.fail(page, "fetch", str(e))
+                chapter_future.set_result(None)
+                return
+            if count_fetch:
+                progress.advance("fetched")
+                progress.advance("html_bytes_removed", chapter["html_bytes_removed"])
+            
+            # פרק שכבר רונדר בגרסה הזו נלקח מהמטמון בלי הורדה ורינדור
+            if chapter["cached"]:
+                with timed(timings, "cache"):
+                    pdf_data = get_chapter_cache().read(chapter["cache_key"])
+                if pdf_data is not None:
+                    progress.advance("cached")
+                    progress.advance("rendered")
+                    chapter_ready(pdf_data)
+                    return
+                chapter["html"], removed_bytes = fetch_page_html(f'{base_url}/{quote(page)}/html', timings,
+                                                                 task_id, revalidate=True)
+                progress.advance("html_bytes_removed", removed_bytes)
+            
+            profiler = timings.profiler if timings is not None else None
+            render = get_render_pool().submit(task_id, profiled(profiler, render_chapter), chapter, timings)
+            render.add_done_callback(on_rendered)
+        except TaskCancelledError:
+            chapter_future.set_result(None)
+        except Exception as e:
+            logger.error(f"Error scheduling {page}: {str(e)}")
+            progress.fail(page, "fetch", str(e))
+            chapter_future.set_result(None)
     
-    return output_path
+    fetch_future.add_done_callback(on_fetched)
+    return chapter_future
+
+def assemble_book(task_id: str, book_title: str, wiki_pages: List[str], cover_future: Future,
+                  chapter_futures: List[Future], progress: TaskProgress, scratch: PdfScratch,
+                  strict: bool = False, pool_task_id: Optional[str] = None,
+                  release_chapters: bool = True, linearize: bool = PDF_LINEARIZE,
+                  timings: Optional[StageTimings] = None) -> int:
+    """מיזוג השער והפרקים לספר לפי הסדר, והוספת תוכן עניינים עם מספרי העמודים האמיתיים.
+    pool_task_id היא המשימה שהעבודות שלה רצות במאגר הרינדור (האצווה, בספר שהוא חלק מאצווה).
+    מחזיר את מספר העמודים בספר"""
+    pool_task_id = pool_task_id or task_id
+    merged_path = book_output_path(task_id, book_title)
+    os.makedirs(os.path.dirname(merged_path), exist_ok=True)
+    writer = StreamingPdfWriter(merged_path)
+    # (כותרת, מיקום העמוד הראשון, מספר עמודים) לכל פרק שנכנס לספר
+    contents = []
+    try:
+        cover_pages = writer.append(cover_future.result())
+        
+        for page, chapter_future in zip(wiki_pages, chapter_futures):
+            check_cancelled(pool_task_id)
+            check_cancelled(task_id)
+            # במצב strict כל פרק שנכשל מכשיל את הספר, בלי לחכות לשאר
+            if strict and progress.has_failures:
+                raise ChapterFailedError("a chapter failed and strict mode is on")
+            chapter_pdf = chapter_future.result()
+            if chapter_pdf is None:
+                continue
+            position = writer.page_count
+            chapter_timings = timings.chapter(page) if timings is not None else None
+            with timed(chapter_timings, "merge"):
+                page_count = writer.append(chapter_pdf)
+            if chapter_timings is not None:
+                chapter_timings.note(pages=page_count)
+            # פרק משותף לכמה ספרים נשאר עד שכל הספרים מוזגו
+            if release_chapters:
+                scratch.release(chapter_pdf)
+            progress.advance("merged")
+            if page_count:
+                writer.add_bookmark(page, position)
+                writer.add_link_target(f"{TOC_LINK_PREFIX}{len(contents)}", position)
+                contents.append((page, position, page_count))
+        
+        # תוכן העניינים עם מספרי העמודים האמיתיים נכנס מיד אחרי השער
+        check_cancelled(pool_task_id)
+        check_cancelled(task_id)
+        if strict and progress.has_failures:
+            raise ChapterFailedError("a chapter failed and strict mode is on")
+        
+        with timed(timings, "toc"):
+            toc_pdf, toc_pages = render_table_of_contents(
+                pool_task_id, [title for title, _, _ in contents],
+                [position for _, position, _ in contents]
+            )
+        writer.append(toc_pdf, index=cover_pages)
+        writer.add_bookmark("תוכן עניינים", cover_pages)
+        with timed(timings, "write"):
+            writer.close()
+    except Exception:
+        writer.abort()
+        os.remove(merged_path)
+        raise
+    # הקובץ הסופי בפורמט linearized, לתצוגה מהירה בדפדפן
+    with timed(timings, "linearize"):
+        linearized = linearize and linearize_pdf(merged_path)
+    output_bytes = os.path.getsize(merged_path)
+    WRITTEN_BYTES.inc(output_bytes, kind="book")
+    task_status.update(
+        task_id,
+        size_report={**writer.stats(), "output_bytes": output_bytes, "linearized": linearized},
+        table_of_contents=[
+            {"title": title, "first_page": position + toc_pages + 1, "page_count": page_count}
+            for title, position, page_count in contents
+        ]
+    )
+    return writer.page_count
 
 def convert_urls_to_pdfs(task_id: str, wiki_pages: List[str], 
                         book_title: str = "המכלול ערים",
-                        base_url: str = "https://dev.hamichlol.org.il/w/rest.php/v1/page") -> bool:
-    """המרת כל ה-URLs ל-PDFs עם דף שער, תוכן עניינים וכותרות לפרקים"""
+                        base_url: str = "https://dev.hamichlol.org.il/w/rest.php/v1/page",
+                        render_mode: str = RENDER_MODE,
+                        strict: bool = False,
+                        linearize: bool = PDF_LINEARIZE,
+                        profiler: Optional[TaskProfiler] = None) -> bool:
+    """המרת כל ה-URLs ל-PDFs עם דף שער, תוכן עניינים וכותרות לפרקים.
+    פרקים שנכשלו מדולגים, אלא אם strict - ואז הספר כולו נכשל.
+    profiler מודד גם את העבודות שנשלחות לתהליכוני ההורדה והרינדור"""
     temp_dir = create_temp_directory(task_id)
-    pdf_files = []
     output_file_created = False
+    progress = TaskProgress(task_status, task_id, total=len(wiki_pages))
+    # פרקים שרונדרו נשמרים בזיכרון עד המיזוג, ומעבר לתקציב - בתיקיית tmpfs
+    scratch = PdfScratch(os.path.join(RENDER_SCRATCH_PATH, f'pdf_task_{task_id}'), temp_dir)
+    chapter_futures = []
+    output_dir = os.path.join(OUTPUT_PATH, task_id)
+    # זמן מצטבר לכל שלב בצנרת וציר זמן לכל פרק, נשמרים עם המשימה
+    timings = StageTimings(profiler)
+    with _running_tasks_lock:
+        fetch_futures = _running_tasks.setdefault(task_id, [])
+    render_pool = get_render_pool()
     
     try:
-        # יצירת דף שער ראשי לספר
-        cover_filename = f"book_cover_{uuid.uuid4().hex[:8]}.pdf"
-        cover_path = os.path.join(temp_dir, cover_filename)
-        create_book_cover(book_title, cover_path)
-        pdf_files.append(cover_path)
+        # וודא שתיקיית הפלט קיימת
+        os.makedirs(output_dir, exist_ok=True)
+        merged_path = book_output_path(task_id, book_title)
         
-        # יצירת תוכן עניינים
-        toc_filename = f"toc_{uuid.uuid4().hex[:8]}.pdf"
-        toc_path = os.path.join(temp_dir, toc_filename)
-        create_table_of_contents(wiki_pages, toc_path)
-        pdf_files.append(toc_path)
+        # הורדת כל דפי הויקי במקביל
+        fetcher = get_fetcher()
+        # במצב קריאה אחת צריך את ה-HTML של כל הפרקים, ולכן לא משתמשים במטמון הפרקים
+        use_cache = CHAPTER_CACHE_ENABLED and render_mode != RENDER_MODE_SINGLE
+        with _running_tasks_lock:
+            fetch_futures.extend(fetcher.run(task_id, profiled(profiler, fetch_chapter), task_id, base_url, page,
+                                             use_cache, timings.chapter(page))
+                                 for page in wiki_pages)
+        check_cancelled(task_id)
         
-        # יצירת כל דפי הויקי עם כותרות
-        for page in wiki_pages:
-            url = f'{base_url}/{quote(page)}/html'
-            output_filename = f"{page.replace(' ', '_')}_{uuid.uuid4().hex[:8]}.pdf"
-            output_path = os.path.join(temp_dir, output_filename)
+        if render_mode == RENDER_MODE_SINGLE:
+            # רינדור כל הספר בקריאה אחת, ללא מיזוג
+            chapters = []
+            for page, future in zip(wiki_pages, fetch_futures):
+                check_cancelled(task_id)
+                if future.exception() is None:
+                    chapters.append((page, future.result()["html"]))
+                    progress.advance("fetched")
+                    progress.advance("html_bytes_removed", future.result()["html_bytes_removed"])
+                else:
+                    logger.error(f"Error fetching {page}: {str(future.exception())}")
+                    progress.fail(page, "fetch", str(future.exception()))
             
-            if convert_page_with_header(url, output_path, page):
-                pdf_files.append(output_path)
-        
-        # מיזוג הקבצים
-        if pdf_files:
-            # וודא שתיקיית הפלט קיימת
-            output_dir = os.path.join('/app/output', task_id)
-            os.makedirs(output_dir, exist_ok=True)
+            if strict and progress.has_failures:
+                raise ChapterFailedError(f"{len(wiki_pages) - len(chapters)} chapters could not be fetched")
+            
+            single_pass_path = os.path.join(temp_dir, f"book_{uuid.uuid4().hex[:8]}.pdf")
+            with timed(timings, "render"):
+                rendered = bool(chapters) and render_pool.submit(
+                    task_id, profiled(profiler, render_book_single_pass), book_title, chapters, single_pass_path
+                ).result()
+            if rendered:
+                shutil.move(single_pass_path, merged_path)
+                if linearize:
+                    with timed(timings, "linearize"):
+                        linearize_pdf(merged_path)
+                WRITTEN_BYTES.inc(os.path.getsize(merged_path), kind="book")
+                progress.advance("rendered", len(chapters))
+                progress.advance("merged", len(chapters))
+                return True
             
-            merged_path = os.path.join(output_dir, f'{book_title.replace(" ", "_")}.pdf')
-            if merge_pdfs(pdf_files, merged_path):
-                output_file_created = True
-                
+            # אם דף אחד שבר את הרינדור, נחזור לרינדור פרק-פרק כדי לבודד אותו
+            check_cancelled(task_id)
+            logger.warning(f"Single-pass rendering failed for task {task_id}, falling back to per-chapter rendering")
+        
+        # יצירת דף שער במאגר הרינדור המשותף. תוכן העניינים נוצר בסוף, כשמספרי העמודים ידועים
+        cover_future = render_pool.submit(task_id, create_book_cover, book_title)
+        
+        # כל פרק עובר לרינדור ברגע שהורד, במקביל לשאר הפרקים
+        for index, (page, fetch_future) in enumerate(zip(wiki_pages, fetch_futures)):
+            on_ready = None
+            if CHAPTER_DELIVERY_ENABLED:
+                on_ready = lambda pdf_data, index=index, page=page: deliver_chapter(
+                    task_id, progress, index, page, pdf_data)
+            chapter_futures.append(schedule_chapter(
+                task_id, fetch_future, page, base_url, scratch,
+                progress, count_fetch=render_mode != RENDER_MODE_SINGLE, on_ready=on_ready,
+                timings=timings.chapter(page)
+            ))
+        
+        # מיזוג בזרימה: כל פרק נכתב לספר ברגע שהוא והפרקים שלפניו מוכנים
+        page_count = assemble_book(task_id, book_title, wiki_pages, cover_future, chapter_futures,
+                                   progress, scratch, strict, linearize=linearize, timings=timings)
+        
+        if use_cache:
+            logger.info(f"Task {task_id}: {progress.snapshot()['cached']} of {len(wiki_pages)} chapters served from cache")
+        logger.info(f"Successfully created merged PDF: {merged_path} ({page_count} pages)")
+        output_file_created = True
         return output_file_created
             
+    except (TaskCancelledError, CancelledError):
+        logger.info(f"Task {task_id} was cancelled, stopping")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return False
+    
     except Exception as e:
         logger.error(f"Error during conversion process: {str(e)}")
         return False
         
     finally:
+        # המתנה לפרקים שעוד רצים לפני מחיקת התיקייה הזמנית
+        wait(chapter_futures)
+        with _running_tasks_lock:
+            _running_tasks.pop(task_id, None)
+            _cancel_checked_at.pop(task_id, None)
+            render_pool.forget(task_id)
+        progress.flush(force=True)
+        # רשימת הפרקים שנכשלו, גם בספר חלקי וגם בספר שנכשל
+        timeline = timings.timeline()
+        task_status.update(task_id, failed_chapters=progress.snapshot()["failed"],
+                           stage_timings=timings.snapshot(), chapter_timeline=timeline)
+        log_slow_chapters(task_id, timeline)
+        
+        # ניקוי קבצים זמניים
+        scratch.cleanup()
+        try:
+            shutil.rmtree(temp_dir)
+            logger.info(f"Removed temporary directory: {temp_dir}")
+        except Exception as e:
+            logger.error(f"Error during cleanup: {str(e)}")
+
+def batch_chapter_key(base_url: str, page: str) -> Tuple[str, str]:
+    """זיהוי פרק בין ספרים שונים: אותו ערך מאותו אתר"""
+    return (base_url or "").strip().rstrip("/"), page.strip()
+
+def convert_batch_to_pdfs(batch_id: str, books: List[Dict[str, Any]],
+                          profiler: Optional[TaskProfiler] = None) -> List[bool]:
+    """יצירת כמה ספרים עם פרקים משותפים: כל ערך מורד ומרונדר פעם אחת,
+    וכל ספר מורכב מהפרקים שלו. מחזיר את ההצלחה של כל ספר לפי הסדר"""
+    temp_dir = create_temp_directory(batch_id)
+    # פרקים משותפים נשמרים עד שכל הספרים מוזגו, ומעבר לתקציב - בתיקיית tmpfs
+    scratch = PdfScratch(os.path.join(RENDER_SCRATCH_PATH, f'pdf_task_{batch_id}'), temp_dir)
+    progresses = [TaskProgress(task_status, book["task_id"], total=len(book["wiki_pages"])) for book in books]
+    results = [False] * len(books)
+    # Future של PDF לכל פרק ייחודי
+    shared_chapters: Dict[Tuple[str, str], Future] = {}
+    # זמני השלבים של האצווה כולה: פרק משותף נמדד פעם אחת
+    timings = StageTimings(profiler)
+    book_ids = [book["task_id"] for book in books]
+    render_pool = get_render_pool()
+    with _running_tasks_lock:
+        fetch_futures = _running_tasks.setdefault(batch_id, [])
+        # לספר אין הורדות משלו (הפרקים משותפים), אבל אפשר לבטל אותו בנפרד מהאצווה
+        for task_id in book_ids:
+            _running_tasks.setdefault(task_id, [])
+    for task_id in book_ids:
+        if is_task_cancelled(task_id):
+            render_pool.cancel(task_id)
+    
+    def is_book_cancelled(task_id: str) -> bool:
+        return render_pool.is_cancelled(task_id)
+    
+    try:
+        # כל ספר שמכיל את הפרק מקבל את ההתקדמות שלו ואת קובץ הפרק (לפי המיקום שלו בספר)
+        listeners: Dict[Tuple[str, str], List[TaskProgress]] = {}
+        deliveries: Dict[Tuple[str, str], List[Tuple[str, TaskProgress, int]]] = {}
+        for book, progress in zip(books, progresses):
+            for index, page in enumerate(book["wiki_pages"]):
+                key = batch_chapter_key(book["base_url"], page)
+                listeners.setdefault(key, []).append(progress)
+                deliveries.setdefault(key, []).append((book["task_id"], progress, index))
+        
+        total_chapters = sum(len(book["wiki_pages"]) for book in books)
+        logger.info(f"Batch {batch_id}: {len(books)} books, {total_chapters} chapters, "
+                    f"{len(listeners)} unique chapters")
+        task_status.update(batch_id, unique_chapters=len(listeners))
+        
+        def deliver_shared_chapter(key: Tuple[str, str], pdf_data: bytes) -> None:
+            for task_id, progress, index in deliveries[key]:
+                if not is_book_cancelled(task_id):
+                    deliver_chapter(task_id, progress, index, key[1], pdf_data)
+        
+        # הורדה ורינדור של כל פרק ייחודי פעם אחת, במאגר הרינדור המשותף תחת מזהה האצווה
+        fetcher = get_fetcher()
+        for (base_url, page), chapter_progresses in listeners.items():
+            fetch_future = fetcher.run(batch_id, profiled(profiler, fetch_chapter), batch_id, base_url, page,
+                                       CHAPTER_CACHE_ENABLED, timings.chapter(page))
+            with _running_tasks_lock:
+                fetch_futures.append(fetch_future)
+            on_ready = partial(deliver_shared_chapter, (base_url, page)) if CHAPTER_DELIVERY_ENABLED else None
+            
+            def is_needed(key=(base_url, page)) -> bool:
+                return any(not is_book_cancelled(task_id) for task_id, _, _ in deliveries[key])
+            
+            shared_chapters[(base_url, page)] = schedule_chapter(
+                batch_id, fetch_future, page, base_url, scratch, ProgressFanout(chapter_progresses),
+                on_ready=on_ready, timings=timings.chapter(page), is_needed=is_needed
+            )
+        check_cancelled(batch_id)
+        
+        cover_futures = [render_pool.submit(batch_id, create_book_cover, book["book_title"]) for book in books]
+        
+        # הספרים מורכבים לפי הסדר, כל אחד ברגע שהפרקים שלו מוכנים
+        for index, (book, progress) in enumerate(zip(books, progresses)):
+            task_id = book["task_id"]
+            if is_book_cancelled(task_id) or is_task_cancelled(task_id):
+                logger.info(f"Book {task_id} of batch {batch_id} was cancelled, skipping")
+                continue
+            chapter_futures = [shared_chapters[batch_chapter_key(book["base_url"], page)]
+                               for page in book["wiki_pages"]]
+            try:
+                page_count = assemble_book(
+                    task_id, book["book_title"], book["wiki_pages"], cover_futures[index],
+                    chapter_futures, progress, scratch, book.get("strict", False),
+                    pool_task_id=batch_id, release_chapters=False,
+                    linearize=book.get("linearize", PDF_LINEARIZE), timings=timings
+                )
+                results[index] = True
+                logger.info(f"Batch {batch_id}: created {book_output_path(task_id, book['book_title'])} "
+                            f"({page_count} pages)")
+            except (TaskCancelledError, CancelledError):
+                if render_pool.is_cancelled(batch_id):
+                    raise
+                # רק הספר הזה בוטל; שאר הספרים באצווה ממשיכים
+                logger.info(f"Book {task_id} of batch {batch_id} was cancelled, skipping")
+            except Exception as e:
+                logger.error(f"Error assembling book {task_id} of batch {batch_id}: {str(e)}")
+        return results
+    
+    except (TaskCancelledError, CancelledError):
+        logger.info(f"Batch {batch_id} was cancelled, stopping")
+        for book in books:
+            shutil.rmtree(os.path.join(OUTPUT_PATH, book["task_id"]), ignore_errors=True)
+        return [False] * len(books)
+    
+    finally:
+        # המתנה לפרקים שעוד רצים לפני מחיקת התיקייה הזמנית
+        wait(list(shared_chapters.values()))
+        # ספר שבוטל לא משאיר קבצים (גם לא פרקים שנמסרו לפני הביטול)
+        for task_id in book_ids:
+            if is_book_cancelled(task_id) or is_task_cancelled(task_id):
+                shutil.rmtree(os.path.join(OUTPUT_PATH, task_id), ignore_errors=True)
+        with _running_tasks_lock:
+            for task_id in [batch_id] + book_ids:
+                _running_tasks.pop(task_id, None)
+                _cancel_checked_at.pop(task_id, None)
+                render_pool.forget(task_id)
+        for book, progress in zip(books, progresses):
+            progress.flush(force=True)
+            # כל ספר מקבל את ציר הזמן של הפרקים שלו
+            timeline = timings.timeline(book["wiki_pages"])
+            task_status.update(book["task_id"], failed_chapters=progress.snapshot()["failed"],
+                               chapter_timeline=timeline)
+            log_slow_chapters(book["task_id"], timeline)
+        task_status.update(batch_id, stage_timings=timings.snapshot())
+        
         # ניקוי קבצים זמניים
+        scratch.cleanup()
         try:
-            for pdf in pdf_files:
-                if os.path.exists(pdf):
-                    os.remove(pdf)
-                    logger.info(f"Removed temporary file: {pdf}")
-            os.rmdir(temp_dir)
+            shutil.rmtree(temp_dir)
             logger.info(f"Removed temporary directory: {temp_dir}")
         except Exception as e:
-            logger.error(f"Error during cleanup: {str(e)}")
\ No newline at end of file
+            logger.error(f"Error during cleanup: {str(e)}")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, HTTPException, Request, status, Query
 from fastapi.responses import FileResponse
 from typing import List
 import logging
@@ -6,6 +6,7 @@ from datetime import datetime
 
 from ..models.books import BookInfo, BooksResponse, FolderInfo, FoldersResponse, SearchResponse
 from ..services.books_service import BooksService
+from ..services.file_serving import serve_file
 from ..config import BASE_BOOKS_PATH
 
 # הגדרת הRouter
@@ -176,6 +177,34 @@ async def get_search_suggestions(
             detail="שגיאה בקבלת הצעות חיפוש"
         )
 
+
+def serve_book(folder_name: str, filename: str, request: Request, inline: bool):
+    """הגשת קובץ ספר מתיקיית הספרים, עם תמיכה ב-Range ובבקשות מותנות"""
+    try:
+        file_path, mimetype = books_service.get_file_info(folder_name, filename)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="הקובץ לא נמצא"
+        )
+    
+    return serve_file(request, file_path, filename,
+                      media_type=mimetype or "application/octet-stream", inline=inline)
+
+@router.get("/view/{folder_name}/{filename}")
+async def view_book(folder_name: str, filename: str, request: Request):
+    """
+    הצגת ספר בדפדפן
+    """
+    return serve_book(folder_name, filename, request, inline=True)
+
+@router.get("/download/{folder_name}/{filename}")
+async def download_book(folder_name: str, filename: str, request: Request):
+    """
+    הורדת ספר
+    """
+    return serve_book(folder_name, filename, request, inline=False)
+
         
 @router.get("/health")
 async def health_check():
@@ -1,11 +1,27 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException, status
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 import uuid
 import os
+import json
+import time
+import asyncio
 import logging
 import urllib.parse
-from ..models import PDFRequest, PDFResponse, PDFStatus
-from app.pdf_generator import create_pdf_async, task_status
+from ..models import (
+    PDFRequest, PDFResponse, PDFStatus, PDFBatchRequest, PDFBatchResponse, PDFBatchStatus, PDFProfile
+)
+from app.pdf_generator import (
+    create_pdf_async, create_pdf_batch_async, task_status, request_fingerprint, find_reusable_task,
+    register_task, register_batch, cancel_task, chapters_output_dir
+)
+from app.config import (
+    OUTPUT_PATH, RENDER_MODE, PDF_LINEARIZE, JOB_QUEUE_ENABLED, JOB_QUEUE_RETRY_AFTER_SECONDS,
+    STATUS_MAX_WAIT_SECONDS, SLOW_CHAPTER_SECONDS
+)
+from app.services.job_queue import JobQueue, QueueFullError
+from app.services.file_serving import serve_file, stream_zip, content_disposition
+from app.services.metrics import TASKS, QUEUE_DEPTH, QUEUE_RUNNING
 
 router = APIRouter(
     prefix="/api/pdf",
@@ -15,7 +31,51 @@ router = APIRouter(
 
 logger = logging.getLogger(__name__)
 
-BASE_BOOKS_PATH = "/app/output"
+BASE_BOOKS_PATH = OUTPUT_PATH
+
+# תור העבודות ל-workers הנפרדים (אם מופעל)
+job_queue = JobQueue() if JOB_QUEUE_ENABLED else None
+if job_queue is not None:
+    QUEUE_DEPTH.set_function(job_queue.depth)
+    QUEUE_RUNNING.set_function(job_queue.running)
+
+# סטטוסים שאחריהם המשימה לא תשתנה יותר
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+# מרווח (בשניות) בין בדיקות שינוי בסטטוס ב-long-poll וב-SSE
+STATUS_POLL_INTERVAL = 0.25
+
+# מרווח (בשניות) בין הודעות keep-alive בזרם ה-SSE
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def build_status(task_id: str, status_data: dict) -> PDFStatus:
+    """בניית תשובת סטטוס מרשומת המשימה"""
+    return PDFStatus(
+        task_id=task_id,
+        status=status_data.get("status", "unknown"),
+        download_url=status_data.get("download_url"),
+        message=status_data.get("message", ""),
+        progress=status_data.get("progress"),
+        size_report=status_data.get("size_report"),
+        table_of_contents=status_data.get("table_of_contents"),
+        failed_chapters=status_data.get("failed_chapters"),
+        chapters=status_data.get("chapters")
+    )
+
+
+async def wait_for_status_change(task_id: str, status_data: dict, timeout: float) -> dict:
+    """המתנה עד שרשומת המשימה משתנה, המשימה מסתיימת או שהזמן עובר"""
+    deadline = time.monotonic() + timeout
+    while status_data.get("status") not in TERMINAL_STATUSES and time.monotonic() < deadline:
+        await asyncio.sleep(STATUS_POLL_INTERVAL)
+        # קריאה מ-SQLite חוסמת, ולכן לא רצה בלולאת האירועים (כל לקוח ממתין קורא בכל מרווח)
+        current = await asyncio.to_thread(task_status.get, task_id)
+        if current is None:
+            break
+        if current.get("updated_at") != status_data.get("updated_at"):
+            return current
+    return status_data
 
 
 @router.post("/generate", response_model=PDFResponse)
@@ -23,9 +83,6 @@ async def generate_pdf(request: PDFRequest, background_tasks: BackgroundTasks):
     """
     קבלת רשימת ערכי ויקי והפעלת תהליך המרה לPDF
     """
-    task_id = str(uuid.uuid4())
-    logger.info(f"New PDF generation task: {task_id}")
-    
     # בדיקה שיש ערכים להמרה
     if not request.wiki_pages:
         raise HTTPException(
@@ -33,13 +90,68 @@ async def generate_pdf(request: PDFRequest, background_tasks: BackgroundTasks):
             detail="נדרשת רשימה של לפחות ערך ויקי אחד"
         )
     
+    # בקשה זהה שכבר רצה או הושלמה לאחרונה מקבלת את המשימה הקיימת
+    render_mode = request.render_mode or RENDER_MODE
+    linearize = PDF_LINEARIZE if request.linearize is None else request.linearize
+    fingerprint = request_fingerprint(request.wiki_pages, request.book_title, request.base_url,
+                                      render_mode, request.strict, linearize)
+    # בקשת profile מודדת הרצה חדשה, ולכן לא מצטרפת למשימה קיימת
+    existing_task_id = None if request.profile else find_reusable_task(fingerprint)
+    if existing_task_id:
+        existing = task_status[existing_task_id]
+        logger.info(f"Identical request attached to existing task: {existing_task_id}")
+        return PDFResponse(
+            task_id=existing_task_id,
+            status=existing["status"],
+            message="בקשה זהה כבר קיימת, מוחזרת המשימה הקיימת",
+            download_url=existing.get("download_url")
+        )
+    
+    task_id = str(uuid.uuid4())
+    logger.info(f"New PDF generation task: {task_id}")
+    
+    if job_queue is not None:
+        # העבודה עצמה רצה ב-worker נפרד; כאן רק מוסיפים לתור
+        register_task(task_id, fingerprint, queued=True)
+        try:
+            job_queue.enqueue({
+                "task_id": task_id,
+                "wiki_pages": request.wiki_pages,
+                "book_title": request.book_title,
+                "base_url": request.base_url,
+                "render_mode": render_mode,
+                "strict": request.strict,
+                "linearize": linearize,
+                "profile": request.profile
+            })
+        except QueueFullError:
+            del task_status[task_id]
+            logger.warning(f"Job queue full, rejecting task {task_id}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="השרת עמוס כרגע, נא לנסות שוב מאוחר יותר",
+                headers={"Retry-After": str(JOB_QUEUE_RETRY_AFTER_SECONDS)}
+            )
+        
+        return PDFResponse(
+            task_id=task_id,
+            status="queued",
+            message="המשימה נוספה לתור, בדוק את הסטטוס באמצעות מזהה המשימה"
+        )
+    
+    register_task(task_id, fingerprint)
+    
     # הפעלת המשימה ברקע
     background_tasks.add_task(
         create_pdf_async,
         task_id=task_id,
         wiki_pages=request.wiki_pages,
         book_title=request.book_title,
-        base_url=request.base_url
+        base_url=request.base_url,
+        render_mode=render_mode,
+        strict=request.strict,
+        linearize=linearize,
+        profile=request.profile
     )
     
     # החזרת מזהה המשימה
@@ -49,8 +161,85 @@ async def generate_pdf(request: PDFRequest, background_tasks: BackgroundTasks):
         message="המשימה החלה לרוץ, בדוק את הסטטוס באמצעות מזהה המשימה"
     )
 
+@router.post("/batch", response_model=PDFBatchResponse)
+async def generate_pdf_batch(request: PDFBatchRequest, background_tasks: BackgroundTasks):
+    """
+    יצירת כמה ספרים יחד: ערך שמופיע בכמה ספרים מורד ומרונדר פעם אחת בלבד
+    """
+    if not request.books or any(not book.wiki_pages for book in request.books):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="נדרש לפחות ספר אחד, ולכל ספר לפחות ערך ויקי אחד"
+        )
+    
+    batch_id = str(uuid.uuid4())
+    # הפרקים משותפים בין הספרים, ולכן האצווה תמיד מרונדרת פרק-פרק
+    books = [
+        {
+            "task_id": str(uuid.uuid4()),
+            "wiki_pages": book.wiki_pages,
+            "book_title": book.book_title,
+            "base_url": book.base_url,
+            "strict": book.strict,
+            "linearize": PDF_LINEARIZE if book.linearize is None else book.linearize,
+            "profile": book.profile
+        }
+        for book in request.books
+    ]
+    logger.info(f"New PDF batch: {batch_id} ({len(books)} books)")
+    
+    if job_queue is not None:
+        register_batch(batch_id, books, queued=True)
+        try:
+            job_queue.enqueue({"kind": "batch", "task_id": batch_id, "books": books})
+        except QueueFullError:
+            for book in books:
+                del task_status[book["task_id"]]
+            del task_status[batch_id]
+            logger.warning(f"Job queue full, rejecting batch {batch_id}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="השרת עמוס כרגע, נא לנסות שוב מאוחר יותר",
+                headers={"Retry-After": str(JOB_QUEUE_RETRY_AFTER_SECONDS)}
+            )
+        batch_status, message = "queued", "האצווה נוספה לתור, בדוק את הסטטוס באמצעות מזהה האצווה"
+    else:
+        register_batch(batch_id, books)
+        background_tasks.add_task(create_pdf_batch_async, batch_id=batch_id, books=books)
+        batch_status, message = "processing", "האצווה החלה לרוץ, בדוק את הסטטוס באמצעות מזהה האצווה"
+    
+    return PDFBatchResponse(
+        batch_id=batch_id,
+        status=batch_status,
+        message=message,
+        books=[PDFResponse(task_id=book["task_id"], status=batch_status, message=message) for book in books]
+    )
+
+@router.get("/batch/{batch_id}", response_model=PDFBatchStatus)
+async def check_batch_status(batch_id: str):
+    """
+    בדיקת סטטוס אצווה, כולל הסטטוס של כל אחד מהספרים
+    """
+    batch_data = task_status.get(batch_id)
+    if batch_data is None or batch_data.get("kind") != "batch":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="מזהה אצווה לא קיים"
+        )
+    
+    return PDFBatchStatus(
+        batch_id=batch_id,
+        status=batch_data.get("status", "unknown"),
+        message=batch_data.get("message", ""),
+        unique_chapters=batch_data.get("unique_chapters"),
+        books=[build_status(task_id, task_status.get(task_id, {})) for task_id in batch_data["books"]]
+    )
+
 @router.get("/status/{task_id}", response_model=PDFStatus)
-async def check_status(task_id: str):
+async def check_status(
+    task_id: str,
+    wait: int = Query(0, ge=0, description="long-poll: מספר שניות להמתנה לשינוי בסטטוס לפני החזרת תשובה")
+):
     """
     בדיקת סטטוס משימת המרה לפי מזהה
     """
@@ -61,15 +250,188 @@ async def check_status(task_id: str):
         )
     
     status_data = task_status[task_id]
-    return PDFStatus(
+    if wait:
+        status_data = await wait_for_status_change(
+            task_id, status_data, min(wait, STATUS_MAX_WAIT_SECONDS)
+        )
+    return build_status(task_id, status_data)
+
+@router.get("/status/{task_id}/events")
+async def stream_status(task_id: str, request: Request):
+    """
+    זרם Server-Sent Events של התקדמות המשימה, עד לסיומה
+    """
+    if task_id not in task_status:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="מזהה משימה לא קיים"
+        )
+    
+    async def event_stream():
+        last_updated = None
+        last_sent = time.monotonic()
+        while not await request.is_disconnected():
+            status_data = await asyncio.to_thread(task_status.get, task_id)
+            if status_data is None:
+                break
+            
+            if status_data.get("updated_at") != last_updated:
+                last_updated = status_data.get("updated_at")
+                payload = json.dumps(jsonable_encoder(build_status(task_id, status_data)), ensure_ascii=False)
+                yield f"data: {payload}\n\n"
+                last_sent = time.monotonic()
+                if status_data.get("status") in TERMINAL_STATUSES:
+                    break
+            elif time.monotonic() - last_sent > SSE_KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            
+            await asyncio.sleep(STATUS_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.delete("/tasks/{task_id}", response_model=PDFStatus)
+async def cancel_pdf_task(task_id: str):
+    """
+    ביטול משימת המרה: פרקים שעוד לא התחילו לא ירונדרו, ותהליכי רינדור שרצים נעצרים
+    """
+    if task_id not in task_status:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="מזהה משימה לא קיים"
+        )
+    
+    status_data = task_status[task_id]
+    if status_data.get("status") == "cancelled":
+        return build_status(task_id, status_data)
+    if status_data.get("status") in TERMINAL_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="המשימה כבר הסתיימה ולא ניתן לבטל אותה"
+        )
+    
+    # הסטטוס באחסון המשותף הוא הסימן לביטול גם עבור workers בתהליכים אחרים.
+    # המעבר מותנה, כדי שמשימה שהסתיימה בינתיים לא תסומן כמבוטלת
+    status_data = task_status.transition(task_id, ("queued", "processing"),
+                                         status="cancelled", message="המשימה בוטלה")
+    if status_data is None:
+        status_data = task_status.get(task_id, {})
+        if status_data.get("status") == "cancelled":
+            return build_status(task_id, status_data)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="המשימה כבר הסתיימה ולא ניתן לבטל אותה"
+        )
+    if status_data.get("kind") != "batch":
+        TASKS.inc(event="cancelled")
+    # ביטול אצווה מבטל את כל הספרים שלה שעוד לא הסתיימו
+    for book_id in status_data.get("books", []):
+        if task_status.transition(book_id, ("queued", "processing"),
+                                  status="cancelled", message="המשימה בוטלה") is not None:
+            TASKS.inc(event="cancelled")
+    if job_queue is not None and job_queue.cancel(task_id):
+        logger.info(f"Task {task_id} cancelled before it left the queue")
+    elif cancel_task(task_id):
+        logger.info(f"Task {task_id} cancelled while running")
+    return build_status(task_id, status_data)
+
+@router.get("/tasks/{task_id}/chapters.zip")
+async def download_chapters_zip(task_id: str):
+    """
+    הורדת כל הפרקים שכבר מוכנים כארכיון ZIP בזרימה, גם בזמן שהספר עדיין נוצר
+    """
+    status_data = task_status.get(task_id)
+    if status_data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="מזהה משימה לא קיים"
+        )
+    
+    chapters = status_data.get("chapters") or []
+    if not chapters:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="אין עדיין פרקים מוכנים להורדה"
+        )
+    
+    chapters_dir = chapters_output_dir(task_id)
+    files = [(chapter["filename"], os.path.join(chapters_dir, chapter["filename"])) for chapter in chapters]
+    zip_name = f'{(status_data.get("book_title") or task_id).replace(" ", "_")}_chapters.zip'
+    return StreamingResponse(
+        stream_zip(files),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(zip_name)}
+    )
+
+@router.get("/tasks/{task_id}/chapters/{filename}")
+async def download_chapter(task_id: str, filename: str, request: Request):
+    """
+    הורדת PDF של פרק בודד, ברגע שהוא מוכן
+    """
+    decoded_filename = urllib.parse.unquote(filename)
+    chapters_dir = chapters_output_dir(task_id)
+    file_path = os.path.join(chapters_dir, decoded_filename)
+    if os.path.dirname(os.path.realpath(file_path)) != os.path.realpath(chapters_dir) \
+            or not os.path.isfile(file_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="הפרק המבוקש לא נמצא"
+        )
+    
+    return serve_file(request, file_path, decoded_filename)
+
+@router.get("/tasks/{task_id}/profile", response_model=PDFProfile)
+async def get_task_profile(task_id: str,
+                           slow_seconds: float = Query(SLOW_CHAPTER_SECONDS, ge=0,
+                                                       description="הסף (בשניות) לפרק איטי")):
+    """
+    פרופיל הביצועים של משימה: זמן לכל שלב וציר זמן לכל פרק (בתים שהורדו, זמני הורדה
+    ורינדור, עמודים). הנתונים נשמרים בסיום המשימה
+    """
+    status_data = task_status.get(task_id)
+    if status_data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="מזהה משימה לא קיים"
+        )
+    
+    # בספר שהוא חלק מאצווה, זמני השלבים נמדדים לאצווה כולה
+    stage_timings = status_data.get("stage_timings")
+    if stage_timings is None and status_data.get("batch_id"):
+        stage_timings = task_status.get(status_data["batch_id"], {}).get("stage_timings")
+    chapters = status_data.get("chapter_timeline") or []
+    slow_chapters = sorted((chapter for chapter in chapters if chapter["busy_seconds"] >= slow_seconds),
+                           key=lambda chapter: chapter["busy_seconds"], reverse=True)
+    return PDFProfile(
         task_id=task_id,
         status=status_data.get("status", "unknown"),
-        download_url=status_data.get("download_url"),
-        message=status_data.get("message", "")
+        stage_timings=stage_timings or {},
+        chapters=chapters,
+        slow_chapter_seconds=slow_seconds,
+        slow_chapters=slow_chapters,
+        cprofile_url=f"/tasks/{task_id}/profile.prof" if status_data.get("profile_path") else None
     )
 
+@router.get("/tasks/{task_id}/profile.prof")
+async def download_task_cprofile(task_id: str, request: Request):
+    """
+    הורדת קובץ ה-cProfile של משימה שביקשה profile (לפתיחה ב-pstats או snakeviz)
+    """
+    profile_path = task_status.get(task_id, {}).get("profile_path")
+    if not profile_path or not os.path.isfile(profile_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="לא נשמר פרופיל למשימה הזו"
+        )
+    
+    return serve_file(request, profile_path, f"{task_id}.prof", media_type="application/octet-stream")
+
 @router.get("/download/{task_id}/{filename}")
-async def download_pdf(task_id: str, filename: str):
+async def download_pdf(task_id: str, filename: str, request: Request):
     """
     הורדת קובץ PDF לפי מזהה משימה ושם קובץ
     """
@@ -79,11 +441,11 @@ async def download_pdf(task_id: str, filename: str):
     decoded_filename = urllib.parse.unquote(filename)
     logger.info(f"Decoded filename: {decoded_filename}")
     # בניית הנתיב המלא
-    file_path = os.path.join('/app/output', task_id, decoded_filename)
+    file_path = os.path.join(OUTPUT_PATH, task_id, decoded_filename)
     print(f"Looking for file at: {file_path}")
     
     # בדיקה אם התיקייה קיימת
-    dir_path = os.path.join('/app/output', task_id)
+    dir_path = os.path.join(OUTPUT_PATH, task_id)
     if not os.path.exists(dir_path):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -101,16 +463,13 @@ async def download_pdf(task_id: str, filename: str):
             detail=f"הקובץ המבקש לא נמצא: {file_path}"
         )
     
-    return FileResponse(
-        path=file_path, 
-        filename=decoded_filename,
-        media_type="application/pdf"
-    )
+    # תמיכה ב-Range (המשך הורדה) ובבקשות מותנות (304)
+    return serve_file(request, file_path, decoded_filename)
     
 @router.get("/view/{task_id}/{filename}")
-async def download_pdf(task_id: str, filename: str):
+async def view_pdf(task_id: str, filename: str, request: Request):
     """
-    הורדת קובץ PDF לפי מזהה משימה ושם קובץ
+    הצגת קובץ PDF בדפדפן לפי מזהה משימה ושם קובץ
     """
    
     
@@ -118,11 +477,11 @@ async def download_pdf(task_id: str, filename: str):
     decoded_filename = urllib.parse.unquote(filename)
     logger.info(f"Decoded filename: {decoded_filename}")
     # בניית הנתיב המלא
-    file_path = os.path.join('/app/output', task_id, decoded_filename)
+    file_path = os.path.join(OUTPUT_PATH, task_id, decoded_filename)
     print(f"Looking for file at: {file_path}")
     
     # בדיקה אם התיקייה קיימת
-    dir_path = os.path.join('/app/output', task_id)
+    dir_path = os.path.join(OUTPUT_PATH, task_id)
     if not os.path.exists(dir_path):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -140,11 +499,7 @@ async def download_pdf(task_id: str, filename: str):
             detail=f"הקובץ המבקש לא נמצא: {file_path}"
         )
     
-    return FileResponse(
-        path=file_path, 
-        filename=decoded_filename,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "inline"}
-    )
+    # הספר נכתב בפורמט linearized, ועם Range הדפדפן מציג את העמוד הראשון בלי להוריד את כולו
+    return serve_file(request, file_path, decoded_filename, inline=True)
 
         
\ No newline at end of file
@@ -0,0 +1,284 @@
+import os
+import re
+import html
+import time
+import hashlib
+import mimetypes
+import threading
+import logging
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError, wait
+from html.parser import HTMLParser
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from ..config import (
+    ASSET_STORE_PATH, ASSET_STORE_FRESH_SECONDS, ASSET_FETCH_TIMEOUT, ASSET_FETCH_CONCURRENCY,
+    ASSET_WAIT_TIMEOUT
+)
+from .wiki_fetcher import get_fetcher
+from .metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# כתובת ריקה שמחליפה נכס שלא הצלחנו להוריד, כדי ש-wkhtmltopdf לא ינסה לגשת לרשת
+EMPTY_ASSET_URI = "data:,"
+
+# הפניות url(...) בתוך גיליון סגנון
+CSS_URL_PATTERN = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+# @import "..." בלי url()
+CSS_IMPORT_PATTERN = re.compile(r"""@import\s+(['"])([^'"]+)\1""")
+
+# כל כמה זמן (בשניות) נבדק abort_check בזמן ההמתנה לנכסים של דף
+ABORT_POLL_SECONDS = 0.2
+
+# מאפיין בתוך תג, לצורך החלפת הערך שלו
+ATTRIBUTE_PATTERN = r"""(\s{name}\s*=\s*)("[^"]*"|'[^']*'|[^\s>]+)"""
+
+
+class _AssetCollector(HTMLParser):
+    """איסוף התגים שמפנים לנכסים (תמונות וגיליונות סגנון) ותג ה-base"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.base_href: Optional[str] = None
+        # (שורה, עמודה, טקסט התג המקורי, שם המאפיין, הכתובת, סוג)
+        self.tags: List[Tuple[int, int, str, str, str, str]] = []
+
+    def handle_starttag(self, tag, attrs):
+        attributes = dict(attrs)
+        line, column = self.getpos()
+        if tag == "base" and attributes.get("href") and self.base_href is None:
+            self.base_href = attributes["href"]
+        elif tag == "img" and attributes.get("src"):
+            self.tags.append((line, column, self.get_starttag_text(), "src", attributes["src"], "file"))
+        elif tag == "link" and attributes.get("href") and \
+                "stylesheet" in (attributes.get("rel") or "").lower().split():
+            self.tags.append((line, column, self.get_starttag_text(), "href", attributes["href"], "css"))
+
+    handle_startendtag = handle_starttag
+
+
+class AssetStore:
+    """מאגר מקומי של תמונות וגיליונות סגנון, ממוען לפי hash של התוכן
+
+    כל נכס מורד פעם אחת (גם כשכמה פרקים מבקשים אותו במקביל) ונשמר בתיקיית objects.
+    אינדקס לפי כתובת מפנה לקובץ התוכן, כך שאותו CSS של מדיה-ויקי משמש את כל הספרים.
+    """
+
+    def __init__(self, store_dir: str = ASSET_STORE_PATH,
+                 fresh_seconds: int = ASSET_STORE_FRESH_SECONDS,
+                 fetch_timeout: float = ASSET_FETCH_TIMEOUT,
+                 concurrency: int = ASSET_FETCH_CONCURRENCY,
+                 wait_timeout: float = ASSET_WAIT_TIMEOUT):
+        self.store_dir = store_dir
+        self.fresh_seconds = fresh_seconds
+        self.fetch_timeout = fetch_timeout
+        self.wait_timeout = wait_timeout
+        self.objects_dir = os.path.join(store_dir, "objects")
+        self.index_dir = os.path.join(store_dir, "urls")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+        # תהליכונים נפרדים מתהליכוני ההורדה של הדפים, שממתינים לנכסים
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="asset-fetch")
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _index_path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.index_dir, key[:2], key)
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def lookup(self, url: str) -> Optional[str]:
+        """הנתיב המקומי של נכס שכבר הורד ועדיין עדכני, או None"""
+        index_path = self._index_path(url)
+        try:
+            if time.time() - os.path.getmtime(index_path) > self.fresh_seconds:
+                return None
+            with open(index_path, 'r', encoding='utf-8') as f:
+                path = os.path.join(self.objects_dir, f.read().strip())
+        except FileNotFoundError:
+            return None
+        return path if os.path.exists(path) else None
+
+    def get(self, url: str, kind: str = "file", localizing: FrozenSet[str] = frozenset()) -> Optional[str]:
+        """הנתיב המקומי של נכס, עם הורדה אם צריך. מחזיר None אם ההורדה נכשלה.
+        localizing הם גיליונות הסגנון שבהפניה מהם הגענו לנכס הזה (באותו תהליכון)"""
+        if url in localizing:
+            # גיליון שמפנה לעצמו (ישירות או דרך גיליון אחר) היה מחכה להורדה של עצמו
+            logger.warning(f"Skipping circular stylesheet reference to {url}")
+            return None
+        path = self.lookup(url)
+        if path is not None:
+            CACHE_REQUESTS.inc(cache="asset", result="hit")
+            return path
+
+        with self._lock:
+            future = self._in_flight.get(url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[url] = future
+
+        if not owner:
+            # פרק אחר כבר מוריד את הנכס הזה. ההמתנה מוגבלת, כי שני גיליונות שמפנים זה לזה
+            # בתהליכונים שונים מחכים זה לזה
+            CACHE_REQUESTS.inc(cache="asset", result="hit")
+            try:
+                return future.result(timeout=self.wait_timeout)
+            except TimeoutError:
+                logger.warning(f"Gave up waiting for asset {url} after {self.wait_timeout} seconds")
+                return None
+
+        CACHE_REQUESTS.inc(cache="asset", result="miss")
+
+        try:
+            path = self._download(url, kind, localizing | {url})
+        except Exception as e:
+            logger.warning(f"Error fetching asset {url}: {str(e)}")
+            path = None
+        future.set_result(path)
+        with self._lock:
+            self._in_flight.pop(url, None)
+        return path
+
+    def _download(self, url: str, kind: str, localizing: FrozenSet[str] = frozenset()) -> str:
+        """הורדת נכס ושמירתו במאגר לפי hash של התוכן"""
+        content, content_type = get_fetcher().fetch_bytes(url, timeout=self.fetch_timeout)
+        extension = os.path.splitext(urlsplit(url).path)[1].lower()
+        if kind == "css":
+            content = self._localize_css(content.decode('utf-8', errors='replace'), url,
+                                         localizing).encode('utf-8')
+            extension = ".css"
+        elif not extension or len(extension) > 5:
+            extension = mimetypes.guess_extension(content_type.split(";")[0].strip()) or ""
+
+        digest = hashlib.sha256(content).hexdigest()
+        relative_path = os.path.join(digest[:2], f"{digest}{extension}")
+        path = os.path.join(self.objects_dir, relative_path)
+        if not os.path.exists(path):
+            self._write_atomic(path, content)
+        self._write_atomic(self._index_path(url), relative_path.encode('utf-8'))
+        return path
+
+    def _localize_css(self, css: str, css_url: str, localizing: FrozenSet[str] = frozenset()) -> str:
+        """הורדת הקבצים שגיליון הסגנון מפנה אליהם (רמה אחת) והפניה אליהם מקומית.
+        localizing כולל את css_url ואת הגיליונות שהפנו אליו"""
+        def local_url(reference: str) -> Optional[str]:
+            if is_file_reference(reference, css_url):
+                return EMPTY_ASSET_URI
+            absolute = resolve_asset_url(reference, css_url)
+            if absolute is None:
+                return None
+            path = self.get(absolute, "file", localizing)
+            return f"file://{path}" if path else EMPTY_ASSET_URI
+
+        def replace_url(match) -> str:
+            local = local_url(match.group(2).strip())
+            return match.group(0) if local is None else f'url("{local}")'
+
+        def replace_import(match) -> str:
+            local = local_url(match.group(2).strip())
+            return match.group(0) if local is None else f'@import "{local}"'
+
+        css = CSS_IMPORT_PATTERN.sub(replace_import, css)
+        return CSS_URL_PATTERN.sub(replace_url, css)
+
+    def localize(self, page_html: str, page_url: str, abort_check: Optional[Callable[[], None]] = None) -> str:
+        """הורדת כל הנכסים של הדף במקביל והחלפת הכתובות שלהם בקבצים מקומיים.
+        abort_check נקרא בזמן ההמתנה להורדות; שגיאה שהוא זורק מבטלת את ההורדות שעוד לא התחילו"""
+        collector = _AssetCollector()
+        collector.feed(page_html)
+        collector.close()
+        if not collector.tags:
+            return page_html
+
+        base_url = urljoin(page_url, collector.base_href) if collector.base_href else page_url
+        resolved = [resolve_asset_url(value, base_url) for *_, value, _ in collector.tags]
+        futures = {}
+        for (*_, kind), url in zip(collector.tags, resolved):
+            if url is not None and url not in futures:
+                futures[url] = self._executor.submit(self.get, url, kind)
+        pending = set(futures.values())
+        while pending:
+            if abort_check is not None:
+                try:
+                    abort_check()
+                except BaseException:
+                    # הורדה שכבר התחילה ממשיכה, כי פרקים אחרים אולי מחכים לאותו נכס
+                    for future in pending:
+                        future.cancel()
+                    raise
+            _, pending = wait(pending, timeout=ABORT_POLL_SECONDS if abort_check is not None else None)
+        local_paths = {url: future.result() for url, future in futures.items()}
+
+        # החלפת התגים מהסוף להתחלה, כדי שהמיקומים של התגים הקודמים לא ישתנו
+        line_offsets = [0]
+        for line in page_html.splitlines(keepends=True):
+            line_offsets.append(line_offsets[-1] + len(line))
+        failed = 0
+        for (line, column, tag_text, attribute, value, kind), url in reversed(list(zip(collector.tags, resolved))):
+            if url is not None:
+                path = local_paths[url]
+            elif is_file_reference(value, base_url):
+                # רק הקבצים של המאגר מוגשים מהדיסק; הפניה של הדף עצמו לקובץ מקומי מוסרת
+                path = None
+            else:
+                continue
+            if path is None:
+                failed += 1
+            local = f"file://{path}" if path else (EMPTY_ASSET_URI if kind == "file" else "data:text/css,")
+            new_tag = re.sub(ATTRIBUTE_PATTERN.format(name=attribute),
+                             lambda match: f'{match.group(1)}"{html.escape(local)}"',
+                             tag_text, count=1)
+            if kind == "file":
+                # srcset מפנה לגרסאות ברזולוציה גבוהה ברשת
+                new_tag = re.sub(ATTRIBUTE_PATTERN.format(name="srcset"), "", new_tag)
+            start = line_offsets[line - 1] + column
+            if page_html.startswith(tag_text, start):
+                page_html = page_html[:start] + new_tag + page_html[start + len(tag_text):]
+
+        logger.debug(f"Localized {len(local_paths)} assets for {page_url} ({failed} failed)")
+        return page_html
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+def resolve_asset_url(reference: str, base_url: str) -> Optional[str]:
+    """כתובת מלאה של נכס יחסית לכתובת הבסיס, או None אם הנכס כבר מקומי"""
+    reference = reference.strip()
+    if not reference or reference.startswith(("data:", "file:", "#")):
+        return None
+    url = urljoin(base_url, reference)
+    if urlsplit(url).scheme not in ("http", "https"):
+        return None
+    return url.split("#")[0]
+
+
+def is_file_reference(reference: str, base_url: str) -> bool:
+    """האם ההפניה (ישירות או דרך כתובת הבסיס) היא לקובץ מקומי"""
+    reference = reference.strip()
+    if reference.startswith(("data:", "#")):
+        return False
+    return urlsplit(urljoin(base_url, reference)).scheme == "file"
+
+
+# מאגר משותף לכל המשימות בתהליך
+_asset_store: Optional[AssetStore] = None
+_asset_store_lock = threading.Lock()
+
+
+def get_asset_store() -> AssetStore:
+    """מחזיר את מאגר הנכסים המשותף, ויוצר אותו בפעם הראשונה"""
+    global _asset_store
+    with _asset_store_lock:
+        if _asset_store is None:
+            _asset_store = AssetStore()
+        return _asset_store
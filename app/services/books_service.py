@@ -109,7 +109,12 @@ class BooksService:
         """
         file_path = os.path.join(self.base_path, folder_name, filename)
         
-        if not os.path.exists(file_path):
+        # מניעת גישה לקבצים מחוץ לתיקיית הספרים (../)
+        base_path = os.path.realpath(self.base_path)
+        if os.path.commonpath([base_path, os.path.realpath(file_path)]) != base_path:
+            raise FileNotFoundError(f"File {folder_name}/{filename} not found")
+        
+        if not os.path.isfile(file_path):
             raise FileNotFoundError(f"File {folder_name}/{filename} not found")
         
         # קבע את סוג הקובץ
@@ -0,0 +1,158 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+import logging
+import uuid
+from typing import Any, Dict, Optional, Union
+
+from ..config import CHAPTER_CACHE_PATH, CHAPTER_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class ChapterCache:
+    """מטמון קבצי PDF של פרקים על הדיסק, עם פינוי LRU לפי גודל כולל"""
+
+    # הפינוי מוריד את המטמון לחלק הזה מהגודל המותר, כדי שסריקת הדיסק לא תרוץ בכל שמירה
+    EVICT_TO_RATIO = 0.9
+
+    def __init__(self, cache_dir: str = CHAPTER_CACHE_PATH,
+                 max_bytes: int = CHAPTER_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._evicting = False
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = self._scan()[1]
+
+    @staticmethod
+    def make_key(base_url: str, title: str, revision: Any, options: Dict[str, Any]) -> str:
+        """מפתח מטמון לפי כתובת הבסיס, שם הדף, מזהה הגרסה והגדרות הרינדור"""
+        raw = json.dumps([base_url, title, revision, options], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    def _scan(self):
+        """סריקת המטמון: רשימת קבצים (זמן גישה, גודל, נתיב) וגודל כולל"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.pdf'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def contains(self, key: str) -> bool:
+        """בדיקה אם הפרק קיים במטמון, וספירת פגיעה/החטאה"""
+        found = os.path.exists(self._path(key))
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def read(self, key: str) -> Optional[bytes]:
+        """קריאת פרק מהמטמון ועדכון זמן הגישה שלו. מחזיר None אם הוא פונה בינתיים"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, source: Union[str, bytes]) -> None:
+        """שמירת פרק שרונדר במטמון (נתיב לקובץ PDF או ה-bytes שלו)"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        if isinstance(source, bytes):
+            with open(temp_path, 'wb') as f:
+                f.write(source)
+        else:
+            shutil.copyfile(source, temp_path)
+        size = os.path.getsize(temp_path)
+
+        with self._lock:
+            # פרק שכבר היה במטמון (למשל שני רינדורים מקבילים של אותו פרק) מוחלף, ולא נספר פעמיים
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(temp_path, path)
+            self._size += size - replaced
+            # פינוי אחד בכל פעם, מחוץ למנעול, כדי שתהליכוני הרינדור לא יחכו לסריקת הדיסק
+            evict = self._size > self.max_bytes and not self._evicting
+            if evict:
+                self._evicting = True
+                size_before = self._size
+
+        if evict:
+            try:
+                total = self._evict()
+                with self._lock:
+                    # שמירות שהגיעו בזמן הפינוי נשארות בספירה
+                    self._size = total + (self._size - size_before)
+            finally:
+                with self._lock:
+                    self._evicting = False
+
+    def _evict(self) -> int:
+        """מחיקת הפרקים שלא נעשה בהם שימוש הכי הרבה זמן, עד שהמטמון יורד מתחת לגודל המותר
+        (EVICT_TO_RATIO ממנו). מחזיר את הגודל אחרי הפינוי"""
+        target = int(self.max_bytes * self.EVICT_TO_RATIO)
+        entries, total = self._scan()
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                continue
+        logger.info(f"Evicted {removed} chapters from cache (size now {total} bytes)")
+        return total
+
+    def stats(self) -> dict:
+        """מוני פגיעות והחטאות וגודל המטמון"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# מטמון משותף לכל המשימות בתהליך
+_chapter_cache: Optional[ChapterCache] = None
+_chapter_cache_lock = threading.Lock()
+
+
+def get_chapter_cache() -> ChapterCache:
+    """מחזיר את מטמון הפרקים המשותף, ויוצר אותו בפעם הראשונה"""
+    global _chapter_cache
+    with _chapter_cache_lock:
+        if _chapter_cache is None:
+            _chapter_cache = ChapterCache()
+        return _chapter_cache
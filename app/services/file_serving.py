@@ -0,0 +1,192 @@
+import os
+import time
+import zipfile
+import logging
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from ..config import FILE_CACHE_MAX_AGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# גודל הקריאה מהקובץ בהגשת טווח או קובץ שלם
+CHUNK_SIZE = 256 * 1024
+
+
+class RangeNotSatisfiableError(Exception):
+    """הטווח המבוקש מחוץ לקובץ"""
+
+
+def file_etag(stat: os.stat_result) -> str:
+    """ETag לפי זמן השינוי והגודל. הקבצים נכתבים באופן אטומי, ולכן כל שינוי בתוכן משנה אותו"""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """השוואה חלשה של ETag מול כותרת If-None-Match"""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().replace("W/", "", 1) == etag for tag in header.split(","))
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return since is not None and int(mtime) <= since.timestamp()
+
+
+def _if_range_matches(header: str, etag: str, mtime: float) -> bool:
+    """השוואה חזקה של If-Range (RFC 9110): ה-ETag בדיוק, או בדיוק תאריך ה-Last-Modified.
+    ETag חלש (W/) אף פעם לא מתאים"""
+    header = header.strip()
+    if header.startswith(('"', 'W/')):
+        return header == etag
+    try:
+        date = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return date is not None and date.timestamp() == int(mtime)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """פענוח כותרת Range עם טווח יחיד. מחזיר (התחלה, סוף כולל), או None אם צריך להחזיר את כל הקובץ"""
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        # יחידות אחרות וטווחים מרובים לא נתמכים: מוחזר הקובץ כולו
+        return None
+    start_text, _, end_text = ranges.strip().partition("-")
+    try:
+        if not start_text:
+            # bytes=-N: N הבתים האחרונים
+            length = int(end_text)
+            if length <= 0:
+                raise RangeNotSatisfiableError(header)
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiableError(header)
+    return start, min(end, size - 1)
+
+
+def _read_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def content_disposition(filename: str, inline: bool = False) -> str:
+    """כותרת Content-Disposition עם שם קובץ (גם בעברית)"""
+    disposition = "inline" if inline else "attachment"
+    if quote(filename) == filename:
+        return f'{disposition}; filename="{filename}"'
+    return f"{disposition}; filename*=utf-8''{quote(filename)}"
+
+
+def serve_file(request: Request, path: str, filename: str,
+               media_type: str = "application/pdf", inline: bool = False,
+               max_age: int = FILE_CACHE_MAX_AGE_SECONDS) -> Response:
+    """הגשת קובץ עם ETag ו-Last-Modified (תשובת 304 לבקשה מותנית) ותמיכה ב-Range (תשובת 206)"""
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": f"public, max-age={max_age}",
+        "Content-Disposition": content_disposition(filename, inline),
+    }
+
+    # בקשה מותנית: If-None-Match קודם ל-If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        not_modified = if_modified_since is not None and _not_modified_since(if_modified_since, stat.st_mtime)
+    if not_modified:
+        del headers["Content-Disposition"]
+        return Response(status_code=304, headers=headers)
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header:
+        # If-Range: הטווח תקף רק אם הקובץ לא השתנה מאז ההורדה החלקית
+        if_range = request.headers.get("if-range")
+        if if_range is None or _if_range_matches(if_range, etag, stat.st_mtime):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiableError:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_read_file(path, 0, size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+    logger.debug(f"Serving bytes {start}-{end} of {path}")
+    return StreamingResponse(_read_file(path, start, length), status_code=206,
+                             media_type=media_type, headers=headers)
+
+
+class _ZipOutput:
+    """יעד כתיבה ל-zipfile שאוסף את הבתים עד שהם נשלחים ללקוח. אין לו seek,
+    ולכן zipfile כותב את הגדלים ב-data descriptor אחרי כל קובץ"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files: List[Tuple[str, str]]) -> Iterator[bytes]:
+    """ארכיון ZIP בזרימה של (שם בארכיון, נתיב) בלי לבנות אותו בזיכרון או בדיסק.
+    הקבצים נשמרים בלי דחיסה (ZIP_STORED), כי PDF כבר דחוס"""
+    output = _ZipOutput()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for arcname, path in files:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # הקובץ נמחק מאז שהרשימה נבנתה
+                continue
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime(stat.st_mtime)[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = stat.st_size
+            with open(path, 'rb') as source, archive.open(info, 'w') as target:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    yield output.drain()
+            yield output.drain()
+    # הספרייה המרכזית של הארכיון נכתבת בסגירה
+    yield output.drain()
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+import uuid
+from typing import Any, Dict, Optional
+
+from ..config import HTML_CACHE_PATH, HTML_CACHE_FRESH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class HtmlCache:
+    """מטמון מקומי של HTML מהויקי, יחד עם ה-ETag וה-Last-Modified לבדיקה מותנית"""
+
+    def __init__(self, cache_dir: str = HTML_CACHE_PATH,
+                 fresh_seconds: int = HTML_CACHE_FRESH_SECONDS):
+        self.cache_dir = cache_dir
+        self.fresh_seconds = fresh_seconds
+        self.fresh_hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        directory = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(directory, f"{key}.html"), os.path.join(directory, f"{key}.json")
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def load(self, url: str) -> Optional[Dict[str, Any]]:
+        """טעינת רשומה מהמטמון: גוף הדף, ETag, Last-Modified וזמן הבדיקה האחרון"""
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(body_path, 'r', encoding='utf-8') as f:
+                entry["body"] = f.read()
+            return entry
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        """האם הרשומה בתוך חלון הרעננות, שבו לא פונים לרשת בכלל"""
+        return time.time() - entry.get("checked_at", 0) < self.fresh_seconds
+
+    def conditional_headers(self, entry: Dict[str, Any]) -> Dict[str, str]:
+        """כותרות If-None-Match / If-Modified-Since לבדיקה מחדש מול השרת"""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url: str, body: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        """שמירת גוף הדף והכותרות שלו"""
+        body_path, meta_path = self._paths(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        meta = {"url": url, "etag": etag, "last_modified": last_modified, "checked_at": time.time()}
+        self._write_atomic(body_path, body.encode('utf-8'))
+        self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+    def mark_revalidated(self, url: str, entry: Dict[str, Any]) -> None:
+        """עדכון זמן הבדיקה אחרי תשובת 304"""
+        _, meta_path = self._paths(url)
+        meta = {key: value for key, value in entry.items() if key != "body"}
+        meta["checked_at"] = time.time()
+        self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+    def count(self, outcome: str) -> None:
+        """ספירת תוצאת גישה למטמון: fresh_hits, revalidated או misses"""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self) -> dict:
+        """מוני גישה למטמון"""
+        with self._lock:
+            return {
+                "fresh_hits": self.fresh_hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+            }
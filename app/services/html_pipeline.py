@@ -0,0 +1,114 @@
+import logging
+from typing import Any, Dict, List, Tuple
+
+import lxml.html
+from lxml import etree
+
+from ..config import (
+    HTML_STRIP_TAGS, HTML_STRIP_CLASSES, HTML_STRIP_HIDDEN, HTML_STRIP_REFERENCES
+)
+
+logger = logging.getLogger(__name__)
+
+# רכיבי ההערות של מדיה-ויקי: רשימות ההערות וההפניות אליהן בגוף הטקסט
+REFERENCE_CLASSES = ["references", "mw-references-wrap", "reflist", "reference"]
+
+
+def _class_xpath(classes: List[str]) -> str:
+    """ביטוי XPath לרכיבים שיש להם אחת מהמחלקות"""
+    return " | ".join(
+        f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]" for name in classes
+    )
+
+
+def _attached(element, root) -> bool:
+    """האם הרכיב עדיין נמצא בתוך המסמך"""
+    while element.getparent() is not None:
+        element = element.getparent()
+    return element is root
+
+
+class HtmlPipeline:
+    """עיבוד ה-HTML של דף לפני הרינדור, על גבי מנתח HTML אמיתי (lxml)
+
+    מסיר תגים ומחלקות מרשימת החסימה (ואופציונלית את ההערות), ומשלב את כותרת הפרק
+    בתחילת ה-body.
+    """
+
+    def __init__(self, strip_tags: List[str] = HTML_STRIP_TAGS,
+                 strip_classes: List[str] = HTML_STRIP_CLASSES,
+                 strip_hidden: bool = HTML_STRIP_HIDDEN,
+                 strip_references: bool = HTML_STRIP_REFERENCES):
+        self.strip_tags = list(strip_tags)
+        self.strip_classes = list(strip_classes)
+        self.strip_hidden = strip_hidden
+        self.strip_references = strip_references
+
+        selectors = [f"//{tag}" for tag in self.strip_tags]
+        classes = self.strip_classes + (REFERENCE_CLASSES if strip_references else [])
+        if classes:
+            selectors.append(_class_xpath(classes))
+        if strip_hidden:
+            selectors.append("//*[contains(translate(@style, ' ', ''), 'display:none')]")
+        self._strip_xpath = etree.XPath(" | ".join(selectors)) if selectors else None
+
+    def options(self) -> Dict[str, Any]:
+        """הגדרות העיבוד, לצורך מפתח המטמון של הפרקים"""
+        return {
+            "strip_tags": self.strip_tags,
+            "strip_classes": self.strip_classes,
+            "strip_hidden": self.strip_hidden,
+            "strip_references": self.strip_references,
+        }
+
+    @staticmethod
+    def _parse(html: str):
+        return lxml.html.document_fromstring(html)
+
+    @staticmethod
+    def _serialize(document, source_html: str) -> str:
+        # lxml מוסיף DOCTYPE של HTML 4 למסמך שאין לו, ולכן שומרים אותו רק אם היה במקור
+        has_doctype = source_html.lstrip()[:9].lower() == "<!doctype"
+        doctype = document.getroottree().docinfo.doctype if has_doctype else None
+        return lxml.html.tostring(document, encoding="unicode", doctype=doctype)
+
+    def slim(self, html: str) -> Tuple[str, Dict[str, int]]:
+        """הסרת הרכיבים שלא תורמים לספר. מחזיר את ה-HTML ומוני הגודל"""
+        stats = {"input_bytes": len(html.encode('utf-8')), "output_bytes": 0, "removed_elements": 0}
+        if self._strip_xpath is None:
+            stats["output_bytes"] = stats["input_bytes"]
+            return html, stats
+
+        try:
+            document = self._parse(html)
+        except (etree.ParserError, ValueError) as e:
+            logger.warning(f"Could not parse page HTML, rendering it as-is: {str(e)}")
+            stats["output_bytes"] = stats["input_bytes"]
+            return html, stats
+
+        for element in self._strip_xpath(document):
+            # רכיב שכבר הוסר יחד עם רכיב שמכיל אותו
+            if not _attached(element, document):
+                continue
+            element.drop_tree()
+            stats["removed_elements"] += 1
+
+        html = self._serialize(document, html)
+        stats["output_bytes"] = len(html.encode('utf-8'))
+        return html, stats
+
+    def inject_header(self, html: str, header_html: str) -> str:
+        """שילוב כותרת הפרק בתחילת ה-body של הדף"""
+        try:
+            document = self._parse(html)
+        except (etree.ParserError, ValueError) as e:
+            logger.warning(f"Could not parse page HTML, prepending header: {str(e)}")
+            return header_html + html
+
+        body = document.body
+        header = lxml.html.fragment_fromstring(header_html.strip())
+        # הטקסט שהיה בתחילת ה-body יופיע אחרי הכותרת
+        header.tail = body.text
+        body.text = None
+        body.insert(0, header)
+        return self._serialize(document, html)
@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import uuid
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from ..config import JOB_QUEUE_PATH, JOB_QUEUE_MAX_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """התור מלא ואין מקום לעבודות חדשות"""
+
+
+class JobQueue:
+    """תור עבודות עמיד על הדיסק, משותף לשרת ה-API ול-workers (גם במכונות אחרות עם אותו אחסון)
+
+    כל עבודה היא קובץ JSON בתיקיית pending. worker תופס עבודה ע"י העברה אטומית
+    (rename) לתיקיית running, ומעדכן את זמן השינוי של הקובץ כסימן חיים.
+    """
+
+    def __init__(self, queue_dir: str = JOB_QUEUE_PATH, max_depth: int = JOB_QUEUE_MAX_DEPTH):
+        self.queue_dir = queue_dir
+        self.max_depth = max_depth
+        self.pending_dir = os.path.join(queue_dir, "pending")
+        self.running_dir = os.path.join(queue_dir, "running")
+        os.makedirs(self.pending_dir, exist_ok=True)
+        os.makedirs(self.running_dir, exist_ok=True)
+
+    def depth(self) -> int:
+        """מספר העבודות שממתינות בתור"""
+        return len([name for name in os.listdir(self.pending_dir) if name.endswith('.json')])
+
+    def running(self) -> int:
+        """מספר העבודות שנמצאות כרגע בטיפול"""
+        return len([name for name in os.listdir(self.running_dir) if name.endswith('.json')])
+
+    def enqueue(self, job: Dict[str, Any]) -> str:
+        """הוספת עבודה לסוף התור"""
+        if self.depth() >= self.max_depth:
+            raise QueueFullError(f"Job queue is full ({self.max_depth} jobs)")
+
+        job_id = job.get("task_id") or str(uuid.uuid4())
+        # שם הקובץ מתחיל בזמן ההוספה, כך שמיון לפי שם שומר על סדר FIFO
+        name = f"{time.time_ns()}_{job_id}.json"
+        temp_path = os.path.join(self.queue_dir, f".{name}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({**job, "job_id": job_id, "enqueued_at": time.time()}, f, ensure_ascii=False)
+        os.rename(temp_path, os.path.join(self.pending_dir, name))
+        logger.info(f"Enqueued job {job_id} (queue depth: {self.depth()})")
+        return job_id
+
+    def claim(self) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """תפיסת העבודה הוותיקה ביותר בתור. מחזיר (שם קובץ, עבודה) או None"""
+        for name in sorted(os.listdir(self.pending_dir)):
+            if not name.endswith('.json'):
+                continue
+            running_path = os.path.join(self.running_dir, name)
+            try:
+                os.rename(os.path.join(self.pending_dir, name), running_path)
+            except FileNotFoundError:
+                # worker אחר תפס את העבודה קודם
+                continue
+            os.utime(running_path)
+            with open(running_path, 'r', encoding='utf-8') as f:
+                return name, json.load(f)
+        return None
+
+    def cancel(self, job_id: str) -> bool:
+        """הסרת עבודה שעוד ממתינה בתור. מחזיר False אם היא כבר נתפסה או לא קיימת"""
+        for name in os.listdir(self.pending_dir):
+            if name.endswith(f"_{job_id}.json"):
+                try:
+                    os.remove(os.path.join(self.pending_dir, name))
+                except FileNotFoundError:
+                    # worker תפס את העבודה בינתיים
+                    return False
+                logger.info(f"Removed job {job_id} from the queue")
+                return True
+        return False
+
+    def heartbeat(self, name: str) -> None:
+        """סימן חיים לעבודה בטיפול, כדי שלא תוחזר לתור"""
+        try:
+            os.utime(os.path.join(self.running_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, name: str) -> None:
+        """הסרת עבודה שהסתיימה"""
+        try:
+            os.remove(os.path.join(self.running_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def requeue_stale(self, stale_seconds: float) -> int:
+        """החזרה לתור של עבודות שה-worker שלהן הפסיק לשלוח סימני חיים"""
+        requeued = 0
+        now = time.time()
+        for name in os.listdir(self.running_dir):
+            path = os.path.join(self.running_dir, name)
+            try:
+                if now - os.path.getmtime(path) > stale_seconds:
+                    os.rename(path, os.path.join(self.pending_dir, name))
+                    requeued += 1
+                    logger.warning(f"Requeued stale job {name}")
+            except FileNotFoundError:
+                continue
+        return requeued
@@ -0,0 +1,310 @@
+"""מדדים בפורמט Prometheus: מונים, מדים והיסטוגרמות בזיכרון של התהליך.
+
+עדכון מדד הוא פעולה על מילון תחת נעילה, בלי I/O, כדי שלא יאט את הצנרת. כשיש כמה תהליכים
+(workers נפרדים, כמה תהליכי API) כל תהליך כותב תמונת מצב של המדדים שלו לקובץ בתיקייה
+משותפת פעם ב-METRICS_FLUSH_SECONDS, ונתיב /metrics מאחד את כל הקבצים - בדומה למצב
+multiprocess של prometheus_client, בלי תלות בחבילה.
+"""
+import atexit
+import bisect
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ..config import METRICS_PATH, METRICS_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "wikipdf_"
+
+# גבולות ברירת המחדל (בשניות) להיסטוגרמות זמן: מהורדת דף ועד רינדור של ספר שלם
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelValues = Tuple[str, ...]
+
+
+class Metric:
+    """בסיס למדד עם תוויות. הערכים נשמרים לפי צירוף ערכי התוויות"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional["MetricsRegistry"] = None):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, Any] = {}
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "samples": [[list(key), value] for key, value in self.samples()],
+        }
+
+
+class Counter(Metric):
+    """מונה שרק עולה"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """מד שעולה ויורד, או שמחושב בזמן הקריאה מפונקציה.
+    aggregate קובע איך מאחדים בין תהליכים: sum - לערך של כל תהליך (למשל תהליכי רינדור),
+    max - לערך משותף שכל תהליך קורא בעצמו (למשל עומק התור)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 aggregate: str = "sum", registry: Optional["MetricsRegistry"] = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.aggregate = aggregate
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """חישוב הערך (ללא תוויות) רק כשהמדדים נקראים"""
+        self._function = function
+
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        if self._function is None:
+            return super().samples()
+        try:
+            return [((), float(self._function()))]
+        except Exception as e:
+            logger.warning(f"Error reading gauge {self.name}: {str(e)}")
+            return []
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**super().snapshot(), "aggregate": self.aggregate}
+
+
+class Histogram(Metric):
+    """התפלגות של ערכים (בדרך כלל זמנים) לפי גבולות קבועים"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional["MetricsRegistry"] = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._values.get(key)
+            if sample is None:
+                # מונה לכל גבול ועוד אחד ל-+Inf; הצבירה נעשית רק בזמן הייצוא
+                sample = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            sample["counts"][index] += 1
+            sample["sum"] += value
+
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        with self._lock:
+            return [(key, {"counts": list(value["counts"]), "sum": value["sum"]})
+                    for key, value in self._values.items()]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**super().snapshot(), "buckets": list(self.buckets)}
+
+
+class MetricsRegistry:
+    """כל המדדים של התהליך, ואיחוד שלהם עם תמונות המצב של תהליכים אחרים"""
+
+    def __init__(self, path: str = METRICS_PATH, flush_seconds: float = METRICS_FLUSH_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._process_file = f"{socket.gethostname()}-{os.getpid()}.json"
+
+    def register(self, metric: Metric) -> None:
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def flush(self) -> None:
+        """כתיבת תמונת המצב של התהליך לתיקייה המשותפת (כתיבה אטומית)"""
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, self._process_file)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, path)
+
+    def start_flusher(self) -> None:
+        """כתיבה תקופתית של המדדים ברקע, ובסיום התהליך"""
+        with self._lock:
+            if not self.path or self._flusher is not None:
+                return
+            # תהליך שנוצר ב-fork ממשיך עם קובץ משלו
+            self._process_file = f"{socket.gethostname()}-{os.getpid()}.json"
+            self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flusher", daemon=True)
+            self._flusher.start()
+        atexit.register(self._safe_flush)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            self._safe_flush()
+
+    def _safe_flush(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning(f"Error writing metrics to {self.path}: {str(e)}")
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """המדדים של התהליך הנוכחי ושל כל התהליכים האחרים שכתבו לתיקייה המשותפת.
+        מונים והיסטוגרמות נסכמים (גם של תהליכים שהסתיימו); מדים - רק של תהליכים פעילים"""
+        merged = self.snapshot()
+        if not self.path or not os.path.isdir(self.path):
+            return merged
+        stale_before = time.time() - 3 * self.flush_seconds
+        for name in os.listdir(self.path):
+            if not name.endswith(".json") or name == self._process_file:
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                stale = os.path.getmtime(path) < stale_before
+                with open(path, encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric_name, metric in snapshot.items():
+                if metric["kind"] == "gauge" and stale:
+                    continue
+                target = merged.setdefault(metric_name, {**metric, "samples": []})
+                _merge_samples(target, metric)
+        return merged
+
+    def render(self) -> str:
+        """ייצוא המדדים בפורמט הטקסט של Prometheus"""
+        metrics = self.collect()
+        add_cache_hit_ratio(metrics)
+        lines: List[str] = []
+        for name in sorted(metrics):
+            metric = metrics[name]
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            for key, value in metric["samples"]:
+                labels = list(zip(metric["labelnames"], key))
+                if metric["kind"] != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(metric["buckets"]) + [math.inf], value["counts"]):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge_samples(target: Dict[str, Any], metric: Dict[str, Any]) -> None:
+    """הוספת הערכים של מדד מתהליך אחר לערכים המאוחדים"""
+    samples = {tuple(key): value for key, value in target["samples"]}
+    for key, value in metric["samples"]:
+        key = tuple(key)
+        current = samples.get(key)
+        if current is None:
+            samples[key] = value
+        elif metric["kind"] == "histogram":
+            samples[key] = {"counts": [a + b for a, b in zip(current["counts"], value["counts"])],
+                            "sum": current["sum"] + value["sum"]}
+        elif metric.get("aggregate") == "max":
+            samples[key] = max(current, value)
+        else:
+            samples[key] = current + value
+    target["samples"] = [[list(key), value] for key, value in samples.items()]
+
+
+def _format_labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def add_cache_hit_ratio(metrics: Dict[str, Dict[str, Any]]) -> None:
+    """חישוב אחוז הפגיעה של כל מטמון מהמונה המאוחד של הגישות"""
+    requests = metrics.get(CACHE_REQUESTS.name)
+    if not requests:
+        return
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), value in requests["samples"]:
+        hits_and_total = totals.setdefault(cache, [0, 0])
+        hits_and_total[1] += value
+        if result == "hit":
+            hits_and_total[0] += value
+    metrics[PREFIX + "cache_hit_ratio"] = {
+        "kind": "gauge",
+        "help": "Share of cache lookups served from the cache, since the processes started",
+        "labelnames": ["cache"],
+        "samples": [[[cache], hits / total] for cache, (hits, total) in totals.items() if total],
+    }
+
+
+REGISTRY = MetricsRegistry()
+
+# מדדי הצנרת
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds", "Duration of a single pipeline stage run (per chapter or per book)", ["stage"]
+)
+TASKS = Counter("tasks_total", "Book tasks by lifecycle event (started, completed, failed, cancelled)", ["event"])
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by cache (chapter, html, asset) and result",
+                         ["cache", "result"])
+FETCHED_BYTES = Counter("fetched_bytes_total", "Bytes downloaded from the wiki, by kind (html, asset, json)", ["kind"])
+WRITTEN_BYTES = Counter("written_bytes_total", "Bytes of PDF written to the output directory, by kind (book, chapter)",
+                        ["kind"])
+RENDER_PROCESSES = Gauge("renderer_processes_active", "Renderer processes currently rendering")
+QUEUE_DEPTH = Gauge("queue_jobs_pending", "Jobs waiting in the job queue", aggregate="max")
+QUEUE_RUNNING = Gauge("queue_jobs_running", "Jobs claimed by a worker and still running", aggregate="max")
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency by route and method",
+                                 ["route", "method"])
@@ -0,0 +1,49 @@
+import os
+import shutil
+import subprocess
+import logging
+import uuid
+from typing import Optional
+
+from ..config import QPDF_PATH, LINEARIZE_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# qpdf מחזיר 3 כשהקובץ נכתב בהצלחה אבל היו אזהרות
+QPDF_EXIT_WARNINGS = 3
+
+
+def find_qpdf() -> Optional[str]:
+    """הנתיב של qpdf, או None אם הוא לא מותקן"""
+    return shutil.which(QPDF_PATH)
+
+
+def linearize_pdf(path: str, timeout: float = LINEARIZE_TIMEOUT_SECONDS) -> bool:
+    """כתיבה מחדש של PDF בפורמט linearized, כך שהעמוד הראשון מוצג לפני שכל הקובץ הורד.
+    מחזיר False (והקובץ המקורי נשאר) אם qpdf לא מותקן או נכשל"""
+    qpdf = find_qpdf()
+    if qpdf is None:
+        logger.warning(f"qpdf not found, leaving {path} non-linearized")
+        return False
+
+    temp_path = f"{path}.{uuid.uuid4().hex[:8]}.linearized"
+    try:
+        result = subprocess.run(
+            [qpdf, "--linearize", path, temp_path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+        )
+        if result.returncode not in (0, QPDF_EXIT_WARNINGS) or not os.path.exists(temp_path):
+            logger.error(f"qpdf failed to linearize {path}: {result.stderr.decode('utf-8', errors='replace')}")
+            return False
+        os.replace(temp_path, path)
+    except subprocess.TimeoutExpired:
+        logger.error(f"qpdf did not finish linearizing {path} within {timeout} seconds")
+        return False
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    logger.info(f"Linearized {path} ({os.path.getsize(path)} bytes)")
+    return True
@@ -0,0 +1,70 @@
+import os
+import shutil
+import threading
+import logging
+import uuid
+from typing import Union
+
+from ..config import RENDER_MEMORY_BUDGET_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class PdfScratch:
+    """קבצי PDF של פרקים שממתינים למיזוג: בזיכרון עד תקציב הזיכרון, ומעבר לו בתיקיית עבודה.
+
+    keep מחזיר את ה-bytes עצמם או נתיב לקובץ, ושניהם מתאימים ל-StreamingPdfWriter.append.
+    תיקיית העבודה היא tmpfs כשיש, ואם היא מלאה הקבצים נכתבים לתיקיית הגיבוי.
+    """
+
+    def __init__(self, scratch_dir: str, fallback_dir: str,
+                 budget_bytes: int = RENDER_MEMORY_BUDGET_BYTES):
+        self.scratch_dir = scratch_dir
+        self.fallback_dir = fallback_dir
+        self.budget_bytes = budget_bytes
+        self._held = 0
+        self._lock = threading.Lock()
+
+    @property
+    def held_bytes(self) -> int:
+        return self._held
+
+    def keep(self, data: bytes) -> Union[bytes, str]:
+        """שמירת PDF של פרק עד המיזוג"""
+        with self._lock:
+            if self._held + len(data) <= self.budget_bytes:
+                self._held += len(data)
+                return data
+        return self._spill(data)
+
+    def _spill(self, data: bytes) -> str:
+        """כתיבת PDF לתיקיית העבודה, או לתיקיית הגיבוי אם אין בה מקום"""
+        error = None
+        for directory in (self.scratch_dir, self.fallback_dir):
+            path = os.path.join(directory, f"chapter_{uuid.uuid4().hex}.pdf")
+            try:
+                os.makedirs(directory, exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                return path
+            except OSError as e:
+                logger.warning(f"Could not write scratch file in {directory}: {str(e)}")
+                error = e
+                if os.path.exists(path):
+                    os.remove(path)
+        raise error
+
+    def release(self, item: Union[bytes, str]) -> None:
+        """שחרור PDF של פרק אחרי שמוזג לספר"""
+        if isinstance(item, bytes):
+            with self._lock:
+                self._held -= len(item)
+            return
+        try:
+            os.remove(item)
+        except FileNotFoundError:
+            pass
+
+    def cleanup(self) -> None:
+        """מחיקת תיקיית העבודה של המשימה"""
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
@@ -0,0 +1,310 @@
+import io
+import os
+import zlib
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject,
+    IndirectObject, NameObject, NumberObject, StreamObject, create_string_object
+)
+
+from ..config import PDF_DEDUPLICATE, PDF_COMPRESS_STREAMS
+
+logger = logging.getLogger(__name__)
+
+# סוגי מילונים שאפשר לשתף בין פרקים כשהם זהים (משאבים, לא אובייקטים עם זהות)
+SHARED_DICTIONARY_TYPES = ("/Font", "/FontDescriptor", "/ExtGState", "/Encoding")
+
+# מאפייני עמוד שעוברים בירושה מעץ העמודים, ויש להעתיק אותם לעמוד עצמו
+INHERITABLE_PAGE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+class StreamingPdfWriter:
+    """כותב PDF שמוסיף פרקים לקובץ הפלט אחד אחרי השני, בלי להחזיק את כל הספר בזיכרון
+
+    כל אובייקט של פרק נכתב לדיסק מיד עם העתקתו, עם מספור חדש. בזיכרון נשמרים רק
+    המיקומים של האובייקטים בקובץ ורשימת העמודים, לצורך טבלת ה-xref בסוף.
+    גופנים, תמונות ו-XObjects זהים בין פרקים נכתבים פעם אחת בלבד (לפי hash של התוכן),
+    וזרמים לא דחוסים נדחסים ב-Flate.
+
+    קישורים חיצוניים לכתובות שנרשמו ב-add_link_target הופכים לקישורים פנימיים לעמוד,
+    וסימניות שנרשמו ב-add_bookmark נכתבות כעץ ה-outline של הספר.
+    """
+
+    def __init__(self, output_path: str, deduplicate: bool = PDF_DEDUPLICATE,
+                 compress: bool = PDF_COMPRESS_STREAMS):
+        self.output_path = output_path
+        self.deduplicate = deduplicate
+        self.compress = compress
+        self._file = open(output_path, 'wb')
+        # מיקום כל אובייקט בקובץ לפי המספר שלו (אובייקט 0 שמור)
+        self._offsets: List[Union[int, None]] = [None]
+        self._page_ids: List[int] = []
+        # hash של אובייקט משותף -> המספר שלו בספר
+        self._shared: Dict[bytes, int] = {}
+        self._input_bytes = 0
+        self._deduplicated = 0
+        self._compressed = 0
+        # כתובת קישור -> מספר העמוד שאליו הוא מוביל
+        self._link_targets: Dict[str, int] = {}
+        # (כותרת, מספר העמוד)
+        self._bookmarks: List[Tuple[str, int]] = []
+        self._file.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self._pages_id = self._reserve()
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_ids)
+
+    def add_link_target(self, uri: str, page_index: int) -> None:
+        """קישורים לכתובת הזו בקבצים שיתווספו מכאן והלאה יובילו לעמוד שבמיקום הנתון"""
+        self._link_targets[uri.rstrip("/")] = self._page_ids[page_index]
+
+    def add_bookmark(self, title: str, page_index: int) -> None:
+        """סימנייה בעץ ה-outline לעמוד שבמיקום הנתון"""
+        self._bookmarks.append((title, self._page_ids[page_index]))
+
+    @staticmethod
+    def _page_destination(page_id: int) -> ArrayObject:
+        return ArrayObject([IndirectObject(page_id, 0, None), NameObject("/Fit")])
+
+    def _internal_link(self, action: DictionaryObject) -> Optional[DictionaryObject]:
+        """פעולת GoTo במקום פעולת URI לכתובת שנרשמה כקישור פנימי"""
+        if action.get("/S") != "/URI" or "/URI" not in action:
+            return None
+        uri = action["/URI"]
+        uri = uri.decode('latin-1') if isinstance(uri, bytes) else str(uri)
+        page_id = self._link_targets.get(uri.rstrip("/"))
+        if page_id is None:
+            return None
+        return DictionaryObject({
+            NameObject("/S"): NameObject("/GoTo"),
+            NameObject("/D"): self._page_destination(page_id),
+        })
+
+    def _reserve(self) -> int:
+        """הקצאת מספר לאובייקט חדש"""
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def _write_object(self, obj_id: int, obj) -> None:
+        self._offsets[obj_id] = self._file.tell()
+        self._file.write(f"{obj_id} 0 obj\n".encode('ascii'))
+        obj.write_to_stream(self._file, None)
+        self._file.write(b"\nendobj\n")
+
+    def _shareable(self, obj) -> bool:
+        """האם אובייקט זהה מפרק אחר יכול להחליף את האובייקט הזה"""
+        if isinstance(obj, (StreamObject, ArrayObject)):
+            return True
+        return isinstance(obj, DictionaryObject) and obj.get("/Type") in SHARED_DICTIONARY_TYPES
+
+    def _copy_indirect(self, ref: IndirectObject, id_map: Dict[Tuple[int, int], int],
+                       pending: Dict[Tuple[int, int], Optional[int]]) -> int:
+        """העתקת אובייקט עקיף אחרי האובייקטים שהוא מפנה אליהם, כדי שאפשר יהיה לזהות כפילויות"""
+        key = (ref.idnum, ref.generation)
+        if key in id_map:
+            return id_map[key]
+        if key in pending:
+            # הפניה מעגלית: האובייקט מקבל מספר מיד, ולא ישותף
+            if pending[key] is None:
+                pending[key] = self._reserve()
+            return pending[key]
+
+        pending[key] = None
+        copied = self._copy(ref.get_object(), id_map, pending)
+        reserved = pending.pop(key)
+
+        digest = None
+        if reserved is None and self.deduplicate and self._shareable(copied):
+            buffer = io.BytesIO()
+            copied.write_to_stream(buffer, None)
+            digest = hashlib.sha256(buffer.getvalue()).digest()
+            if digest in self._shared:
+                self._deduplicated += 1
+                id_map[key] = self._shared[digest]
+                return id_map[key]
+
+        obj_id = reserved if reserved is not None else self._reserve()
+        self._write_object(obj_id, copied)
+        if digest is not None:
+            self._shared[digest] = obj_id
+        id_map[key] = obj_id
+        return obj_id
+
+    def _copy(self, obj, id_map: Dict[Tuple[int, int], int],
+              pending: Dict[Tuple[int, int], Optional[int]]):
+        """העתקת אובייקט מהפרק, תוך כתיבת האובייקטים העקיפים שהוא מפנה אליהם"""
+        if isinstance(obj, IndirectObject):
+            return IndirectObject(self._copy_indirect(obj, id_map, pending), 0, None)
+
+        if isinstance(obj, StreamObject):
+            data = obj._data
+            filtered = "/Filter" in obj
+            if not filtered and self.compress:
+                compressed = zlib.compress(data)
+                if len(compressed) < len(data):
+                    data = compressed
+                    filtered = True
+                    self._compressed += 1
+            copied = EncodedStreamObject() if filtered else DecodedStreamObject()
+            copied._data = data
+            for key, value in obj.items():
+                if key != "/Length":
+                    copied[key] = self._copy(value, id_map, pending)
+            if filtered and "/Filter" not in obj:
+                copied[NameObject("/Filter")] = NameObject("/FlateDecode")
+            return copied
+
+        if isinstance(obj, DictionaryObject):
+            if self._link_targets:
+                internal_link = self._internal_link(obj)
+                if internal_link is not None:
+                    return internal_link
+            copied = DictionaryObject()
+            for key, value in obj.items():
+                copied[key] = self._copy(value, id_map, pending)
+            return copied
+
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._copy(value, id_map, pending) for value in obj)
+
+        return obj
+
+    @staticmethod
+    def _inherited(page: DictionaryObject, key: str):
+        """ערך מאפיין של עמוד, כולל ירושה מצמתי עץ העמודים שמעליו"""
+        node = page
+        while node is not None:
+            if key in node:
+                return dict.__getitem__(node, key)
+            node = node["/Parent"] if "/Parent" in node else None
+        return None
+
+    def append(self, source: Union[str, bytes], index: Optional[int] = None) -> int:
+        """הוספת כל העמודים של קובץ PDF (נתיב או bytes) לסוף הספר, או לפני העמוד שבמיקום index.
+        מחזיר את מספר העמודים שנוספו"""
+        if isinstance(source, bytes):
+            self._input_bytes += len(source)
+            reader = PdfReader(io.BytesIO(source))
+        else:
+            self._input_bytes += os.path.getsize(source)
+            reader = PdfReader(source)
+        id_map: Dict[Tuple[int, int], int] = {}
+        pending: Dict[Tuple[int, int], Optional[int]] = {}
+
+        pages = list(reader.pages)
+        # הקצאת מספרים לעמודים מראש, כדי שהפניות אליהם (למשל מקישורים) יתורגמו נכון
+        page_ids = []
+        for page in pages:
+            page_id = self._reserve()
+            if page.indirect_reference is not None:
+                ref = page.indirect_reference
+                id_map[(ref.idnum, ref.generation)] = page_id
+            page_ids.append(page_id)
+
+        for page, page_id in zip(pages, page_ids):
+            copied = DictionaryObject()
+            for key, value in page.items():
+                if key != "/Parent":
+                    copied[key] = self._copy(value, id_map, pending)
+            for key in INHERITABLE_PAGE_KEYS:
+                if key not in copied:
+                    value = self._inherited(page, key)
+                    if value is not None:
+                        copied[NameObject(key)] = self._copy(value, id_map, pending)
+            copied[NameObject("/Parent")] = IndirectObject(self._pages_id, 0, None)
+            self._write_object(page_id, copied)
+
+        if index is None:
+            self._page_ids.extend(page_ids)
+        else:
+            self._page_ids[index:index] = page_ids
+        return len(page_ids)
+
+    def _write_outline(self) -> Optional[int]:
+        """כתיבת עץ הסימניות לפי סדר העמודים. מחזיר את מספר אובייקט ה-outline"""
+        positions = {page_id: position for position, page_id in enumerate(self._page_ids)}
+        bookmarks = sorted((bookmark for bookmark in self._bookmarks if bookmark[1] in positions),
+                           key=lambda bookmark: positions[bookmark[1]])
+        if not bookmarks:
+            return None
+
+        outline_id = self._reserve()
+        item_ids = [self._reserve() for _ in bookmarks]
+        for position, ((title, page_id), item_id) in enumerate(zip(bookmarks, item_ids)):
+            item = DictionaryObject({
+                NameObject("/Title"): create_string_object(title),
+                NameObject("/Parent"): IndirectObject(outline_id, 0, None),
+                NameObject("/Dest"): self._page_destination(page_id),
+            })
+            if position > 0:
+                item[NameObject("/Prev")] = IndirectObject(item_ids[position - 1], 0, None)
+            if position < len(item_ids) - 1:
+                item[NameObject("/Next")] = IndirectObject(item_ids[position + 1], 0, None)
+            self._write_object(item_id, item)
+
+        self._write_object(outline_id, DictionaryObject({
+            NameObject("/Type"): NameObject("/Outlines"),
+            NameObject("/First"): IndirectObject(item_ids[0], 0, None),
+            NameObject("/Last"): IndirectObject(item_ids[-1], 0, None),
+            NameObject("/Count"): NumberObject(len(item_ids)),
+        }))
+        return outline_id
+
+    def close(self) -> None:
+        """כתיבת עץ העמודים, הקטלוג וטבלת ה-xref וסגירת הקובץ"""
+        pages = DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(IndirectObject(page_id, 0, None) for page_id in self._page_ids),
+            NameObject("/Count"): NumberObject(len(self._page_ids)),
+        })
+        self._write_object(self._pages_id, pages)
+        outline_id = self._write_outline()
+
+        catalog_id = self._reserve()
+        catalog = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(self._pages_id, 0, None),
+        })
+        if outline_id is not None:
+            catalog[NameObject("/Outlines")] = IndirectObject(outline_id, 0, None)
+            catalog[NameObject("/PageMode")] = NameObject("/UseOutlines")
+        self._write_object(catalog_id, catalog)
+
+        xref_offset = self._file.tell()
+        self._file.write(f"xref\n0 {len(self._offsets)}\n".encode('ascii'))
+        self._file.write(b"0000000000 65535 f \n")
+        for offset in self._offsets[1:]:
+            if offset is None:
+                self._file.write(b"0000000000 00000 f \n")
+            else:
+                self._file.write(f"{offset:010d} 00000 n \n".encode('ascii'))
+        self._file.write(
+            f"trailer\n<< /Size {len(self._offsets)} /Root {catalog_id} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode('ascii')
+        )
+        self._file.close()
+
+        stats = self.stats()
+        logger.info(
+            f"Wrote {self.output_path}: {stats['input_bytes']} -> {stats['output_bytes']} bytes "
+            f"({stats['deduplicated_objects']} shared objects deduplicated, "
+            f"{stats['compressed_streams']} streams compressed)"
+        )
+
+    def stats(self) -> dict:
+        """גודל הקלט מול גודל הפלט ומוני האופטימיזציה"""
+        return {
+            "input_bytes": self._input_bytes,
+            "output_bytes": self._file.tell() if not self._file.closed else os.path.getsize(self.output_path),
+            "deduplicated_objects": self._deduplicated,
+            "compressed_streams": self._compressed,
+        }
+
+    def abort(self) -> None:
+        """סגירת הקובץ בלי לסיים אותו (במקרה של שגיאה)"""
+        self._file.close()
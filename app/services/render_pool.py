@@ -0,0 +1,125 @@
+import threading
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Optional, Set, Tuple
+
+from ..config import RENDER_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# המשימה שהעבודה הנוכחית בתהליכון שייכת לה
+_current = threading.local()
+
+
+def current_task() -> Optional[str]:
+    """מזהה המשימה של עבודת הרינדור שרצה בתהליכון הנוכחי, או None מחוץ למאגר"""
+    return getattr(_current, "task_id", None)
+
+
+class RenderPool:
+    """מאגר רינדור משותף לכל השרת, עם חלוקה הוגנת של הקיבולת בין משימות"""
+
+    def __init__(self, size: int = RENDER_POOL_SIZE):
+        self.size = max(1, size)
+        # תור עבודות נפרד לכל משימה, לפי סדר ההגעה
+        self._queues: "OrderedDict[str, Deque[Tuple[Future, Callable, tuple, dict]]]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._workers = []
+        self._active = 0
+        # משימות שבוטלו: עבודות חדשות שלהן לא נכנסות לתור
+        self._cancelled: Set[str] = set()
+
+    def _start_workers(self) -> None:
+        """הפעלת תהליכוני הרינדור בפעם הראשונה שמגיעה עבודה"""
+        for i in range(self.size):
+            worker = threading.Thread(target=self._worker_loop, name=f"render-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Started render pool with {self.size} workers")
+
+    def submit(self, task_id: str, fn: Callable, *args, **kwargs) -> Future:
+        """הוספת עבודת רינדור לתור של המשימה"""
+        future = Future()
+        with self._condition:
+            if task_id in self._cancelled:
+                future.cancel()
+                return future
+            if not self._workers:
+                self._start_workers()
+            self._queues.setdefault(task_id, deque()).append((future, fn, args, kwargs))
+            self._condition.notify()
+        return future
+
+    def _next_job(self) -> Tuple[str, Tuple[Future, Callable, tuple, dict]]:
+        """בחירת העבודה הבאה בסבב (round-robin) בין המשימות הממתינות"""
+        task_id, queue = self._queues.popitem(last=False)
+        job = queue.popleft()
+        if queue:
+            # המשימה חוזרת לסוף הסבב כדי לא להרעיב משימות אחרות
+            self._queues[task_id] = queue
+        return task_id, job
+
+    def cancel(self, task_id: str) -> int:
+        """ביטול כל העבודות של משימה שעוד לא התחילו, וחסימת עבודות חדשות שלה.
+        מחזיר את מספר העבודות שבוטלו"""
+        with self._condition:
+            self._cancelled.add(task_id)
+            queue = self._queues.pop(task_id, None) or deque()
+        for future, *_ in queue:
+            future.cancel()
+        if queue:
+            logger.info(f"Cancelled {len(queue)} queued render jobs of task {task_id}")
+        return len(queue)
+
+    def is_cancelled(self, task_id: Optional[str]) -> bool:
+        with self._condition:
+            return task_id in self._cancelled
+
+    def forget(self, task_id: str) -> None:
+        """שחרור סימון הביטול של משימה שהסתיימה"""
+        with self._condition:
+            self._cancelled.discard(task_id)
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queues:
+                    self._condition.wait()
+                task_id, (future, fn, args, kwargs) = self._next_job()
+                self._active += 1
+            _current.task_id = task_id
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                _current.task_id = None
+                with self._condition:
+                    self._active -= 1
+
+    def stats(self) -> dict:
+        """מצב נוכחי של המאגר"""
+        with self._condition:
+            return {
+                "size": self.size,
+                "active": self._active,
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "tasks": len(self._queues),
+            }
+
+
+# מאגר משותף לכל המשימות בתהליך
+_render_pool: Optional[RenderPool] = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> RenderPool:
+    """מחזיר את מאגר הרינדור המשותף, ויוצר אותו בפעם הראשונה"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = RenderPool()
+        return _render_pool
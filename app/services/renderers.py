@@ -0,0 +1,275 @@
+import importlib.util
+import multiprocessing
+import os
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+import pdfkit
+
+from ..config import (
+    RENDER_ENGINE, RENDER_TIMEOUT_SECONDS, RENDERER_WORKERS, RENDERER_MAX_JOBS, ASSET_STORE_PATH
+)
+from .metrics import RENDER_PROCESSES
+from .retry import call_with_retries
+from .render_pool import current_task, get_render_pool
+from .wkhtmltopdf import (
+    RenderError, RenderTimeoutError, RenderCancelledError, pdfkit_configuration, run_pdfkit,
+    terminate_processes, active_processes
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Renderer:
+    """ממשק למנוע רינדור. render מוסיף הגבלת זמן וניסיונות חוזרים לכשלים זמניים"""
+
+    name = ""
+
+    def render(self, html: str, options: Dict[str, Any],
+               timeout: float = RENDER_TIMEOUT_SECONDS, description: str = "Render") -> bytes:
+        """רינדור HTML ל-PDF בזיכרון"""
+        return call_with_retries(
+            lambda: self._render_once(html, options, timeout),
+            is_transient=lambda e: isinstance(e, RenderError) and e.transient,
+            description=description,
+        )
+
+    def _render_once(self, html: str, options: Dict[str, Any], timeout: float) -> bytes:
+        raise NotImplementedError
+
+    def cancel(self, task_id: str) -> int:
+        """עצירת הרינדורים של משימה שבוטלה. מחזיר את מספר הרינדורים שנעצרו.
+        גם תהליכי wkhtmltopdf של רינדור הספר בקריאה אחת נעצרים כאן, בכל מנוע"""
+        return terminate_processes(task_id)
+
+    def busy_workers(self) -> int:
+        """מספר התהליכים הקבועים של המנוע שמרנדרים כרגע (תהליכי wkhtmltopdf נספרים בנפרד)"""
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+class WkhtmltopdfRenderer(Renderer):
+    """wkhtmltopdf דרך stdin/stdout. אין לו מצב שרת, ולכן תהליך חדש לכל פרק,
+    אבל הגדרות pdfkit (חיפוש הקובץ) נטענות פעם אחת"""
+
+    name = "wkhtmltopdf"
+
+    def __init__(self):
+        self.configuration = pdfkit_configuration()
+
+    def _render_once(self, html: str, options: Dict[str, Any], timeout: float) -> bytes:
+        kit = pdfkit.PDFKit(html, 'string', options=options, configuration=self.configuration)
+        return run_pdfkit(kit, timeout=timeout)
+
+
+def page_css(options: Dict[str, Any]) -> str:
+    """תרגום הגדרות העמוד של pdfkit (גודל ושוליים) ל-@page של CSS"""
+    margins = " ".join(
+        str(options.get(f"margin-{side}", "0")) for side in ("top", "right", "bottom", "left")
+    )
+    return f"@page {{ size: {options.get('page-size', 'A4')}; margin: {margins}; }}"
+
+
+def _weasyprint_worker(conn) -> None:
+    """לולאת תהליך רינדור חם: WeasyPrint והגופנים נטענים פעם אחת, ואז פרק אחרי פרק"""
+    import weasyprint
+    from urllib.parse import unquote, urlsplit
+
+    asset_root = os.path.realpath(ASSET_STORE_PATH) + os.sep
+
+    def url_fetcher(url: str):
+        # כמו ב-wkhtmltopdf: מהדיסק נטענים רק קבצים ממאגר הנכסים
+        if url.startswith("file:") and not os.path.realpath(unquote(urlsplit(url).path)).startswith(asset_root):
+            raise ValueError(f"Local file outside the asset store: {url}")
+        return weasyprint.default_url_fetcher(url)
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        html, options = job
+        try:
+            pdf_data = weasyprint.HTML(string=html, url_fetcher=url_fetcher).write_pdf(
+                stylesheets=[weasyprint.CSS(string=page_css(options))]
+            )
+            conn.send((True, pdf_data))
+        except Exception as e:
+            conn.send((False, str(e)))
+
+
+class _WarmWorker:
+    """תהליך רינדור קבוע, שמקבל עבודות בצינור"""
+
+    def __init__(self, context, target):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=target, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+        self.task_id: Optional[str] = None
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self) -> None:
+        self.process.kill()
+
+    def stop(self) -> None:
+        """סגירה מסודרת, ואם התהליך לא נסגר - הריגה"""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class WarmWorkerRenderer(Renderer):
+    """מנוע שרץ בתהליכים חמים קבועים, במקום תהליך חדש לכל פרק.
+    תהליך מוחלף אחרי max_jobs עבודות, כדי להגביל דליפות זיכרון"""
+
+    # הפונקציה שרצה בתהליך החם
+    worker_target = None
+
+    def __init__(self, workers: int = RENDERER_WORKERS, max_jobs: int = RENDERER_MAX_JOBS):
+        self.max_jobs = max(1, max_jobs)
+        # spawn ולא fork: השרת מרובה תהליכונים
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: List[_WarmWorker] = []
+        self._busy: Set[_WarmWorker] = set()
+        self._slots = threading.BoundedSemaphore(max(1, workers))
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> _WarmWorker:
+        self._slots.acquire()
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+        if worker is None or not worker.is_alive():
+            try:
+                worker = _WarmWorker(self._context, type(self).worker_target)
+            except Exception:
+                self._slots.release()
+                raise
+            logger.info(f"Started {self.name} renderer worker (pid {worker.process.pid})")
+        worker.task_id = current_task()
+        with self._lock:
+            self._busy.add(worker)
+        return worker
+
+    def _checkin(self, worker: _WarmWorker, healthy: bool) -> None:
+        with self._lock:
+            self._busy.discard(worker)
+            worker.task_id = None
+            reuse = healthy and worker.jobs < self.max_jobs
+            if reuse:
+                self._idle.append(worker)
+        if not reuse:
+            if healthy:
+                logger.info(f"Recycling {self.name} renderer worker after {worker.jobs} jobs")
+            worker.stop()
+        self._slots.release()
+
+    def _render_once(self, html: str, options: Dict[str, Any], timeout: float) -> bytes:
+        task_id = current_task()
+        render_pool = get_render_pool()
+        if render_pool.is_cancelled(task_id):
+            raise RenderCancelledError(f"Task {task_id} was cancelled")
+
+        worker = self._checkout()
+        healthy = False
+        try:
+            worker.conn.send((html, options))
+            if not worker.conn.poll(timeout):
+                worker.kill()
+                raise RenderTimeoutError(f"{self.name} did not finish within {timeout} seconds")
+            ok, result = worker.conn.recv()
+            worker.jobs += 1
+            healthy = True
+        except (EOFError, OSError):
+            # התהליך מת באמצע: ביטול המשימה או קריסה
+            if render_pool.is_cancelled(task_id):
+                raise RenderCancelledError(f"Task {task_id} was cancelled")
+            raise RenderError(f"{self.name} renderer worker died", transient=True)
+        finally:
+            self._checkin(worker, healthy)
+
+        if not ok:
+            raise RenderError(result)
+        return result
+
+    def cancel(self, task_id: str) -> int:
+        stopped = super().cancel(task_id)
+        with self._lock:
+            workers = [worker for worker in self._busy if worker.task_id == task_id]
+        for worker in workers:
+            worker.kill()
+        if workers:
+            logger.info(f"Killed {len(workers)} {self.name} renderer workers of task {task_id}")
+        return stopped + len(workers)
+
+    def busy_workers(self) -> int:
+        with self._lock:
+            return len(self._busy)
+
+    def close(self) -> None:
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.stop()
+
+
+class WeasyPrintRenderer(WarmWorkerRenderer):
+    """WeasyPrint (פייתון טהור) בתהליכים חמים, שטוענים את המנוע והגופנים פעם אחת"""
+
+    name = "weasyprint"
+    worker_target = staticmethod(_weasyprint_worker)
+
+    def __init__(self, workers: int = RENDERER_WORKERS, max_jobs: int = RENDERER_MAX_JOBS):
+        if importlib.util.find_spec("weasyprint") is None:
+            raise RuntimeError("RENDER_ENGINE=weasyprint requires the weasyprint package")
+        super().__init__(workers, max_jobs)
+
+
+RENDERERS = {
+    WkhtmltopdfRenderer.name: WkhtmltopdfRenderer,
+    WeasyPrintRenderer.name: WeasyPrintRenderer,
+}
+
+
+def create_renderer(engine: str = RENDER_ENGINE) -> Renderer:
+    """יצירת מנוע הרינדור לפי ההגדרות"""
+    if engine not in RENDERERS:
+        raise ValueError(f"Unknown render engine: {engine}")
+    return RENDERERS[engine]()
+
+
+# מנוע משותף לכל המשימות בתהליך
+_renderer: Optional[Renderer] = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> Renderer:
+    """מחזיר את מנוע הרינדור המשותף, ויוצר אותו בפעם הראשונה"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = create_renderer()
+            logger.info(f"Using {_renderer.name} render engine")
+        return _renderer
+
+
+def active_render_processes() -> int:
+    """תהליכי wkhtmltopdf שרצים ותהליכים חמים שמרנדרים, בתהליך הנוכחי"""
+    busy = _renderer.busy_workers() if _renderer is not None else 0
+    return active_processes() + busy
+
+
+RENDER_PROCESSES.set_function(active_render_processes)
@@ -0,0 +1,33 @@
+import time
+import random
+import logging
+from typing import Callable, TypeVar
+
+from ..config import RETRY_ATTEMPTS, RETRY_BACKOFF_SECONDS, RETRY_BACKOFF_MAX_SECONDS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BACKOFF_SECONDS,
+                  maximum: float = RETRY_BACKOFF_MAX_SECONDS) -> float:
+    """השהייה לפני ניסיון חוזר: גיבוי מעריכי עם jitter מלא, כדי שניסיונות לא יתנגשו"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+def call_with_retries(fn: Callable[[], T], is_transient: Callable[[Exception], bool],
+                      description: str, attempts: int = RETRY_ATTEMPTS) -> T:
+    """הרצת פעולה עם ניסיונות חוזרים לשגיאות זמניות בלבד"""
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient(e):
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(
+                f"{description} failed ({str(e)}), retrying in {delay:.1f}s "
+                f"(attempt {attempt + 2} of {attempts})"
+            )
+            time.sleep(delay)
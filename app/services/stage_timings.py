@@ -0,0 +1,110 @@
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from .metrics import STAGE_SECONDS
+from .task_profiler import TaskProfiler
+
+
+class StageTimings:
+    """זמן מצטבר ומספר הפעמים לכל שלב בצנרת של משימה (fetch, sanitize, render, merge...).
+    שלבים של פרקים רצים במקביל, ולכן סכום הזמנים יכול לעלות על זמן המשימה"""
+
+    def __init__(self, profiler: Optional[TaskProfiler] = None):
+        self.profiler = profiler
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._seconds: Dict[str, float] = defaultdict(float)
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._chapters: Dict[str, "ChapterTimings"] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._seconds[stage] += seconds
+            self._counts[stage] += 1
+
+    def chapter(self, title: str) -> "ChapterTimings":
+        """הזמנים של פרק, לפי הכותרת שלו. הפרקים נשמרים לפי סדר הפנייה הראשונה"""
+        title = title.strip()
+        with self._lock:
+            chapter = self._chapters.get(title)
+            if chapter is None:
+                chapter = self._chapters[title] = ChapterTimings(self, title)
+            return chapter
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """{שלב: {"seconds": זמן מצטבר, "count": מספר פעמים}}"""
+        with self._lock:
+            return {
+                stage: {"seconds": round(seconds, 3), "count": self._counts[stage]}
+                for stage, seconds in self._seconds.items()
+            }
+
+    def timeline(self, titles: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """ציר הזמן של הפרקים (כולם, או רק titles לפי הסדר שלהם)"""
+        with self._lock:
+            chapters = (list(self._chapters.values()) if titles is None
+                        else [self._chapters[title.strip()] for title in titles if title.strip() in self._chapters])
+        return [chapter.snapshot() for chapter in chapters]
+
+
+class ChapterTimings:
+    """זמני השלבים של פרק אחד ופרטים נוספים עליו (בתים שהורדו, עמודים).
+    כל זמן נרשם גם בזמני המשימה"""
+
+    def __init__(self, task: StageTimings, title: str):
+        self.task = task
+        self.title = title
+        self._lock = threading.Lock()
+        self._seconds: Dict[str, float] = defaultdict(float)
+        self._fields: Dict[str, Any] = {}
+        # תחילת השלב הראשון וסוף השלב האחרון, בשניות מתחילת המשימה
+        self._first: Optional[float] = None
+        self._last: Optional[float] = None
+
+    @property
+    def profiler(self) -> Optional[TaskProfiler]:
+        return self.task.profiler
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.task.add(stage, seconds)
+        end = self.task.elapsed()
+        with self._lock:
+            self._seconds[stage] += seconds
+            self._first = end - seconds if self._first is None else min(self._first, end - seconds)
+            self._last = end if self._last is None else max(self._last, end)
+
+    def note(self, **fields) -> None:
+        with self._lock:
+            self._fields.update(fields)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {stage: round(seconds, 3) for stage, seconds in self._seconds.items()}
+            return {
+                "title": self.title,
+                "stages": stages,
+                # זמן העבודה על הפרק, בלי ההמתנה בתור הרינדור
+                "busy_seconds": round(sum(self._seconds.values()), 3),
+                "start_seconds": None if self._first is None else round(self._first, 3),
+                "end_seconds": None if self._last is None else round(self._last, 3),
+                **self._fields,
+            }
+
+
+@contextmanager
+def timed(timings: Optional[Union[StageTimings, ChapterTimings]], stage: str) -> Iterator[None]:
+    """מדידת הזמן של בלוק ורישומו בהיסטוגרמה של השלב, ובשלב של המשימה אם יש מעקב זמנים"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings.add(stage, elapsed)
@@ -0,0 +1,64 @@
+import cProfile
+import logging
+import os
+import pstats
+import threading
+from functools import partial
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TaskProfiler:
+    """cProfile של הצד של Python במשימה: התהליכון שמריץ אותה, והעבודות שהיא שולחת
+    לתהליכוני ההורדה והרינדור (כל קריאה נמדדת בנפרד, והכול מאוחד בסוף)"""
+
+    def __init__(self):
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """הרצת פונקציה תחת cProfile, אלא אם התהליכון כבר נמדד"""
+        if getattr(self._local, "active", False):
+            return fn(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # מ-Python 3.12 רק מודד אחד יכול לפעול בכל רגע
+            return fn(*args, **kwargs)
+        self._local.active = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._local.active = False
+            with self._lock:
+                self._profiles.append(profile)
+
+    def dump(self, path: str) -> Optional[str]:
+        """שמירת כל המדידות כקובץ pstats אחד (לפתיחה ב-pstats או snakeviz)"""
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = None
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:
+                # מדידה בלי קריאות
+                continue
+        if stats is None:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stats.dump_stats(path)
+        logger.info(f"Saved profile of {len(profiles)} calls to {path}")
+        return path
+
+
+def profiled(profiler: Optional[TaskProfiler], fn: Callable) -> Callable:
+    """הפונקציה עצמה, או עטיפה שמודדת אותה אם המשימה נמדדת"""
+    return fn if profiler is None else partial(profiler.run, fn)
@@ -0,0 +1,94 @@
+import time
+import threading
+from typing import Any, Dict, List
+
+from ..config import PROGRESS_FLUSH_SECONDS
+from .task_store import TaskStore
+
+
+class TaskProgress:
+    """מעקב אחרי התקדמות משימה ברמת הפרק, עם כתיבה מרוכזת לאחסון המשימות"""
+
+    def __init__(self, store: TaskStore, task_id: str, total: int,
+                 flush_seconds: float = PROGRESS_FLUSH_SECONDS):
+        self.store = store
+        self.task_id = task_id
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._started_at = time.time()
+        self._data: Dict[str, Any] = {
+            "total": total,
+            "fetched": 0,
+            "rendered": 0,
+            "merged": 0,
+            "cached": 0,
+            "html_bytes_removed": 0,
+            "failed": [],
+        }
+        # קבצי הפרקים שכבר מוכנים להורדה, לפי סדר הפרקים
+        self._chapters: List[Dict[str, Any]] = []
+        self._chapters_changed = False
+
+    def advance(self, stage: str, count: int = 1) -> None:
+        """קידום מונה של שלב: fetched, rendered, merged, cached או html_bytes_removed"""
+        with self._lock:
+            self._data[stage] += count
+        self.flush()
+
+    def fail(self, title: str, stage: str, error: str) -> None:
+        """רישום פרק שנכשל"""
+        with self._lock:
+            self._data["failed"].append({"title": title, "stage": stage, "error": error})
+        self.flush(force=True)
+
+    def add_chapter(self, entry: Dict[str, Any]) -> None:
+        """רישום קובץ פרק שמוכן להורדה"""
+        with self._lock:
+            self._chapters.append(entry)
+            self._chapters.sort(key=lambda chapter: chapter["index"])
+            self._chapters_changed = True
+        self.flush()
+
+    @property
+    def has_failures(self) -> bool:
+        with self._lock:
+            return bool(self._data["failed"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """מצב ההתקדמות הנוכחי, כולל הערכת זמן לסיום"""
+        with self._lock:
+            data = {**self._data, "failed": list(self._data["failed"])}
+        elapsed = time.time() - self._started_at
+        done = data["rendered"] + len(data["failed"])
+        remaining = data["total"] - done
+        data["elapsed_seconds"] = round(elapsed, 1)
+        data["eta_seconds"] = round(elapsed / done * remaining, 1) if done and remaining > 0 else None
+        return data
+
+    def flush(self, force: bool = False) -> None:
+        """כתיבת ההתקדמות לאחסון, לכל היותר פעם ב-flush_seconds אלא אם נדרש"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_flush < self.flush_seconds:
+                return
+            self._last_flush = now
+            # רשימת הפרקים נכתבת רק כשנוסף פרק
+            fields = {"chapters": list(self._chapters)} if self._chapters_changed else {}
+            self._chapters_changed = False
+        self.store.update(self.task_id, progress=self.snapshot(), **fields)
+
+
+class ProgressFanout:
+    """העברת ההתקדמות של פרק משותף לכל הספרים שהוא נכלל בהם"""
+
+    def __init__(self, progresses: List[TaskProgress]):
+        self.progresses = progresses
+
+    def advance(self, stage: str, count: int = 1) -> None:
+        for progress in self.progresses:
+            progress.advance(stage, count)
+
+    def fail(self, title: str, stage: str, error: str) -> None:
+        for progress in self.progresses:
+            progress.fail(title, stage, error)
@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Optional
+
+from ..config import TASK_STORE_BACKEND, TASK_STORE_PATH, TASK_STORE_JOURNAL_MODE, TASK_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class TaskStore(ABC):
+    """ממשק לאחסון סטטוס המשימות, עם גישה בסגנון מילון"""
+
+    def __init__(self, ttl_seconds: int = TASK_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+
+    @abstractmethod
+    def get(self, task_id: str, default: Any = None) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def set(self, task_id: str, data: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def update(self, task_id: str, **fields) -> Optional[Dict[str, Any]]:
+        """עדכון חלקי של רשומת משימה קיימת"""
+
+    @abstractmethod
+    def transition(self, task_id: str, from_statuses: Iterable[str], **fields) -> Optional[Dict[str, Any]]:
+        """עדכון חלקי באותה פעולה אטומית עם בדיקת הסטטוס: הרשומה מתעדכנת רק אם הסטטוס שלה
+        אחד מ-from_statuses (למשל כדי שמעבר ל-processing לא ידרוס ביטול). מחזיר None אם לא עודכנה"""
+
+    @abstractmethod
+    def delete(self, task_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """מחיקת משימות שלא עודכנו במשך זמן התפוגה"""
+
+    @abstractmethod
+    def get_fingerprint(self, fingerprint: str) -> Optional[str]:
+        """המשימה שרשומה לטביעת האצבע של בקשה"""
+
+    @abstractmethod
+    def set_fingerprint(self, fingerprint: str, task_id: str) -> None:
+        ...
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+    def __getitem__(self, task_id: str) -> Dict[str, Any]:
+        data = self.get(task_id)
+        if data is None:
+            raise KeyError(task_id)
+        return data
+
+    def __setitem__(self, task_id: str, data: Dict[str, Any]) -> None:
+        self.set(task_id, data)
+
+    def __delitem__(self, task_id: str) -> None:
+        self.delete(task_id)
+
+
+class MemoryTaskStore(TaskStore):
+    """אחסון משימות בזיכרון התהליך (לפיתוח ולתהליך יחיד)"""
+
+    def __init__(self, ttl_seconds: int = TASK_TTL_SECONDS):
+        super().__init__(ttl_seconds)
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._fingerprints: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _expired(self, updated_at: float) -> bool:
+        return time.time() - updated_at > self.ttl_seconds
+
+    def get(self, task_id: str, default: Any = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._tasks.get(task_id)
+            if data is None or self._expired(data["updated_at"]):
+                return default
+            return dict(data)
+
+    def set(self, task_id: str, data: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            created_at = self._tasks.get(task_id, {}).get("created_at", now)
+            self._tasks[task_id] = {**data, "created_at": created_at, "updated_at": now}
+
+    def update(self, task_id: str, **fields) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._tasks.get(task_id)
+            if data is None:
+                return None
+            data.update(fields, updated_at=time.time())
+            return dict(data)
+
+    def transition(self, task_id: str, from_statuses: Iterable[str], **fields) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._tasks.get(task_id)
+            if data is None or data.get("status") not in tuple(from_statuses):
+                return None
+            data.update(fields, updated_at=time.time())
+            return dict(data)
+
+    def delete(self, task_id: str) -> None:
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            expired = [task_id for task_id, data in self._tasks.items()
+                       if self._expired(data["updated_at"])]
+            for task_id in expired:
+                del self._tasks[task_id]
+            self._fingerprints = {fingerprint: entry for fingerprint, entry in self._fingerprints.items()
+                                  if not self._expired(entry[1])}
+            return len(expired)
+
+    def get_fingerprint(self, fingerprint: str) -> Optional[str]:
+        with self._lock:
+            entry = self._fingerprints.get(fingerprint)
+            if entry is None or self._expired(entry[1]):
+                return None
+            return entry[0]
+
+    def set_fingerprint(self, fingerprint: str, task_id: str) -> None:
+        with self._lock:
+            self._fingerprints[fingerprint] = (task_id, time.time())
+
+
+class SQLiteTaskStore(TaskStore):
+    """אחסון משימות ב-SQLite, משותף לכל ה-workers והתהליכים שרואים את אותו קובץ.
+    במצב WAL (ברירת המחדל) כולם חייבים לרוץ על אותו מחשב; על אחסון רשת יש להשתמש ב-DELETE"""
+
+    # כל כמה כתיבות מתבצע ניקוי של משימות שפג תוקפן
+    PURGE_EVERY = 100
+
+    def __init__(self, path: str = TASK_STORE_PATH, ttl_seconds: int = TASK_TTL_SECONDS,
+                 journal_mode: str = TASK_STORE_JOURNAL_MODE):
+        super().__init__(ttl_seconds)
+        if journal_mode not in ("WAL", "DELETE", "TRUNCATE", "PERSIST"):
+            raise ValueError(f"Unsupported task store journal mode: {journal_mode}")
+        self.path = path
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(f"PRAGMA journal_mode={journal_mode}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " task_id TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_updated_at ON tasks (updated_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                " fingerprint TEXT PRIMARY KEY,"
+                " task_id TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # חיבור חדש לכל פעולה: בטוח בין תהליכונים ותהליכים
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _cutoff(self) -> float:
+        return time.time() - self.ttl_seconds
+
+    @staticmethod
+    def _row_to_data(row) -> Dict[str, Any]:
+        data = json.loads(row[0])
+        data["created_at"] = row[1]
+        data["updated_at"] = row[2]
+        return data
+
+    def _after_write(self) -> None:
+        # הכתיבות מגיעות מהרבה תהליכונים
+        with self._writes_lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            removed = self.purge_expired()
+            if removed:
+                logger.info(f"Purged {removed} expired tasks")
+
+    def get(self, task_id: str, default: Any = None) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT data, created_at, updated_at FROM tasks WHERE task_id = ? AND updated_at >= ?",
+                (task_id, self._cutoff()),
+            ).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_data(row) if row else default
+
+    def set(self, task_id: str, data: Dict[str, Any]) -> None:
+        now = time.time()
+        payload = {key: value for key, value in data.items() if key not in ("created_at", "updated_at")}
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO tasks (task_id, data, created_at, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(task_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (task_id, json.dumps(payload, ensure_ascii=False), now, now),
+            )
+        finally:
+            conn.close()
+        self._after_write()
+
+    def update(self, task_id: str, **fields) -> Optional[Dict[str, Any]]:
+        return self._update(task_id, None, fields)
+
+    def transition(self, task_id: str, from_statuses: Iterable[str], **fields) -> Optional[Dict[str, Any]]:
+        return self._update(task_id, tuple(from_statuses), fields)
+
+    def _update(self, task_id: str, from_statuses: Optional[tuple],
+                fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """קריאה, בדיקת הסטטוס (אם נדרש) וכתיבה בטרנזקציה אחת"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT data, created_at, updated_at FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            data = json.loads(row[0]) if row is not None else None
+            if data is None or (from_statuses is not None and data.get("status") not in from_statuses):
+                conn.execute("ROLLBACK")
+                return None
+            data.update(fields)
+            now = time.time()
+            conn.execute(
+                "UPDATE tasks SET data = ?, updated_at = ? WHERE task_id = ?",
+                (json.dumps(data, ensure_ascii=False), now, task_id),
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        data["created_at"] = row[1]
+        data["updated_at"] = now
+        return data
+
+    def delete(self, task_id: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+        finally:
+            conn.close()
+
+    def purge_expired(self) -> int:
+        cutoff = self._cutoff()
+        conn = self._connect()
+        try:
+            removed = conn.execute("DELETE FROM tasks WHERE updated_at < ?", (cutoff,)).rowcount
+            conn.execute("DELETE FROM fingerprints WHERE created_at < ?", (cutoff,))
+        finally:
+            conn.close()
+        return removed
+
+    def get_fingerprint(self, fingerprint: str) -> Optional[str]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT task_id FROM fingerprints WHERE fingerprint = ? AND created_at >= ?",
+                (fingerprint, self._cutoff()),
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def set_fingerprint(self, fingerprint: str, task_id: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (fingerprint, task_id, created_at) VALUES (?, ?, ?)",
+                (fingerprint, task_id, time.time()),
+            )
+        finally:
+            conn.close()
+
+
+def create_task_store() -> TaskStore:
+    """יצירת אחסון המשימות לפי ההגדרות"""
+    if TASK_STORE_BACKEND == "memory":
+        return MemoryTaskStore()
+    if TASK_STORE_BACKEND == "sqlite":
+        logger.info(f"Using SQLite task store at {TASK_STORE_PATH}")
+        return SQLiteTaskStore()
+    raise ValueError(f"Unknown task store backend: {TASK_STORE_BACKEND}")
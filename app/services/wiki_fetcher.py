@@ -0,0 +1,167 @@
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from ..config import (
+    FETCH_MAX_CONNECTIONS, FETCH_PER_HOST_LIMIT, FETCH_TIMEOUT_SECONDS, HTML_CACHE_ENABLED
+)
+from .html_cache import HtmlCache
+from .metrics import CACHE_REQUESTS, FETCHED_BYTES
+from .render_pool import get_render_pool
+from .retry import call_with_retries
+
+logger = logging.getLogger(__name__)
+
+
+class FetchCancelledError(Exception):
+    """המשימה שההורדה שייכת לה בוטלה בזמן שההורדה חיכתה למקום בשרת"""
+
+
+def is_transient_http_error(error: Exception) -> bool:
+    """שגיאות רשת ותשובות 5xx/429 הן זמניות; 404 וכדומה לא ישתנו בניסיון חוזר"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return False
+
+
+class WikiFetcher:
+    """לקוח HTTP משותף להורדת דפי ויקי במקביל על גבי מאגר חיבורי keep-alive"""
+
+    def __init__(self, max_connections: int = FETCH_MAX_CONNECTIONS,
+                 per_host_limit: int = FETCH_PER_HOST_LIMIT,
+                 html_cache: Optional[HtmlCache] = None,
+                 timeout: float = FETCH_TIMEOUT_SECONDS):
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.html_cache = html_cache
+        self._client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            follow_redirects=True,
+            timeout=timeout,
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_connections,
+            thread_name_prefix="wiki-fetch",
+        )
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        # המשימה שההורדה הנוכחית בתהליכון שייכת לה (ראו run)
+        self._current = threading.local()
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        """מחזיר את הסמפור שמגביל את מספר הבקשות המקבילות לשרת"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.per_host_limit)
+                self._host_slots[host] = slot
+            return slot
+
+    def _get(self, url: str, headers: Optional[Dict[str, str]] = None,
+             timeout: Optional[float] = None) -> httpx.Response:
+        """בקשת GET עם ניסיונות חוזרים לשגיאות זמניות. המקום בשרת משתחרר בזמן ההמתנה בין ניסיונות"""
+        def send() -> httpx.Response:
+            with self._host_slot(url):
+                # ההמתנה למקום בשרת יכולה להימשך, ובינתיים המשימה אולי בוטלה
+                task_id = getattr(self._current, "task_id", None)
+                if get_render_pool().is_cancelled(task_id):
+                    raise FetchCancelledError(f"Task {task_id} was cancelled")
+                response = self._client.get(
+                    url, headers=headers,
+                    timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+                )
+            if response.status_code >= 500 or response.status_code == 429:
+                response.raise_for_status()
+            return response
+        
+        return call_with_retries(send, is_transient_http_error, description=f"GET {url}")
+
+    def fetch(self, url: str, revalidate: bool = False) -> str:
+        """הורדת דף והחזרת תוכן ה-HTML שלו, עם בדיקה מותנית מול המטמון המקומי.
+        revalidate מדלג על חלון הרעננות, כשהתוכן חייב להתאים לגרסה שנבדקה זה עתה"""
+        cached = self.html_cache.load(url) if self.html_cache else None
+        headers = {}
+        if cached:
+            if not revalidate and self.html_cache.is_fresh(cached):
+                self.html_cache.count("fresh_hits")
+                CACHE_REQUESTS.inc(cache="html", result="hit")
+                return cached["body"]
+            headers = self.html_cache.conditional_headers(cached)
+        
+        response = self._get(url, headers=headers)
+        
+        if cached and response.status_code == 304:
+            # הדף לא השתנה - מגישים מהדיסק
+            self.html_cache.count("revalidated")
+            CACHE_REQUESTS.inc(cache="html", result="hit")
+            self.html_cache.mark_revalidated(url, cached)
+            return cached["body"]
+        
+        response.raise_for_status()
+        FETCHED_BYTES.inc(len(response.content), kind="html")
+        body = response.content.decode('utf-8')
+        if self.html_cache:
+            self.html_cache.count("misses")
+            CACHE_REQUESTS.inc(cache="html", result="miss")
+            self.html_cache.store(url, body, response.headers.get("etag"),
+                                  response.headers.get("last-modified"))
+        return body
+
+    def fetch_bytes(self, url: str, timeout: Optional[float] = None) -> Tuple[bytes, str]:
+        """הורדת קובץ בינארי (תמונה, גיליון סגנון). מחזיר את התוכן ואת סוג התוכן"""
+        response = self._get(url, timeout=timeout)
+        response.raise_for_status()
+        FETCHED_BYTES.inc(len(response.content), kind="asset")
+        return response.content, response.headers.get("content-type", "")
+
+    def fetch_json(self, url: str) -> Any:
+        """הורדת תשובת JSON (למשל מטא-דאטה של דף)"""
+        response = self._get(url)
+        response.raise_for_status()
+        FETCHED_BYTES.inc(len(response.content), kind="json")
+        return response.json()
+
+    def run(self, task_id: str, fn: Callable, *args, **kwargs) -> Future:
+        """הרצת שלב הורדה מורכב של משימה ברקע, על תהליכוני ההורדה.
+        הבקשות שלו נעצרות אם המשימה בוטלה בזמן שחיכו למקום בשרת"""
+        def call() -> Any:
+            self._current.task_id = task_id
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._current.task_id = None
+
+        return self._executor.submit(call)
+
+    def close(self) -> None:
+        """סגירת החיבורים ותהליכוני ההורדה"""
+        self._executor.shutdown(wait=False)
+        self._client.close()
+
+
+# מופע משותף לכל המשימות בתהליך
+_fetcher: Optional[WikiFetcher] = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> WikiFetcher:
+    """מחזיר את לקוח ההורדה המשותף, ויוצר אותו בפעם הראשונה"""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = WikiFetcher(html_cache=HtmlCache() if HTML_CACHE_ENABLED else None)
+            logger.info(
+                f"Created wiki fetcher (connections: {_fetcher.max_connections}, "
+                f"per host: {_fetcher.per_host_limit})"
+            )
+        return _fetcher
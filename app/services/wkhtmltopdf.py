@@ -0,0 +1,119 @@
+import subprocess
+import threading
+import logging
+from functools import lru_cache
+from typing import Dict, Optional, Set
+
+import pdfkit
+
+from ..config import RENDER_TIMEOUT_SECONDS, WKHTMLTOPDF_PATH
+from .render_pool import current_task, get_render_pool
+
+logger = logging.getLogger(__name__)
+
+# תהליכי wkhtmltopdf שרצים כרגע, לפי המשימה שהם שייכים לה
+_processes: Dict[str, Set[subprocess.Popen]] = {}
+_processes_lock = threading.Lock()
+
+
+# קידומת לתגי meta של pdfkit שאף שם לא מתאים לה
+IGNORE_META_OPTIONS = "(?!)"
+
+
+class RenderError(Exception):
+    """הרינדור נכשל. transient מסמן כישלון שכדאי לנסות שוב (למשל קריסה)"""
+
+    def __init__(self, message: str, transient: bool = False):
+        super().__init__(message)
+        self.transient = transient
+
+
+class RenderTimeoutError(RenderError):
+    """wkhtmltopdf לא סיים בזמן שהוקצב ונהרג"""
+
+
+class RenderCancelledError(RenderError):
+    """המשימה בוטלה, והרינדור לא התחיל או נעצר באמצע"""
+
+
+@lru_cache(maxsize=1)
+def pdfkit_configuration():
+    """הגדרות pdfkit, עם חיפוש קובץ wkhtmltopdf פעם אחת בלבד.
+    בלי הגדרות מפורשות pdfkit מריץ `which wkhtmltopdf` בכל רינדור"""
+    # pdfkit קורא אפשרויות wkhtmltopdf מתגי <meta name="pdfkit-..."> ב-HTML, שמגיע מאתר שהלקוח בחר
+    # (למשל enable-local-file-access). הקידומת היא ביטוי רגולרי שאף פעם לא מתאים, כך שרק
+    # האפשרויות שלנו נכנסות לפקודה
+    configuration = pdfkit.configuration(wkhtmltopdf=WKHTMLTOPDF_PATH, meta_tag_prefix=IGNORE_META_OPTIONS)
+    logger.info(f"Using wkhtmltopdf at {configuration.wkhtmltopdf}")
+    return configuration
+
+
+def active_processes() -> int:
+    """מספר תהליכי wkhtmltopdf שרצים כרגע בתהליך הנוכחי"""
+    with _processes_lock:
+        return sum(len(processes) for processes in _processes.values())
+
+
+def terminate_processes(task_id: str) -> int:
+    """עצירת כל תהליכי wkhtmltopdf שרצים עבור משימה. מחזיר את מספר התהליכים שנעצרו"""
+    with _processes_lock:
+        processes = list(_processes.get(task_id, ()))
+    for process in processes:
+        try:
+            process.terminate()
+        except OSError:
+            # התהליך כבר הסתיים
+            pass
+    if processes:
+        logger.info(f"Terminated {len(processes)} wkhtmltopdf processes of task {task_id}")
+    return len(processes)
+
+
+def run_pdfkit(kit: pdfkit.PDFKit, output_path: Optional[str] = None,
+               timeout: float = RENDER_TIMEOUT_SECONDS) -> bytes:
+    """הרצת הפקודה ש-pdfkit בונה, עם הגבלת זמן והריגת התהליך אם הוא נתקע.
+    בלי output_path ה-PDF חוזר מ-stdout"""
+    args = kit.command(output_path)
+    input_data = kit.source.to_s().encode('utf-8') if kit.source.isString() else None
+    task_id = current_task()
+    render_pool = get_render_pool()
+    if render_pool.is_cancelled(task_id):
+        raise RenderCancelledError(f"Task {task_id} was cancelled")
+
+    process = subprocess.Popen(
+        args,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=kit.environ,
+    )
+    # רישום התהליך כדי שביטול המשימה יוכל לעצור אותו
+    with _processes_lock:
+        _processes.setdefault(task_id, set()).add(process)
+    try:
+        stdout, stderr = process.communicate(input=input_data, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise RenderTimeoutError(f"wkhtmltopdf did not finish within {timeout} seconds")
+    finally:
+        with _processes_lock:
+            task_processes = _processes.get(task_id, set())
+            task_processes.discard(process)
+            if not task_processes:
+                _processes.pop(task_id, None)
+
+    if process.returncode != 0 and render_pool.is_cancelled(task_id):
+        # התהליך נעצר בגלל ביטול המשימה, ואין טעם לנסות שוב
+        raise RenderCancelledError(f"Task {task_id} was cancelled")
+    if process.returncode < 0:
+        # קריסה (signal) של wkhtmltopdf היא בדרך כלל חד-פעמית
+        raise RenderError(f"wkhtmltopdf was killed by signal {-process.returncode}", transient=True)
+    try:
+        kit.handle_error(process.returncode, stderr.decode('utf-8', errors='replace'))
+    except IOError as e:
+        raise RenderError(str(e))
+    if output_path is None and not stdout:
+        raise RenderError("wkhtmltopdf produced no output", transient=True)
+    return stdout
+
@@ -0,0 +1,108 @@
+"""worker להרצת משימות יצירת PDF מתור העבודות, בתהליך נפרד משרת ה-API
+
+הפעלה: python -m app.worker [--concurrency N]
+"""
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+
+from .config import (
+    LOG_FORMAT, WORKER_CONCURRENCY, WORKER_POLL_SECONDS, JOB_STALE_SECONDS, CANCEL_POLL_SECONDS,
+    PDF_LINEARIZE
+)
+from .pdf_generator import run_pdf_task, run_pdf_batch, cancel_task, is_task_cancelled
+from .services.job_queue import JobQueue
+from .services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+def run_job(queue: JobQueue, name: str, job: dict) -> None:
+    """הרצת עבודה אחת, עם סימני חיים ובדיקת ביטול עד לסיומה"""
+    done = threading.Event()
+
+    # באצווה אפשר לבטל גם ספר בודד
+    task_ids = [job["task_id"]] + [book["task_id"] for book in job.get("books", [])]
+
+    def watch_job():
+        last_heartbeat = time.monotonic()
+        cancelled = set()
+        while not done.wait(CANCEL_POLL_SECONDS):
+            if time.monotonic() - last_heartbeat >= JOB_STALE_SECONDS / 4:
+                queue.heartbeat(name)
+                last_heartbeat = time.monotonic()
+            # הביטול נרשם באחסון המשימות ע"י שרת ה-API
+            for task_id in task_ids:
+                if task_id not in cancelled and is_task_cancelled(task_id) and cancel_task(task_id):
+                    cancelled.add(task_id)
+
+    heartbeat_thread = threading.Thread(target=watch_job, daemon=True)
+    heartbeat_thread.start()
+    try:
+        logger.info(f"Running job {job['task_id']}")
+        if job.get("kind") == "batch":
+            run_pdf_batch(batch_id=job["task_id"], books=job["books"])
+        else:
+            run_pdf_task(
+                task_id=job["task_id"],
+                wiki_pages=job["wiki_pages"],
+                book_title=job["book_title"],
+                base_url=job["base_url"],
+                render_mode=job["render_mode"],
+                strict=job.get("strict", False),
+                linearize=job.get("linearize", PDF_LINEARIZE),
+                profile=job.get("profile", False)
+            )
+    except Exception as e:
+        logger.error(f"Error running job {job.get('task_id')}: {str(e)}")
+    finally:
+        done.set()
+        queue.complete(name)
+
+
+def worker_loop(queue: JobQueue, stop: threading.Event) -> None:
+    """לולאת תפיסת עבודות מהתור"""
+    while not stop.is_set():
+        claimed = queue.claim()
+        if claimed is None:
+            stop.wait(WORKER_POLL_SECONDS)
+            continue
+        run_job(queue, *claimed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Wiki PDF render worker")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY,
+                        help="מספר המשימות שרצות במקביל ב-worker הזה")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    queue = JobQueue()
+    stop = threading.Event()
+
+    # המדדים של ה-worker נאספים ע"י נתיב /metrics של שרת ה-API
+    REGISTRY.start_flusher()
+    logger.info(f"Worker {worker_id} started with concurrency {args.concurrency}")
+    threads = [
+        threading.Thread(target=worker_loop, args=(queue, stop), name=f"job-{i}", daemon=True)
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        # החזרת עבודות של workers שנפלו
+        while True:
+            queue.requeue_stale(JOB_STALE_SECONDS)
+            time.sleep(JOB_STALE_SECONDS / 4)
+    except KeyboardInterrupt:
+        logger.info(f"Worker {worker_id} stopping")
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
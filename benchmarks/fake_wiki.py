@@ -0,0 +1,121 @@
+"""שרת מקומי שמחליף את ה-REST API של הויקי בבנצ'מרק
+
+מגיש את אותם נתיבים שהשרת משתמש בהם: /page/{title}/html (ערך מ-benchmarks.fixtures),
+/page/{title}/bare (מזהה גרסה), תמונות וגיליון הסגנון של הדף - עם השהייה קבועה לכל בקשה,
+כדי לדמות את זמן התגובה של הויקי בלי תלות ברשת.
+
+הפעלה: python -m benchmarks.fake_wiki [--port 8790] [--latency-ms 50]
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from .fixtures import generate_article, png_image, recorded_fixtures
+
+STYLESHEET = b"body{font-family:serif;line-height:1.5}.infobox{float:left;width:22em}"
+
+IMAGE_PATTERN = re.compile(r'(<img\b[^>]*?\ssrc=")[^"]*(")', re.IGNORECASE)
+SRCSET_PATTERN = re.compile(r'\ssrcset="[^"]*"', re.IGNORECASE)
+
+
+@lru_cache(maxsize=4096)
+def article_html(title: str) -> bytes:
+    """ערך מוקלט (לפי גיבוב הכותרת) אם יש, אחרת ערך שנוצר"""
+    recorded = recorded_fixtures()
+    if not recorded:
+        return generate_article(title).encode("utf-8")
+    index = int(hashlib.sha1(title.encode("utf-8")).hexdigest()[:8], 16) % len(recorded)
+    with open(recorded[index], encoding="utf-8") as f:
+        html = f.read()
+    # התמונות של ערך מוקלט מוגשות מהשרת המקומי, כדי שהבנצ'מרק לא יפנה לרשת
+    html = SRCSET_PATTERN.sub("", html)
+    html = IMAGE_PATTERN.sub(lambda match: f"{match.group(1)}/images/{index % 40 + 1}.png{match.group(2)}", html)
+    return html.encode("utf-8")
+
+
+@lru_cache(maxsize=64)
+def image_bytes(name: str) -> bytes:
+    return png_image(seed=int(hashlib.sha1(name.encode("utf-8")).hexdigest()[:4], 16))
+
+
+class FakeWikiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def route(self, path: str) -> Optional[Tuple[str, bytes]]:
+        parts = path.strip("/").split("/")
+        if len(parts) >= 3 and parts[-3] == "page" and parts[-1] == "html":
+            return "text/html; charset=utf-8", article_html(parts[-2])
+        if len(parts) >= 3 and parts[-3] == "page" and parts[-1] == "bare":
+            revision = int(hashlib.sha1(parts[-2].encode("utf-8")).hexdigest()[:6], 16)
+            return "application/json", json.dumps({"title": parts[-2], "latest": {"id": revision}}).encode()
+        if path.endswith(".png"):
+            return "image/png", image_bytes(parts[-1])
+        if parts[-1] == "load.php":
+            return "text/css", STYLESHEET
+        return None
+
+    def do_GET(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        routed = self.route(unquote(urlsplit(self.path).path))
+        if routed is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        content_type, body = routed
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0) -> ThreadingHTTPServer:
+    """שרת (לא מופעל) עם השהייה לכל בקשה; port=0 בוחר פורט פנוי"""
+    handler = type("Handler", (FakeWikiHandler,), {"latency": latency_ms / 1000})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(latency_ms: float = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """הפעלת השרת ב-thread ברקע. מחזיר את השרת ואת כתובת הבסיס של ה-API"""
+    server = create_server(latency_ms=latency_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/w/rest.php/v1/page"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the wiki REST API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--latency-ms", type=float, default=50, help="השהייה לכל בקשה, במילישניות")
+    args = parser.parse_args()
+    server = create_server(args.host, args.port, args.latency_ms)
+    print(f"Serving fake wiki on http://{args.host}:{args.port}/w/rest.php/v1/page")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
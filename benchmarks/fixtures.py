@@ -0,0 +1,152 @@
+"""ערכים לדוגמה לבנצ'מרק הצנרת
+
+ערך נוצר באופן דטרמיניסטי מהכותרת שלו, במבנה של HTML של Parsoid (כמו ש-/page/{title}/html
+מחזיר): תבנית מידע, פסקאות בסעיפים, תמונות, תבנית ניווט, רכיבים מוסתרים והערות שוליים -
+כך שכל שלבי הניקוי והורדת הנכסים עובדים כמו על ערך אמיתי. גודל ערך: כ-50KB עד 200KB.
+
+אפשר גם להקליט ערכים אמיתיים מהויקי, והשרת המקומי יגיש אותם במקום הערכים שנוצרו:
+python -m benchmarks.fixtures record --base-url https://dev.hamichlol.org.il/w/rest.php/v1/page ירושלים חיפה
+"""
+import argparse
+import hashlib
+import os
+import random
+import struct
+import zlib
+from typing import List
+from urllib.parse import quote
+
+import httpx
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+MIN_ARTICLE_BYTES = 50 * 1024
+MAX_ARTICLE_BYTES = 200 * 1024
+
+WORDS = (
+    "העיר נמצאת באזור ההר ומשמשת מרכז מסחרי ותרבותי חשוב לתושבי הסביבה . "
+    "במאה התשע עשרה גדלה האוכלוסייה במהירות עם הגעת מסילת הברזל והקמת בתי החרושת "
+    "הראשונים , ובעקבותיה נבנו שכונות חדשות מחוץ לחומות העיר העתיקה "
+    "כיום פועלים בעיר מוסדות להשכלה גבוהה , בתי חולים , מוזיאונים ופארקים רבים"
+).split()
+
+
+def _rng(title: str) -> random.Random:
+    return random.Random(int(hashlib.sha1(title.encode("utf-8")).hexdigest()[:16], 16))
+
+
+def _paragraph(rng: random.Random, refs: List[int]) -> str:
+    sentences = []
+    for _ in range(rng.randint(4, 9)):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(12, 30))]
+        sentence = " ".join(words)
+        if rng.random() < 0.3:
+            refs.append(len(refs) + 1)
+            sentence += (f'<sup class="mw-ref reference" typeof="mw:Extension/ref">'
+                         f'<a href="./ערך#cite_note-{len(refs)}">[{len(refs)}]</a></sup>')
+        sentences.append(sentence + ".")
+    links = " ".join(f'<a rel="mw:WikiLink" href="./{rng.choice(WORDS)}">{rng.choice(WORDS)}</a>'
+                     for _ in range(3))
+    return f"<p>{' '.join(sentences)} {links}</p>"
+
+
+def _figure(rng: random.Random, number: int) -> str:
+    image = rng.randint(1, 40)
+    return (f'<figure typeof="mw:File/Thumb"><a href="./קובץ:תמונה_{image}.png">'
+            f'<img src="/images/{image}.png" width="220" height="160" class="mw-file-element"/></a>'
+            f'<figcaption>איור {number}</figcaption></figure>')
+
+
+def generate_article(title: str) -> str:
+    """ערך בגודל ובמבנה של ערך אמיתי, זהה בכל הרצה עבור אותה כותרת"""
+    rng = _rng(title)
+    target = rng.randint(MIN_ARTICLE_BYTES, MAX_ARTICLE_BYTES)
+    refs: List[int] = []
+    rows = "".join(f"<tr><th>{rng.choice(WORDS)}</th><td>{rng.choice(WORDS)} {rng.randint(1, 9999)}</td></tr>"
+                   for _ in range(12))
+    parts = [
+        '<!DOCTYPE html>\n<html prefix="mw: http://mediawiki.org/rdf/" dir="rtl" lang="he">',
+        '<head><meta charset="utf-8"/><base href="/wiki/"/>',
+        '<link rel="stylesheet" href="/load.php?modules=site.styles"/>',
+        f'<title>{title}</title></head>',
+        '<body class="mw-content-rtl mw-parser-output" lang="he" dir="rtl">',
+        '<section data-mw-section-id="0">',
+        f'<table class="infobox"><caption>{title}</caption>{rows}</table>',
+        '<div class="ambox metadata">ערך זה זקוק לעריכה</div>',
+    ]
+    size = sum(len(part.encode("utf-8")) for part in parts)
+    section = 0
+    while size < target:
+        section += 1
+        chunk = [f'</section><section data-mw-section-id="{section}">',
+                 f'<h2 id="סעיף_{section}">סעיף {section} <span class="mw-editsection">[עריכה]</span></h2>']
+        for _ in range(rng.randint(2, 5)):
+            chunk.append(_paragraph(rng, refs))
+        if rng.random() < 0.5:
+            chunk.append(_figure(rng, section))
+        if rng.random() < 0.2:
+            chunk.append(f'<div style="display:none">{_paragraph(rng, [])}</div>')
+        text = "".join(chunk)
+        parts.append(text)
+        size += len(text.encode("utf-8"))
+    notes = "".join(f'<li id="cite_note-{ref}">מקור {ref}: {" ".join(rng.choice(WORDS) for _ in range(8))}</li>'
+                    for ref in refs)
+    links = " · ".join(f'<a href="./{rng.choice(WORDS)}">{rng.choice(WORDS)}</a>' for _ in range(40))
+    parts += [
+        '</section><section data-mw-section-id="-1">',
+        f'<ol class="mw-references references">{notes}</ol>',
+        f'<div class="navbox" role="navigation"><table><tr><td>{links}</td></tr></table></div>',
+        '<div class="catlinks">קטגוריות: ערים</div>',
+        '</section></body></html>',
+    ]
+    return "".join(parts)
+
+
+def fixture_path(title: str) -> str:
+    return os.path.join(FIXTURES_DIR, hashlib.sha1(title.encode("utf-8")).hexdigest()[:16] + ".html")
+
+
+def recorded_fixtures() -> List[str]:
+    """נתיבי הערכים שהוקלטו מהויקי, אם יש"""
+    if not os.path.isdir(FIXTURES_DIR):
+        return []
+    return sorted(os.path.join(FIXTURES_DIR, name) for name in os.listdir(FIXTURES_DIR) if name.endswith(".html"))
+
+
+def png_image(width: int = 220, height: int = 160, seed: int = 0) -> bytes:
+    """תמונת PNG תקינה בצבע אחיד, כדי שהרינדור יעבוד עם תמונות אמיתיות"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    color = bytes(((seed * 53) % 256, (seed * 97) % 256, (seed * 31) % 256))
+    raw = b"".join(b"\x00" + color * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 9))
+            + chunk(b"IEND", b""))
+
+
+def record(base_url: str, titles: List[str]) -> None:
+    """שמירת ה-HTML של ערכים אמיתיים מהויקי לתיקיית ה-fixtures"""
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    with httpx.Client(timeout=30, follow_redirects=True) as client:
+        for title in titles:
+            response = client.get(f"{base_url.rstrip('/')}/{quote(title)}/html")
+            response.raise_for_status()
+            with open(fixture_path(title), "w", encoding="utf-8") as f:
+                f.write(response.text)
+            print(f"{title}: {len(response.content)} bytes -> {fixture_path(title)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark fixtures")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="הקלטת ערכים אמיתיים מהויקי")
+    record_parser.add_argument("--base-url", required=True, help="כתובת הבסיס של ה-REST API")
+    record_parser.add_argument("titles", nargs="+")
+    args = parser.parse_args()
+    record(args.base_url, args.titles)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""בנצ'מרק מקצה לקצה של צנרת יצירת הספר, מול ויקי מקומי
+
+מפעיל את benchmarks.fake_wiki בתהליך נפרד, ולכל גודל ספר מריץ את convert_urls_to_pdfs
+בתהליך חדש עם תיקיות פלט, מטמון ואחסון משימות ריקות (כלומר הרצה קרה). לכל גודל נמדדים
+זמן כולל, זמן מצטבר לכל שלב (fetch, sanitize, assets, render, merge...), שיא צריכת הזיכרון
+וגודל הספר. התוצאה נשמרת כ-JSON עם ה-commit הנוכחי, להשוואה בין commits.
+
+הפעלה: python -m benchmarks.pipeline [--sizes 10,100,1000] [--latency-ms 50] [--compare results/old.json]
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+
+def isolated_env(work_dir: str) -> Dict[str, str]:
+    """משתני סביבה שמפנים את כל הקבצים של השרת לתיקיית העבודה של ההרצה"""
+    return {
+        "OUTPUT_PATH": os.path.join(work_dir, "output"),
+        "CHAPTER_CACHE_PATH": os.path.join(work_dir, "cache", "chapters"),
+        "HTML_CACHE_PATH": os.path.join(work_dir, "cache", "html"),
+        "ASSET_STORE_PATH": os.path.join(work_dir, "cache", "assets"),
+        "TASK_STORE_PATH": os.path.join(work_dir, "data", "tasks.db"),
+        "JOB_QUEUE_PATH": os.path.join(work_dir, "data", "queue"),
+        "JOB_QUEUE_ENABLED": "false",
+    }
+
+
+def peak_rss_mb(who: int) -> float:
+    # ru_maxrss בקילובייטים בלינוקס
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+def run_one(chapters: int, base_url: str, work_dir: str, render_mode: Optional[str]) -> Dict[str, Any]:
+    """הרצה אחת של הצנרת (בתהליך הנוכחי). הסביבה מוגדרת לפני טעינת האפליקציה"""
+    os.environ.update(isolated_env(work_dir))
+    from PyPDF2 import PdfReader
+    from app.config import RENDER_MODE
+    from app.pdf_generator import book_output_path, convert_urls_to_pdfs, task_status
+
+    task_id = uuid.uuid4().hex
+    book_title = "ספר בדיקה"
+    wiki_pages = [f"ערך_{index}" for index in range(chapters)]
+    task_status[task_id] = {"status": "processing", "message": "benchmark", "book_title": book_title}
+
+    started = time.perf_counter()
+    created = convert_urls_to_pdfs(task_id, wiki_pages, book_title=book_title, base_url=base_url,
+                                   render_mode=render_mode or RENDER_MODE)
+    wall = time.perf_counter() - started
+
+    record = task_status.get(task_id) or {}
+    path = book_output_path(task_id, book_title)
+    result = {
+        "chapters": chapters,
+        "created": created,
+        "wall_seconds": round(wall, 3),
+        "seconds_per_chapter": round(wall / chapters, 4) if chapters else None,
+        "stages": record.get("stage_timings", {}),
+        "failed_chapters": len(record.get("failed_chapters") or []),
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF),
+        # התהליך הגדול ביותר מבין תהליכי הרינדור שהסתיימו
+        "peak_child_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "output_bytes": None,
+        "output_pages": None,
+    }
+    if created and os.path.exists(path):
+        result["output_bytes"] = os.path.getsize(path)
+        result["output_pages"] = len(PdfReader(path).pages)
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_fake_wiki(port: int, latency_ms: float) -> subprocess.Popen:
+    """הפעלת הויקי המקומי בתהליך נפרד, כדי שלא ייכנס למדידות הזמן והזיכרון, והמתנה עד שהוא עונה"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_wiki", "--port", str(port), "--latency-ms", str(latency_ms)],
+        cwd=REPO_DIR, stdout=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/w/rest.php/v1/page/ping/bare", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Fake wiki did not start on port {port}")
+
+
+def run_size(chapters: int, base_url: str, render_mode: Optional[str], keep: bool) -> Dict[str, Any]:
+    """הרצת גודל אחד בתהליך חדש, כדי שהזיכרון והמטמונים לא יעברו בין הגדלים"""
+    work_dir = tempfile.mkdtemp(prefix=f"pipeline_bench_{chapters}_")
+    command = [sys.executable, "-m", "benchmarks.pipeline", "--run-one", str(chapters),
+               "--base-url", base_url, "--work-dir", work_dir]
+    if render_mode:
+        command += ["--render-mode", render_mode]
+    try:
+        completed = subprocess.run(command, cwd=REPO_DIR, stdout=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            return {"chapters": chapters, "error": f"exit code {completed.returncode}"}
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(results: List[Dict[str, Any]], previous_path: str) -> None:
+    """הדפסת השינוי בזמן הכולל ובכל שלב ביחס להרצה קודמת"""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {run["chapters"]: run for run in json.load(f)["runs"]}
+    for run in results:
+        old = previous.get(run["chapters"])
+        if not old or "wall_seconds" not in old or "wall_seconds" not in run:
+            continue
+        lines = [f"{run['chapters']} chapters: wall {old['wall_seconds']}s -> {run['wall_seconds']}s "
+                 f"({(run['wall_seconds'] - old['wall_seconds']) / old['wall_seconds']:+.1%})"]
+        for stage, timing in run["stages"].items():
+            old_seconds = old.get("stages", {}).get(stage, {}).get("seconds")
+            if old_seconds:
+                lines.append(f"  {stage}: {old_seconds}s -> {timing['seconds']}s "
+                             f"({(timing['seconds'] - old_seconds) / old_seconds:+.1%})")
+        print("\n".join(lines), file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark against a local wiki")
+    parser.add_argument("--sizes", default="10,100,1000", help="מספרי הפרקים, מופרדים בפסיקים")
+    parser.add_argument("--latency-ms", type=float, default=50, help="השהייה של הויקי המקומי לכל בקשה")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--render-mode", choices=["chapters", "single"], help="ברירת מחדל לפי הגדרות השרת")
+    parser.add_argument("--output", help="קובץ התוצאות (ברירת מחדל: benchmarks/results/pipeline-<commit>.json)")
+    parser.add_argument("--compare", help="קובץ תוצאות קודם להשוואה")
+    parser.add_argument("--keep", action="store_true", help="שמירת תיקיות העבודה (הספרים והמטמון) אחרי ההרצה")
+    # הרצה פנימית של גודל אחד, בתהליך שהמנהל מפעיל
+    parser.add_argument("--run-one", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        print(json.dumps(run_one(args.run_one, args.base_url, args.work_dir, args.render_mode)))
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    base_url = f"http://127.0.0.1:{args.port}/w/rest.php/v1/page"
+    fake_wiki = start_fake_wiki(args.port, args.latency_ms)
+    try:
+        runs = []
+        for size in sizes:
+            print(f"Running {size} chapters...", file=sys.stderr)
+            runs.append(run_size(size, base_url, args.render_mode, args.keep))
+    finally:
+        fake_wiki.terminate()
+        fake_wiki.wait()
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "latency_ms": args.latency_ms,
+        "cpu_count": os.cpu_count(),
+        "runs": runs,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Saved results to {output}", file=sys.stderr)
+    if args.compare:
+        compare(runs, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""מדידת התקורה הקבועה של רינדור פרק בכל מנוע רינדור
+
+מרנדר N פרקים קטנים ברצף ומדפיס JSON עם הזמן הממוצע לפרק. פרק קטן כמעט לא דורש
+עבודת פריסה, ולכן הזמן שלו הוא בעיקר התקורה הקבועה (הפעלת תהליך, טעינת מנוע וגופנים).
+"cold" הוא המסלול הקודם: pdfkit בלי הגדרות שמורות, שמחפש את wkhtmltopdf בכל פרק.
+
+הפעלה: python -m benchmarks.render_overhead [--chapters N] [--engines wkhtmltopdf,weasyprint]
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import pdfkit
+
+from app.pdf_generator import PAGE_PDFKIT_OPTIONS
+from app.services.renderers import RENDERERS, create_renderer
+from app.services.wkhtmltopdf import run_pdfkit
+
+CHAPTER_HTML = """<!DOCTYPE html>
+<html dir="rtl"><head><meta charset="UTF-8"></head>
+<body><h1>פרק {index}</h1><p>{text}</p></body></html>
+"""
+
+
+def chapter_html(index: int) -> str:
+    return CHAPTER_HTML.format(index=index, text="טקסט לדוגמה. " * 50)
+
+
+def measure(render: Callable[[str], bytes], chapters: int) -> Dict[str, float]:
+    """זמן הפרק הראשון (כולל חימום) והזמן הממוצע והחציוני של השאר, במילישניות"""
+    durations: List[float] = []
+    for index in range(chapters + 1):
+        started = time.perf_counter()
+        render(chapter_html(index))
+        durations.append((time.perf_counter() - started) * 1000)
+    steady = durations[1:]
+    return {
+        "first_ms": round(durations[0], 1),
+        "mean_ms": round(statistics.mean(steady), 1),
+        "median_ms": round(statistics.median(steady), 1),
+        "chapters": chapters,
+    }
+
+
+def render_cold(html: str) -> bytes:
+    return run_pdfkit(pdfkit.PDFKit(html, 'string', options=PAGE_PDFKIT_OPTIONS))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-chapter render overhead benchmark")
+    parser.add_argument("--chapters", type=int, default=20, help="מספר הפרקים לכל מנוע")
+    parser.add_argument("--engines", default=",".join(RENDERERS), help="רשימת מנועים מופרדת בפסיקים")
+    args = parser.parse_args()
+
+    results = {"cold": measure(render_cold, args.chapters)}
+    for engine in args.engines.split(","):
+        try:
+            renderer = create_renderer(engine)
+        except Exception as e:
+            results[engine] = {"error": str(e)}
+            continue
+        try:
+            results[engine] = measure(lambda html: renderer.render(html, PAGE_PDFKIT_OPTIONS), args.chapters)
+        finally:
+            renderer.close()
+
+    cold = results["cold"]["mean_ms"]
+    for engine, result in results.items():
+        if "mean_ms" in result and engine != "cold":
+            result["saved_per_chapter_ms"] = round(cold - result["mean_ms"], 1)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
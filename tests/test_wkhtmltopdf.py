@@ -0,0 +1,24 @@
+import shutil
+
+import pdfkit
+import pytest
+
+from app.services.wkhtmltopdf import pdfkit_configuration
+
+pytestmark = pytest.mark.skipif(shutil.which("wkhtmltopdf") is None, reason="wkhtmltopdf is not installed")
+
+
+def test_meta_options_in_page_are_ignored():
+    html = (
+        '<html><head>'
+        '<meta name="pdfkit-enable-local-file-access" content="">'
+        '<meta name="pdfkit-cookie-jar" content="/app/data/tasks.db">'
+        '</head><body>page</body></html>'
+    )
+    kit = pdfkit.PDFKit(html, 'string', options={'disable-javascript': None},
+                        configuration=pdfkit_configuration())
+    command = kit.command()
+    assert '--enable-local-file-access' not in command
+    assert '--cookie-jar' not in command
+    assert '/app/data/tasks.db' not in command
+    assert '--disable-javascript' in command